@@ -1,36 +1,69 @@
 import os
 from typing import Callable, Optional
 from dotenv import load_dotenv
-from Formats.pdf import gen_pdf
-from Formats.cbr import gen_cbr
-from Formats.cbz import gen_cbz
-from Formats.epub import gen_epub
-from Manga.Bato import Bato
-from Manga.Asurascans import Asura
-from Manga.Manhuaus import Manhuaus
-from Manga.Yakshascans import Yaksha
-from Manga.Weebcentral import Weeb
-from Manga.MangaDex import MangaDex
-from Manga.Mangahere import Mangahere
-from Manga.Mangapill import Mangapill
-from Manga.Kunmanga import Kunmanga
-from Manga.Toongod import Toongod
-from Manga.Toonily import Toonily
+from Formats.pdf import pdf_chapter, pack_pdfs, pdf_executor
+from Formats.cbr import cbr_chapter, pack_cbrs
+from Formats.cbz import cbz_chapter, pack_cbzs
+from Formats.epub import epub_chapter, pack_epub
+from Formats.pipeline import ChapterPipeline
+from Manga.registry import load_source
 import shutil
 
 load_dotenv()
 
 MANGAPI_URL = os.environ.get("MANGAPI_URL")
 
+FORMAT_NAMES = {"pdf": "PDF", "cbr": "CBR", "cbz": "CBZ", "epub": "ePUB"}
 
-def get_chapter_images(ids, source, progress_callback: Optional[Callable] = None,comic_title="Comic", comic_f="pdf"):
+
+def format_stage(comic_f, comic_title="Comic"):
+    """
+    Returns the two steps of an output format.
+
+    Args:
+        comic_f: Output format (pdf, cbz, cbr, epub), anything else falls back to pdf
+        comic_title: Title of the comic
+
+    Returns:
+        tuple: `convert(ch_path, index)` turning one downloaded chapter into its part of the
+               archive, and `pack(path, results)` assembling the parts into the final file.
+    """
+    match comic_f:
+        case "cbr":
+            return (lambda ch_path, i: cbr_chapter(ch_path, os.path.dirname(ch_path)), pack_cbrs)
+        case "cbz":
+            return (
+                lambda ch_path, i: cbz_chapter(ch_path, os.path.dirname(ch_path), i + 1, comic_title),
+                pack_cbzs
+            )
+        case "epub":
+            return (
+                lambda ch_path, i: epub_chapter(ch_path),
+                lambda path, chapters: pack_epub(path, chapters, comic_title)
+            )
+        case _:
+            # PDFs are converted on a process pool, the pipeline only collects the futures
+            return (
+                lambda ch_path, i: pdf_executor().submit(pdf_chapter, ch_path, os.path.dirname(ch_path)),
+                lambda path, futures: pack_pdfs(path, [future.result() for future in futures])
+            )
+
+
+def get_chapter_images(ids, source, progress_callback: Optional[Callable] = None,comic_title="Comic", comic_f="pdf",
+                       quality="data"):
     """
     Download chapter images and generate PDF/ZIP files.
+
+    Each chapter is handed to the format stage as soon as its images are on disk, so
+    converting one chapter overlaps with downloading the next one.
     
     Args:
         ids: List of chapter IDs
         source: Source number
         progress_callback: Callback function for progress updates (optional)
+        comic_title: Title of the comic
+        comic_f: Output format (pdf, cbz, cbr, epub)
+        quality: Image quality (data, data-saver), for sources with the "data-saver" capability
     """
     try:
         source = int(source)
@@ -46,72 +79,62 @@ def get_chapter_images(ids, source, progress_callback: Optional[Callable] = None
             progress_callback(progress, status)
     
     update_progress(0, "Starting download...")
-    
-    match source:
-        case 0:  # MangaDex
-            path =  MangaDex.download_chapters(ids, update_progress)
-
-        case 1:  # Manhuaus
-            path =  Manhuaus.download_chapters(ids, update_progress)
-        
-        case 2:  # Yakshascans
-            path =  Yaksha.download_chapters(ids, update_progress)
-        
-        case 3:  # Asurascan
-            path =  Asura.download_chapters(ids, update_progress)
-
-        case 4:  # Kunmanga
-            path =  Kunmanga.download_chapters(ids, update_progress)
-
-        case 5:  # Toonily
-            path =  Toonily.download_chapters(ids, update_progress)
-
-        case 6:  # Toongod
-            path = Toongod.download_chapters(ids, update_progress)
-
-        case 7:  # Mangahere
-            path =  Mangahere.download_chapters(ids, update_progress)
-        
-        case 8:  # Mangapill
-            path =  Mangapill.download_chapters(ids, update_progress)
-        
-        case 9:  # Bato
-            path =  Bato.download_chapters(ids, update_progress)
-            
-        case 10:  # Weebcentral
-            path =  Weeb.download_chapters(ids, update_progress)
 
-        case _:
-            raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
+    convert, pack = format_stage(comic_f, comic_title)
+    format_name = FORMAT_NAMES.get(comic_f, "PDF")
+    pipeline = ChapterPipeline(convert)
     
-    match comic_f:
-        case "pdf":
-            try:
-                return gen_pdf(path, update_progress=update_progress)
-            except Exception as e:
-                shutil.rmtree(path, ignore_errors=True)
-                raise Exception(f"Failed to generate PDF: {e}")
-        case "cbr":
-            try:
-                return gen_cbr(path)
-            except Exception as e:
-                shutil.rmtree(path, ignore_errors=True)
-                raise Exception(f"Failed to generate CBR: {e}")
-        case "cbz":
-            try:
-                return gen_cbz(path, update_progress=update_progress, comic_title=comic_title)
-            except Exception as e:
-                shutil.rmtree(path, ignore_errors=True)
-                raise Exception(f"Failed to generate CBZ: {e}")
-        case "epub":
-            try:
-                return gen_epub(path,update_progress=update_progress, comic_title=comic_title)
-            except Exception as e:
-                shutil.rmtree(path, ignore_errors=True)
-                raise Exception(f"Failed to generate ePUB: {e}")
-        case _:
-            try:
-                return gen_pdf(path, update_progress=update_progress)
-            except Exception as e:
-                shutil.rmtree(path, ignore_errors=True)
-                raise Exception(f"Failed to generate PDF: {e}")
+    try:
+        path = download_chapters(source, ids, update_progress, pipeline.submit, quality)
+    except Exception:
+        try:
+            pipeline.close()
+        except Exception:
+            pass
+        raise
+
+    try:
+        update_progress(total_chapters, f"Creating {format_name}...")
+        return pack(path, pipeline.close())
+    except Exception as e:
+        shutil.rmtree(path, ignore_errors=True)
+        raise Exception(f"Failed to generate {format_name}: {e}")
+
+
+def package_chapters(path, ch_paths, comic_f="pdf", comic_title="Comic"):
+    """
+    Generates the archive from chapters that are already on disk.
+
+    Args:
+        path: Path to the job directory
+        ch_paths: Chapter directories, in archive order
+        comic_f: Output format (pdf, cbz, cbr, epub)
+        comic_title: Title of the comic
+
+    Returns:
+        str: Path to the generated file.
+    """
+    convert, pack = format_stage(comic_f, comic_title)
+    format_name = FORMAT_NAMES.get(comic_f, "PDF")
+    try:
+        results = [convert(ch_path, i) for i, ch_path in enumerate(ch_paths)]
+        return pack(path, [result for result in results if result is not None])
+    except Exception as e:
+        shutil.rmtree(path, ignore_errors=True)
+        raise Exception(f"Failed to generate {format_name}: {e}")
+
+
+def download_chapters(source, ids, update_progress=None, on_chapter=None, quality="data"):
+    """
+    Runs `download_chapters` of the given source and returns the download directory.
+
+    Args:
+        source: Source number
+        ids: List of chapter IDs
+        update_progress: Callback function for progress updates (optional)
+        on_chapter: Called with every chapter directory once its images are downloaded (optional)
+        quality: Image quality (data, data-saver), only passed on to sources with the "data-saver" capability
+    """
+    if quality and quality != "data":
+        return load_source(source, "data-saver").download_chapters(ids, update_progress, on_chapter, quality=quality)
+    return load_source(source, "download").download_chapters(ids, update_progress, on_chapter)
@@ -1,8 +1,65 @@
 import os
 import shutil
-import re
+from Formats.image_probe import chapter_images
 import subprocess
 
+
+def cbr_chapter(chapter_path, path):
+    """
+    Packs a single chapter directory into a CBR file and removes the directory afterwards.
+
+    Args:
+        chapter_path (str): Path to the chapter directory with the downloaded images.
+        path (str): Path to the target directory where the CBR is written.
+
+    Returns:
+        Optional[str]: Path to the generated CBR file, or None if `rar` failed for this chapter.
+    """
+    chapter_name = os.path.basename(chapter_path)
+    cbr_name = f"Chapter {chapter_name}.cbr"
+    cbr_path = os.path.join(path, cbr_name)
+
+    image_names = [os.path.basename(f) for f in chapter_images(chapter_path)]
+
+    try:
+        subprocess.run(
+            ["rar", "a", "-ep1", "temp.rar"] + image_names,
+            cwd=chapter_path,
+            check=True
+        )
+
+        shutil.move(os.path.join(chapter_path, "temp.rar"), cbr_path)
+        shutil.rmtree(chapter_path)
+        return cbr_path
+
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to create CBR for {chapter_name}: {e}")
+        return None
+
+
+def pack_cbrs(path, cbr_files):
+    """
+    Packs the chapter CBR files into a single RAR archive (Chapters.rar) and removes them.
+
+    Args:
+        path (str): Path to the target directory.
+        cbr_files (list of str): Paths to the chapter CBR files, in archive order.
+
+    Returns:
+        str: Path to the generated Chapters.rar file.
+    """
+    subprocess.run(
+        ["rar", "a", "-ep1", "Chapters.rar"] + [os.path.basename(cbr) for cbr in cbr_files],
+        cwd=path,
+        check=True
+    )
+
+    for cbr in cbr_files:
+        os.remove(cbr)
+
+    return f"{path}/Chapters.rar"
+
+
 def gen_cbr(path, update_progress=None, comic_title="Comic"):
     """
     Generates CBR files for each chapter and packs them into a single RAR archive (Chapters.rar).
@@ -24,42 +81,15 @@ def gen_cbr(path, update_progress=None, comic_title="Comic"):
 
         for i, chapter_path in enumerate(chapter_dirs):
             chapter_name = os.path.basename(chapter_path)
-            cbr_name = f"Chapter {chapter_name}.cbr"
-            cbr_path = os.path.join(path, cbr_name)
 
             if update_progress:
                 update_progress(i + 1, f"Processing chapter {chapter_name}...")
 
-            image_files = sorted(
-                [f for f in os.scandir(chapter_path) if f.is_file()],
-                key=lambda f: int(re.search(r"(\d+)", f.name).group())
-            )
-            image_names = [f.name for f in image_files]
-
-            try:
-                subprocess.run(
-                    ["rar", "a", "-ep1", "temp.rar"] + image_names,
-                    cwd=chapter_path,
-                    check=True
-                )
-
-                shutil.move(os.path.join(chapter_path, "temp.rar"), cbr_path)
+            cbr_path = cbr_chapter(chapter_path, path)
+            if cbr_path:
                 cbr_files.append(cbr_path)
-                shutil.rmtree(chapter_path)
-
-            except subprocess.CalledProcessError as e:
-                print(f"Failed to create CBR for {chapter_name}: {e}")
-
-        subprocess.run(
-            ["rar", "a", "-ep1", "Chapters.rar"] + [os.path.basename(cbr) for cbr in cbr_files],
-            cwd=path,
-            check=True
-        )
-
-        for cbr in cbr_files:
-            os.remove(cbr)
 
-        return f"{path}/Chapters.rar"
+        return pack_cbrs(path, cbr_files)
 
     except Exception as e:
         raise RuntimeError(f"Error generating CBRs: {e}")
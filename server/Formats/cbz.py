@@ -2,11 +2,72 @@ from pathlib import Path
 from zipfile import ZipFile
 import os
 import shutil
-import re
+from Formats.image_probe import chapter_images
 from cbz.comic import ComicInfo
 from cbz.constants import PageType, YesNo, Manga, AgeRating, Format
 from cbz.page import PageInfo
 
+
+def cbz_chapter(chapter, path, number, comic_title="Comic"):
+    """
+    Packs a single chapter directory into a CBZ file and removes the directory afterwards.
+
+    Args:
+        chapter (str): Path to the chapter directory with the downloaded images.
+        path (str): Path to the target directory where the CBZ is written.
+        number (int): Position of the chapter in the comic, starting at 1.
+        comic_title (str): Title of the comic series.
+
+    Returns:
+        Path: Path to the generated CBZ file.
+    """
+    chap_num = os.path.basename(chapter)
+    images = chapter_images(chapter)
+    pages = [
+        PageInfo.load(
+            path=img_path,
+            type=PageType.FRONT_COVER if i == 0 else PageType.BACK_COVER if i == len(images) - 1 else PageType.STORY,
+        )
+        for i, img_path in enumerate(images)
+    ]
+
+    comic = ComicInfo(
+        pages=pages,
+        title="Chapter " + chap_num,
+        serites=comic_title,
+        manga=Manga.NO,
+        number=number,
+        language_iso="en",
+        format=Format.WEB_COMIC,
+        black_and_white=YesNo.NO,
+        age_rating=AgeRating.UNKNOWN,
+    )
+
+    cbz_content = comic.pack()
+    cbz_path = Path(path) / f"Chapter {chap_num}.cbz"
+    cbz_path.write_bytes(cbz_content)
+    shutil.rmtree(chapter,ignore_errors=True)
+    return cbz_path
+
+
+def pack_cbzs(path, chapters):
+    """
+    Packs the chapter CBZ files into a single ZIP archive (Chapters.zip) and removes them.
+
+    Args:
+        path (str): Path to the target directory.
+        chapters (list of Path): Paths to the chapter CBZ files, in archive order.
+
+    Returns:
+        str: Path to the generated ZIP archive.
+    """
+    with ZipFile(f"{path}/Chapters.zip", 'w') as zipf:
+        for cbz in chapters:
+            zipf.write(cbz, os.path.basename(cbz))
+            os.remove(cbz)
+    return f"{path}/Chapters.zip"
+
+
 def gen_cbz(path, update_progress=None, comic_title="Comic"):
     """
     Generates a CBZ files for a manga based on the downloaded images.
@@ -30,42 +91,8 @@ def gen_cbz(path, update_progress=None, comic_title="Comic"):
             chap_num = os.path.basename(chapter)
             if update_progress:
                 update_progress(total_chapters, f"Processing chapter {chap_num}...")
-            images = sorted([img.path for img in os.scandir(chapter) if img.is_file()],key=lambda p: int(re.search(r"(\d+)", os.path.basename(p)).group()))
-            pages = [
-                PageInfo.load(
-                    path=img_path,
-                    type=PageType.FRONT_COVER if i == 0 else PageType.BACK_COVER if i == len(images) - 1 else PageType.STORY,
-                )
-                for i, img_path in enumerate(images)
-            ]
-
-            comic = ComicInfo(
-                pages=pages,
-                title="Chapter " + chap_num,
-                serites=comic_title,
-                manga=Manga.NO,
-                number=i+1,
-                language_iso="en",
-                format=Format.WEB_COMIC,
-                black_and_white=YesNo.NO,
-                age_rating=AgeRating.UNKNOWN,
-            )
-
-            cbz_content = comic.pack()
-            cbz_path = Path(path) / f"Chapter {chap_num}.cbz"
-            chapters.append(cbz_path)
-            cbz_path.write_bytes(cbz_content)
-            shutil.rmtree(chapter,ignore_errors=True)
-
-
-        with ZipFile(f"{path}/Chapters.zip", 'w') as zipf:
-            for cbz in chapters:
-                zipf.write(cbz, os.path.basename(cbz))
-                os.remove(cbz)
+            chapters.append(cbz_chapter(chapter, path, i + 1, comic_title))
+
+        return pack_cbzs(path, chapters)
     except Exception as e:
         raise e
-
-
-    return f"{path}/Chapters.zip"
-    
-    
\ No newline at end of file
@@ -3,10 +3,98 @@ import os
 from ebooklib import epub
 from random import randint
 import re
+from Formats.image_probe import chapter_images
 
 
 
 
+def epub_chapter(chapter):
+    """
+    Reads the images of a single chapter directory so they can be added to the ePUB later.
+
+    Args:
+        chapter (str): Path to the chapter directory with the downloaded images.
+
+    Returns:
+        tuple: The chapter name and a list of (extension, content) pairs, in page order.
+    """
+    pages = []
+    for img_path in chapter_images(chapter):
+        ext = os.path.splitext(img_path)[1].lower()
+        with open(img_path, "rb") as f:
+            pages.append((ext, f.read()))
+
+    return os.path.basename(chapter), pages
+
+
+def pack_epub(path, chapters, comic_title="Comic"):
+    """
+    Writes the chapters read by `epub_chapter` into a single ePUB file.
+
+    Args:
+        path (str): Path to the target directory.
+        chapters (list of tuple): Chapters as returned by `epub_chapter`.
+        comic_title (str): Title of the comic, also used as the file name.
+
+    Returns:
+        str: Path to the generated ePUB file.
+    """
+    book = epub.EpubBook()
+    book.set_identifier(f"id{randint(100000, 999999)}")
+    book.set_title(comic_title)
+    book.set_language("en")
+
+    chapters = sorted(chapters, key=lambda c: float(re.findall(r"[\d.]+", c[0])[0]))
+    spine = ["nav"]
+    toc = []
+
+    image_counter = 1  # to make image filenames unique
+
+    for i, (chapter_name, pages) in enumerate(chapters, 1):
+        chapter_title = f"Chapter {chapter_name}"
+        file_name = f"chap_{i:02}.xhtml"
+
+        html = f"<h1>{chapter_title}</h1>"
+
+        for ext, img_content in pages:
+            mime = "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png"
+            img_uid = f"image_{image_counter}"
+            img_filename = f"images/{img_uid}{ext}"
+
+            epub_img = epub.EpubImage(
+                uid=img_uid,
+                file_name=img_filename,
+                media_type=mime,
+                content=img_content,
+            )
+            book.add_item(epub_img)
+            html += f'<p><img src="{img_filename}" alt="Page {image_counter}"/></p>'
+
+            image_counter += 1
+
+        chap = epub.EpubHtml(title=chapter_title, file_name=file_name, lang="en")
+        chap.content = html
+
+        book.add_item(chap)
+        spine.append(chap)
+        toc.append(chap)
+
+    # Add nav, TOC, and minimal CSS
+    book.toc = toc
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.add_item(epub.EpubItem(
+        uid="style_nav",
+        file_name="style/nav.css",
+        media_type="text/css",
+        content="body { text-align: center; } img { max-width: 100%; height: auto; }"
+    ))
+
+    book.spine = spine
+    epub.write_epub(f'{path}/{comic_title}.epub', book)
+    return f'{path}/{comic_title}.epub'
+
+
 def gen_epub(path, update_progress, referer=None, comic_title="Comic"):
     """
     Generates a ePUB file for a manga based on the downloaded images.
@@ -19,77 +107,15 @@ def gen_epub(path, update_progress, referer=None, comic_title="Comic"):
         str: Path to the generated ePUB file.
     """
     try:
-        book = epub.EpubBook()
-        book.set_identifier(f"id{randint(100000, 999999)}")
-        book.set_title(comic_title)
-        book.set_language("en")
-
-        chapter_dirs = sorted(
-            [d for d in os.scandir(path) if d.is_dir()],
-            key=lambda e: float(re.findall(r"[\d.]+", e.name)[0])
-        )
+        chapter_dirs = [d.path for d in os.scandir(path) if d.is_dir()]
         total_chapters = len(chapter_dirs)
-        spine = ["nav"]
-        toc = []
 
-        image_counter = 1  # to make image filenames unique
-        
         if update_progress:
                 update_progress(total_chapters, f"Creating ePUB...")
 
-        for i, chapter in enumerate(chapter_dirs, 1):
-            chapter_title = f"Chapter {chapter.name}"
-            file_name = f"chap_{i:02}.xhtml"
-
-            images = sorted(
-                [f for f in os.scandir(chapter.path) if f.is_file()],
-                key=lambda f: int(re.findall(r"\d+", f.name)[0])
-            )
-
-            html = f"<h1>{chapter_title}</h1>"
-
-            for img in images:
-                ext = os.path.splitext(img.name)[1].lower()
-                mime = "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png"
-                img_uid = f"image_{image_counter}"
-                img_filename = f"images/{img_uid}{ext}"
-
-                with open(img.path, "rb") as f:
-                    img_content = f.read()
-
-                epub_img = epub.EpubImage(
-                    uid=img_uid,
-                    file_name=img_filename,
-                    media_type=mime,
-                    content=img_content,
-                )
-                book.add_item(epub_img)
-                html += f'<p><img src="{img_filename}" alt="Page {image_counter}"/></p>'
-
-                image_counter += 1
-
-            chap = epub.EpubHtml(title=chapter_title, file_name=file_name, lang="en")
-            chap.content = html
-
-            book.add_item(chap)
-            spine.append(chap)
-            toc.append(chap)
-
-        # Add nav, TOC, and minimal CSS
-        book.toc = toc
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
-        book.add_item(epub.EpubItem(
-            uid="style_nav",
-            file_name="style/nav.css",
-            media_type="text/css",
-            content="body { text-align: center; } img { max-width: 100%; height: auto; }"
-        ))
-
-        book.spine = spine
-        epub.write_epub(f'{path}/{comic_title}.epub', book)
-        return f'{path}/{comic_title}.epub'
+        chapters = [epub_chapter(chapter) for chapter in chapter_dirs]
+        return pack_epub(path, chapters, comic_title)
     
     except Exception as e:
         shutil.rmtree(path, ignore_errors=True)
-        raise e
\ No newline at end of file
+        raise e
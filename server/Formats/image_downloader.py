@@ -1,10 +1,179 @@
 import requests as req
+from Utils.http_session import http_get
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from PIL import Image
-from Utils.bot_evasion import get_cookies
+from Utils.bot_evasion import ensure_cf_cookies, load_cf_user_agent
+from Formats.image_probe import PROBE_BYTES, probe_image, probe_file, is_valid_size, write_manifest
+from Utils.chapter_cache import store_chapter
+from Utils.retry import retry_delay, should_retry
+import hashlib
 
-def download_chapter_images(images, chap_num, path, referer=None):
+# Number of pages fetched at once for a single chapter
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 8))
+# Upper bound of simultaneous requests to a single image host (shared by all chapters in this process)
+IMAGE_MAX_PER_HOST = int(os.getenv("IMAGE_MAX_PER_HOST", 6))
+# Pages larger than this are treated as corrupted
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 50 * 1024 * 1024))
+# Size of the chunks streamed from the response to disk
+CHUNK_SIZE = 64 * 1024
+
+CORRUPT_IMAGE = os.path.join(os.path.dirname(__file__), "corrupt.jpg")
+CORRUPT_INFO = probe_file(CORRUPT_IMAGE)
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def _host_semaphore(url, limit):
+    """
+    Returns the semaphore that caps parallel requests to the host of `url`.
+    """
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(limit)
+        return _host_limits[host]
+
+
+class ImageTooLarge(Exception):
+    """Raised when a page exceeds `MAX_IMAGE_BYTES`."""
+
+
+def _stream_to_file(response, part_path):
+    """
+    Writes a streamed response to `part_path` in bounded chunks.
+
+    Returns:
+        tuple: The first `PROBE_BYTES` of the body, used to validate the page, and the SHA-256 of the body.
+
+    Raises:
+        ImageTooLarge: If the body is larger than `MAX_IMAGE_BYTES`.
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"{content_length} bytes exceeds MAX_IMAGE_BYTES")
+
+    head = bytearray()
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            written += len(chunk)
+            if written > MAX_IMAGE_BYTES:
+                raise ImageTooLarge(f"more than {MAX_IMAGE_BYTES} bytes")
+            if len(head) < PROBE_BYTES:
+                head += chunk[:PROBE_BYTES - len(head)]
+            digest.update(chunk)
+            f.write(chunk)
+    return bytes(head), digest.hexdigest()
+
+
+def _download_image(i, img, ch_path, referer, cf_url, cookies_dict, max_per_host):
+    """
+    Downloads a single page and returns its manifest entry, or None if it should be skipped.
+
+    The body is streamed into a `.part` file which is renamed once the page is complete
+    and validated from its header bytes. Bodies cut off by the connection or unreadable as
+    an image are fetched again while `Utils.retry` allows it, errors before the body are
+    retried by `http_get`. Pages that still fail or are oversized are replaced with
+    `corrupt.jpg`, so the page numbering stays intact. For Cloudflare sources (`cf_url`),
+    a 403 refreshes the cookies and the page is requested once more.
+    """
+    if referer:
+        headers = {'Referer': img[1]}
+        img_url = img[0]
+    else:
+        img_url = img
+        headers = {}
+
+    extension = img_url.split(".")[-1].split("?")[0]
+    part_path = os.path.join(ch_path, f"{i}.{extension}.part")
+    info = None
+    digest = None
+    if cf_url:
+        user_agent = load_cf_user_agent(cf_url)
+        if user_agent:
+            headers["User-Agent"] = user_agent
+    try:
+        cf_refreshed = False
+        retries = 0
+        while True:
+            streaming = False
+            try:
+                with _host_semaphore(img_url, max_per_host):
+                    with http_get(
+                        img_url,
+                        headers=headers if headers else None,
+                        cookies=cookies_dict if cookies_dict else None,
+                        timeout=10,
+                        stream=True
+                    ) as response:
+                        if not (response.status_code == 403 and cf_url and not cf_refreshed):
+                            response.raise_for_status()
+                            streaming = True
+                            head, digest = _stream_to_file(response, part_path)
+                            info = probe_image(head)
+                            if info or not should_retry(img_url, retries):
+                                break
+                            print(f"Page {i} of {ch_path} is not a valid image, fetching it again")
+            except req.RequestException:
+                if not streaming or not should_retry(img_url, retries):
+                    raise
+                print(f"Page {i} of {ch_path} was cut off, fetching it again")
+            if streaming:
+                time.sleep(retry_delay(retries))
+                retries += 1
+                continue
+            # Cloudflare rejected the cookies, get new ones (once for all pages) and try again
+            cf_refreshed = True
+            try:
+                cookies_dict = ensure_cf_cookies(cf_url, rejected=cookies_dict)
+            except Exception as e:
+                raise req.RequestException(f"403, new Cloudflare cookies could not be harvested: {e}")
+            user_agent = load_cf_user_agent(cf_url)
+            if user_agent:
+                headers["User-Agent"] = user_agent
+    except (req.RequestException, ImageTooLarge) as e:
+        print(f"Page {i} of {ch_path} replaced with corrupt.jpg: {e}")
+
+    if not info:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        file_name = f"{i}.jpg"
+        shutil.copy(CORRUPT_IMAGE, os.path.join(ch_path, file_name))
+        fmt, width, height = CORRUPT_INFO
+        return {"file": file_name, "format": fmt, "width": width, "height": height, "corrupt": True}
+
+    fmt, width, height = info
+    if not is_valid_size(width, height):
+        os.remove(part_path)
+        return None
+
+    if fmt == "webp":
+        try:
+            file_name = f"{i}.{extension}.jpg"
+            jpg_part = os.path.join(ch_path, f"{file_name}.part")
+            with Image.open(part_path) as im:
+                im.convert("RGB").save(jpg_part, "JPEG")
+            os.replace(jpg_part, os.path.join(ch_path, file_name))
+            os.remove(part_path)
+            fmt = "jpeg"
+            digest = None
+        except Exception as e:
+            raise Exception(f"Failed to convert WEBP to JPEG: {e}")
+    else:
+        file_name = f"{i}.{extension}"
+        os.replace(part_path, os.path.join(ch_path, file_name))
+
+    return {"file": file_name, "format": fmt, "width": width, "height": height, "hash": digest}
+
+
+def download_chapter_images(images, chap_num, path, referer=None, max_workers=None, max_per_host=None, cache_key=None):
     """
     Downloads a list of chapter images to a local directory, handling possible corruption and format conversion.
 
@@ -14,84 +183,62 @@ def download_chapter_images(images, chap_num, path, referer=None):
         chap_num (str or int): The chapter number or identifier, used to name the subdirectory.
         path (str): The base directory where chapter images will be saved.
         referer (bool, optional): Whether to use referer headers for requests. If True, expects tuples in `images`.
+        max_workers (int, optional): Number of pages fetched concurrently. Defaults to `IMAGE_WORKERS`,
+                                     1 downloads the pages one after another.
+        max_per_host (int, optional): Cap of simultaneous requests to one host. Defaults to `IMAGE_MAX_PER_HOST`.
+        cache_key (tuple, optional): (source, chapter id) under which the finished chapter is added to
+                                     the chapter cache, see `Utils.chapter_cache`.
 
     Returns:
         tuple:
-            - image_paths (list of str): Paths to successfully downloaded and verified image files.
+            - image_paths (list of str): Paths to successfully downloaded and verified image files, in page order.
             - ch_path (str): Path to the directory containing downloaded images.
 
     Raises:
         Exception: If a critical error occurs during download, conversion, or file operations.
-    
+
     Notes:
-        - Converts `.webp` images to `.jpg` format and removes the original `.webp` files.
-        - Skips corrupted images or images smaller than 72x72 pixels.
+        - Pages are saved as `{i}.{ext}` regardless of the order in which the downloads finish.
+        - Pages are streamed to disk in `CHUNK_SIZE` chunks, so memory use doesn't grow with page size.
+        - Dimensions and format are read from the downloaded header bytes and recorded in the
+          chapter manifest (`manifest.json`), which the format generators trust.
+        - Converts `.webp` images to `.jpg` format, the original `.webp` files are never written.
+        - Replaces corrupted images and images over `MAX_IMAGE_BYTES` with `corrupt.jpg`, and skips
+          images smaller than 72x72 pixels.
         - In case of a total failure, the created chapter directory is deleted.
     """
-    
-    image_paths = []
+
     ch_path = os.path.join(path, str(chap_num))
     os.makedirs(ch_path, exist_ok=True)
 
+    cf_url = None
     cookies_dict = None
 
-    # Check if source is Toongod
+    # Cloudflare sources, the cookies saved in Redis are reused across chapters and workers
     first_url = images[0][0] if referer else images[0]
     if "toongod" in first_url:
-        cookies_dict = get_cookies("https://www.toongod.org/?s=&post_type=wp-manga")
+        cf_url = "https://www.toongod.org/?s=&post_type=wp-manga"
     elif "toonily" in first_url:
-        cookies_dict = get_cookies("toonily.com")
+        cf_url = "https://toonily.com"
+    if cf_url:
+        cookies_dict = ensure_cf_cookies(cf_url)
+
+    max_workers = max_workers or IMAGE_WORKERS
+    max_per_host = max_per_host or IMAGE_MAX_PER_HOST
 
     try:
-        for i, img in enumerate(images):
-            is_corrupted = False
-            try:
-                if referer:
-                    headers = {'Referer': img[1]}
-                    img_url = img[0]
-                else:
-                    img_url = img
-                    headers = {}
-                response = req.get(
-                    img_url,
-                    headers=headers if headers else None,
-                    cookies=cookies_dict if cookies_dict else None,
-                    timeout=10
-                )
-                response.raise_for_status()
-                img_data = response.content
-            except req.RequestException:
-                is_corrupted = True
-
-            if not is_corrupted:
-                extension = img_url.split(".")[-1].split("?")[0]
-                img_path = os.path.join(ch_path, f"{i}.{extension}")
-                with open(img_path, "wb") as f:
-                    f.write(img_data)
-            else:
-                extension = "jpg"
-                img_path = os.path.join(os.path.dirname(__file__), "corrupt.jpg")
-                shutil.copy(img_path, f"{ch_path}/{i}.{extension}")
-
-            if extension.lower() == "webp":
-                try:
-                    im = Image.open(img_path).convert("RGB")
-                    jpg_path = f"{img_path}.jpg"
-                    im.save(jpg_path, "JPEG")
-                    os.remove(img_path)
-                    with Image.open(jpg_path) as img:
-                        if img.size[0] < 72 or img.size[1] < 72:
-                            continue
-                    image_paths.append(jpg_path)
-                except Exception as e:
-                    raise Exception(f"Failed to convert WEBP to JPEG: {e}")
-            else:
-                with Image.open(img_path) as img:
-                    if img.size[0] < 72 or img.size[1] < 72:
-                        continue
-                image_paths.append(img_path)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as executor:
+            futures = [
+                executor.submit(_download_image, i, img, ch_path, referer, cf_url, cookies_dict, max_per_host)
+                for i, img in enumerate(images)
+            ]
+            pages = [page for page in (future.result() for future in futures) if page]
 
+        write_manifest(ch_path, pages)
+        if cache_key:
+            store_chapter(*cache_key, ch_path)
+        image_paths = [os.path.join(ch_path, page["file"]) for page in pages]
         return image_paths, ch_path
     except Exception as e:
         shutil.rmtree(ch_path, ignore_errors=True)
-        raise e
\ No newline at end of file
+        raise e
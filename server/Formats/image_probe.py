@@ -0,0 +1,153 @@
+import io
+import json
+import os
+import re
+import struct
+from typing import List, Optional, Tuple
+from PIL import Image
+
+# Pages smaller than this (in either dimension) are treated as spacers or ads and skipped
+MIN_SIZE = 72
+# Bytes of a page kept in memory for probing, enough for the header of every supported format
+PROBE_BYTES = 64 * 1024
+MANIFEST_NAME = "manifest.json"
+
+
+def _probe_jpeg(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _probe_webp(data: bytes) -> Optional[Tuple[int, int]]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def probe_image(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Reads the format and dimensions of an image from its leading bytes, without decoding it.
+
+    Args:
+        data (bytes): The beginning of the image file, `PROBE_BYTES` is enough for common files.
+
+    Returns:
+        tuple: (format, width, height) with a lowercase format such as "jpeg", "png", "gif" or "webp",
+               or None if the bytes are not a readable image.
+    """
+    size = None
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        fmt, size = "png", struct.unpack(">II", data[16:24])
+    elif data[:3] == b"\xff\xd8\xff":
+        fmt, size = "jpeg", _probe_jpeg(data)
+    elif data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        fmt, size = "gif", struct.unpack("<HH", data[6:10])
+    elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        fmt, size = "webp", _probe_webp(data)
+
+    if size:
+        return fmt, size[0], size[1]
+
+    # Unusual layouts (or formats) are left to PIL, which only parses the header on open
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return im.format.lower(), im.size[0], im.size[1]
+    except Exception:
+        return None
+
+
+def probe_file(path: str) -> Optional[Tuple[str, int, int]]:
+    """
+    Same as `probe_image`, reading only the header of a file on disk.
+    """
+    with open(path, "rb") as f:
+        return probe_image(f.read(PROBE_BYTES))
+
+
+def is_valid_size(width: int, height: int) -> bool:
+    """
+    Whether a page is large enough to be kept in the chapter.
+    """
+    return width >= MIN_SIZE and height >= MIN_SIZE
+
+
+def write_manifest(ch_path: str, pages: List[dict]) -> None:
+    """
+    Records the validated pages of a chapter, so format generators don't have to reopen them.
+
+    Args:
+        ch_path (str): Path to the chapter directory.
+        pages (list of dict): Valid pages in reading order, each with `file`, `format`, `width` and `height`.
+    """
+    with open(os.path.join(ch_path, MANIFEST_NAME), "w") as f:
+        json.dump({"pages": pages}, f)
+
+
+def read_manifest(ch_path: str) -> Optional[List[dict]]:
+    """
+    Returns the pages recorded by `write_manifest`, or None if the chapter has no manifest.
+    """
+    try:
+        with open(os.path.join(ch_path, MANIFEST_NAME)) as f:
+            return json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def chapter_images(ch_path: str) -> List[str]:
+    """
+    Lists the valid page images of a chapter directory in reading order.
+
+    The manifest written during the download is trusted as is. Directories without a
+    manifest are scanned and every page is validated from its header.
+
+    Args:
+        ch_path (str): Path to the chapter directory.
+
+    Returns:
+        list of str: Paths to the page images.
+    """
+    pages = read_manifest(ch_path)
+    if pages is not None:
+        return [os.path.join(ch_path, page["file"]) for page in pages]
+
+    image_paths = sorted(
+        [
+            img.path for img in os.scandir(ch_path)
+            if img.is_file() and re.match(r"\d+", img.name) and not img.name.endswith(".part")
+        ],
+        key=lambda p: int(re.search(r"(\d+)", os.path.basename(p)).group())
+    )
+    valid_images = []
+    for img_path in image_paths:
+        info = probe_file(img_path)
+        if not info:
+            print(f"Skipping invalid image {img_path}")
+        elif is_valid_size(info[1], info[2]):
+            valid_images.append(img_path)
+    return valid_images
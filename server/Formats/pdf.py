@@ -2,56 +2,142 @@ import img2pdf
 import os
 import shutil
 import re
-from PIL import Image
+import threading
+import billiard
+from concurrent.futures import Future, ThreadPoolExecutor
+from Formats.image_probe import chapter_images
 from zipfile import ZipFile
 
-def gen_pdf(path, update_progress=None):
+# Number of Celery worker processes, each of them converts chapters on its own pool
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 2))
+
+# Number of processes converting chapters to PDF at the same time in one worker process
+PDF_WORKERS = int(os.getenv("PDF_WORKERS") or max(1, (os.cpu_count() or 1) // WORKER_CONCURRENCY))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_executor():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+class _ProcessPool:
+    """
+    Process pool with the `submit` interface of the `concurrent.futures` executors.
+
+    It is a billiard pool, as the Celery prefork children are daemonic and the
+    `multiprocessing` pools refuse to start processes from a daemonic process.
+    """
+
+    def __init__(self, processes):
+        self._pool = billiard.get_context("spawn").Pool(processes)
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._pool.apply_async(
+            fn, args,
+            callback=future.set_result,
+            error_callback=lambda einfo: future.set_exception(einfo.exception)
+        )
+        return future
+
+
+def pdf_executor():
+    """
+    Returns the executor shared by all PDF conversions of this process.
+
+    Chapters are spread over a pool of `PDF_WORKERS` processes, also in the Celery
+    prefork children.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if PDF_WORKERS > 1:
+                _executor = _ProcessPool(PDF_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=PDF_WORKERS)
+        return _executor
+
+
+def chapter_sort_key(chapter):
+    """
+    Orders chapter directories by their chapter number, e.g. 2 before 10 and 10 before 10.5.
+    """
+    name = os.path.basename(chapter)
+    numbers = re.findall(r"\d+(?:\.\d+)?", name)
+    return (float(numbers[0]) if numbers else float("inf"), name)
+
+
+def pdf_chapter(chapter, path):
+    """
+    Converts a single chapter directory into a PDF and removes the directory afterwards.
+
+    Args:
+        chapter (str): Path to the chapter directory with the downloaded images.
+        path (str): Path to the target directory where the PDF is written.
+
+    Returns:
+        str: Path to the generated PDF file.
+    """
+    chap_num = os.path.basename(chapter)
+    pdf_path = f"{path}/{chap_num}.pdf"
+
+    # Pages were validated from their headers during the download
+    valid_images = chapter_images(chapter)
+
+    with open(pdf_path, "wb") as f:
+        f.write(img2pdf.convert(valid_images, rotation=img2pdf.Rotation.ifvalid))
+    shutil.rmtree(chapter,ignore_errors=True)
+    return pdf_path
+
+
+def pack_pdfs(path, pdfs):
+    """
+    Packs the chapter PDFs into a single ZIP archive (Chapters.zip).
+
+    Args:
+        path (str): Path to the target directory.
+        pdfs (list of str): Paths to the chapter PDFs, in archive order.
+
+    Returns:
+        str: Path to the generated Zip file.
+    """
+    with ZipFile(f"{path}/Chapters.zip", 'w') as zipf:
+        for pdf in pdfs:
+            zipf.write(pdf, os.path.basename(pdf))
+    return f"{path}/Chapters.zip"
+
+
+def gen_pdf(path, update_progress=None, parallel=True):
     """
     Generates a ZIP archive of PDFs for a manga based on the downloaded images.
 
     Args:
         path (str): Path to the target directory.
         update_progress (Optional[Callable]): Callback function to update progress, if available.
+        parallel (bool): Convert the chapters on the shared `pdf_executor` instead of one after another.
 
     Returns:
-        str: Path to the generated Zip file.
+        str: Path to the generated Zip file. The PDFs are stored in chapter order.
     """
-    chapter_paths = [f.path for f in os.scandir(path) if f.is_dir()]
+    chapter_paths = sorted([f.path for f in os.scandir(path) if f.is_dir()], key=chapter_sort_key)
     total_chapters = len(chapter_paths)
-    pdfs = []
     if update_progress:
             update_progress(total_chapters, f"Creating PDFs...")
-            
-    for chapter in chapter_paths:
-        chap_num = os.path.basename(chapter)
-        pdf_path = f"{path}/{chap_num}.pdf"
-
-        image_paths = sorted(
-            [img.path for img in os.scandir(chapter) if img.is_file()],
-            key=lambda p: int(re.search(r"(\d+)", os.path.basename(p)).group())
-        )
 
-        # Validate image sizes
-        valid_images = []
-        for img_path in image_paths:
-            try:
-                with Image.open(img_path) as im:
-                    width, height = im.size
-                    if width >= 72 and height >= 72:
-                        valid_images.append(img_path)
-            except Exception as e:
-                print(f"Skipping invalid image {img_path}: {e}")
-
-        with open(pdf_path, "wb") as f:
-            f.write(img2pdf.convert(valid_images, rotation=img2pdf.Rotation.ifvalid))
-        pdfs.append(pdf_path)
-        shutil.rmtree(chapter,ignore_errors=True)
+    if parallel and total_chapters > 1:
+        futures = [pdf_executor().submit(pdf_chapter, chapter, path) for chapter in chapter_paths]
+        pdfs = [future.result() for future in futures]
+    else:
+        pdfs = [pdf_chapter(chapter, path) for chapter in chapter_paths]
         
     if update_progress:
         update_progress(total_chapters, "Creating ZIP archive...")
-    with ZipFile(f"{path}/Chapters.zip", 'w') as zipf:
-        for pdf in pdfs:
-            zipf.write(pdf, os.path.basename(pdf))
-    return f"{path}/Chapters.zip"
-    
-    
\ No newline at end of file
+    return pack_pdfs(path, pdfs)
@@ -0,0 +1,63 @@
+import queue
+import threading
+
+
+class ChapterPipeline:
+    """
+    Runs the per-chapter format stage on a background thread, so chapter N is converted
+    while chapter N+1 is still downloading.
+
+    Chapters are converted one at a time in the order they are submitted. The first error
+    stops the stage and is re-raised by `close`.
+    """
+
+    def __init__(self, convert):
+        """
+        Args:
+            convert (Callable): Called as `convert(ch_path, index)` for every submitted chapter.
+                                Its non-None return values are collected in submission order.
+        """
+        self._convert = convert
+        self._queue = queue.Queue()
+        self._results = []
+        self._error = None
+        self._count = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, ch_path):
+        """
+        Hands a fully downloaded chapter directory over to the format stage.
+        """
+        self._queue.put(ch_path)
+
+    def _run(self):
+        while True:
+            ch_path = self._queue.get()
+            if ch_path is None:
+                break
+            if self._error:
+                continue
+            try:
+                result = self._convert(ch_path, self._count)
+                self._count += 1
+                if result is not None:
+                    self._results.append(result)
+            except Exception as e:
+                self._error = e
+
+    def close(self):
+        """
+        Waits for the submitted chapters to be converted.
+
+        Returns:
+            list: The results of the format stage, in submission order.
+
+        Raises:
+            Exception: The first error raised by the format stage.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+        return self._results
@@ -6,9 +6,12 @@ from Formats.pdf import gen_pdf
 from Utils.cleanup import cleanup
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
 from Utils.bot_evasion import get_with_captcha
-from seleniumbase import SB
+from Utils.browser_pool import lease_browser
+from Utils.rate_limit import throttle
 import re
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
+from Utils.chapter_runner import run_chapters
 
 
 class Asura:
@@ -110,13 +113,14 @@ class Asura:
         return chapters
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -132,33 +136,38 @@ class Asura:
             Exception: If a critical error occurs during the download process (e.g., network failure, site structure change).
         """
         
-        total_chapters = len(ids)
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
         try:
-            with SB(uc=True, xvfb=True) as sb:
-                for i, chap_id in enumerate(ids):
-                    if update_progress:
-                        update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                    chap_id_val, chap_num = chap_id.split("_")
-                    try:
-                        sb.uc_open_with_reconnect(f"{Asura.BASE_URL}/series/{chap_id_val}/", 4)
+            def download_chapter(chap_id):
+                chap_id_val, chap_num = chap_id.split("_")
+                ch_path = load_chapter("Asura", chap_id_val, chap_num, path)
+                if ch_path:
+                    return ch_path
+                try:
+                    url = f"{Asura.BASE_URL}/series/{chap_id_val}/"
+                    with lease_browser() as sb:
+                        with throttle(url):
+                            sb.uc_open_with_reconnect(url, 4)
                         sb.uc_gui_click_captcha()
                         soup = sb.get_beautiful_soup()
-                    except Exception as e:
-                        print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
-                        continue
-                    read_container = soup.find_all("div", {"class": "w-full mx-auto center"})
-                    if not read_container:
-                        print(f"Skipping chapter {chap_num} - read-container not found.")
-                        continue
-                    image_links = [
-                        container.img["src"] for container in read_container if container.img and container.img.get("src")
-                    ]
-                    if not image_links:
-                        print(f"No images found for chapter {chap_num}. Skipping.")
-                        continue
-                    download_chapter_images(image_links, chap_num, path)
+                except Exception as e:
+                    print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
+                    return None
+                read_container = soup.find_all("div", {"class": "w-full mx-auto center"})
+                if not read_container:
+                    print(f"Skipping chapter {chap_num} - read-container not found.")
+                    return None
+                image_links = [
+                    container.img["src"] for container in read_container if container.img and container.img.get("src")
+                ]
+                if not image_links:
+                    print(f"No images found for chapter {chap_num}. Skipping.")
+                    return None
+                _, ch_path = download_chapter_images(image_links, chap_num, path, cache_key=("Asura", chap_id_val))
+                return ch_path
+
+            run_chapters(ids, download_chapter, Asura.BASE_URL, update_progress, on_chapter)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
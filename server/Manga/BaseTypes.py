@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 
 class Comic(BaseModel):
@@ -44,10 +44,16 @@ class ChapterInfo(BaseModel):
     Attributes:
         id: Unique identifier for the chapter.
         chapter: Chapter number or serial as string.
+        title: Chapter title, if the source provides it.
+        groups: Scanlation groups of the chapter, if the source provides them.
+        pages: Number of pages, if the source provides it.
     """
     
     id: str = Field(..., description="Unique identifier for the chapter")
     chapter: str = Field(..., description="Chapter number or serial as a string")
+    title: Optional[str] = Field(None, description="Chapter title")
+    groups: Optional[List[str]] = Field(None, description="Scanlation groups of the chapter")
+    pages: Optional[int] = Field(None, description="Number of pages")
 
 
 class VolumeData(BaseModel):
@@ -1,12 +1,22 @@
 import os
 import uuid
+import asyncio
+import aiohttp
 import requests as req
+from Utils.http_session import http_post, ahttp_post_json
 import shutil
 from zipfile import ZipFile
 from Formats.pdf import gen_pdf
 from Utils.cleanup import cleanup
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
+
+
+# Pages of the chapter list requested together once the page size is known
+BATO_LIST_PAGES = int(os.getenv("BATO_LIST_PAGES", 8))
+# Chapters whose image lists are resolved by one request
+BATO_IMAGES_BATCH = int(os.getenv("BATO_IMAGES_BATCH", 20))
 
 class Bato:
     """
@@ -22,16 +32,13 @@ class Bato:
     
     BASE_URL = "https://bato.si"
     
-    IMAGES_QUERY = '''
-        query Images($getChapterNodeId: ID!) {
-          get_chapterNode(id: $getChapterNodeId) {
+    # Several chapters are resolved per request, each under a GraphQL alias c0, c1, ...
+    IMAGES_FIELDS = '''
             data {
               imageFile {
                 urlList
               }
             }
-          }
-        }
     '''
     
     SEARCH_QUERY = '''
@@ -49,9 +56,8 @@ class Bato:
         }
     '''
     
-    CHAPTERS_QUERY = '''
-        query Chapters($comicId: ID!, $start: Int) {
-          get_comic_chapterList(comicId: $comicId, start: $start) {
+    # Several pages of the chapter list are fetched per request, each under a GraphQL alias p0, p1, ...
+    CHAPTERS_FIELDS = '''
             data {
               id
               volume
@@ -59,8 +65,6 @@ class Bato:
               serial
               order
             }
-          }
-        }
     '''
 
     @staticmethod
@@ -84,7 +88,7 @@ class Bato:
         """
         
         try:
-            r = req.post(
+            r = http_post(
                 f'{Bato.BASE_URL}/ap2/',
                 json={
                     "query": Bato.SEARCH_QUERY,
@@ -95,7 +99,31 @@ class Bato:
         except req.RequestException as e:
             raise Exception(f"Failed to fetch data from Bato API: {e}")
         
-        data = r.json()["data"]["get_search_comic"]["items"]
+        return Bato._search_results(r.json()["data"]["get_search_comic"]["items"])
+
+    @staticmethod
+    async def asearch(title: str):
+        """
+        Same as `search`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await ahttp_post_json(
+                f'{Bato.BASE_URL}/ap2/',
+                json={
+                    "query": Bato.SEARCH_QUERY,
+                    "variables": {"select": {"word": title}, "operationName": "Search"}
+                }
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from Bato API: {e}")
+
+        return Bato._search_results(data["data"]["get_search_comic"]["items"])
+
+    @staticmethod
+    def _search_results(data) -> ComicsDict:
+        """
+        Builds the search results from the items of a Search query.
+        """
         if not data:
             return {"message": "No results found."}
         
@@ -135,51 +163,119 @@ class Bato:
             Exception: If the Bato API request fails or no chapters are found.
         """
         
-        start = 1
-        last_serial = 1
         chapters: ChaptersDict = {}
+        last_order, page_size, done = 0, 0, False
 
-        while True:
+        while not done:
+            starts = Bato._page_starts(last_order, page_size)
             try:
-                r = req.post(
-                    f'{Bato.BASE_URL}/ap2/',
-                    json={
-                        "query": Bato.CHAPTERS_QUERY,
-                        "variables": {"comicId": id, "start": start, "operationName": "Chapters"}
-                    }
-                )
+                r = http_post(f'{Bato.BASE_URL}/ap2/', json=Bato._chapters_request(id, starts))
                 r.raise_for_status()
             except req.RequestException as e:
                 raise Exception(f"Failed to fetch data from Bato API: {e}")
 
-            data = r.json()["data"]["get_comic_chapterList"]
-            if last_serial == data[-1]["data"]["order"]:
-                break
-            else:
-                last_serial = data[-1]["data"]["order"]
-            
-            for chap in data:
-                volume = f"Vol {chap['data']['volume']}" if chap["data"]["volume"] is not None else "Vol 1"
-                chapter_num = str(chap["data"]["serial"])
-                chapter_id = str(chap["data"]["id"])
+            last_order, page_size, done = Bato._add_pages(chapters, r.json(), len(starts), last_order, page_size)
 
-                if volume not in chapters:
-                    chapters[volume] = VolumeData(volume=volume, chapters={})
+        if not chapters:
+            raise Exception("No chapters found.")
+        return chapters
 
-                chapters[volume].chapters[chapter_num] = ChapterInfo(id=chapter_id, chapter=chapter_num)
+    @staticmethod
+    async def aget_chapters(id):
+        """
+        Same as `get_chapters`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        chapters: ChaptersDict = {}
+        last_order, page_size, done = 0, 0, False
+
+        while not done:
+            starts = Bato._page_starts(last_order, page_size)
+            try:
+                data = await ahttp_post_json(f'{Bato.BASE_URL}/ap2/', json=Bato._chapters_request(id, starts))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise Exception(f"Failed to fetch data from Bato API: {e}")
 
-            start = last_serial + 1
+            last_order, page_size, done = Bato._add_pages(chapters, data, len(starts), last_order, page_size)
 
+        if not chapters:
+            raise Exception("No chapters found.")
         return chapters
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def _page_starts(last_order: int, page_size: int) -> list:
+        """
+        Offsets of the chapter list pages to request next.
+
+        The list is paged by chapter order: a page starting at `start` holds the next chapters
+        whose order is at least `start`. Once the page size is known, the following pages are
+        requested together at `page_size` intervals. Gaps in the order only make pages overlap,
+        never skip chapters.
+        """
+        pages = BATO_LIST_PAGES if page_size else 1
+        return [last_order + 1 + k * page_size for k in range(pages)]
+
+    @staticmethod
+    def _chapters_request(id, starts) -> dict:
+        """
+        Builds the body of a Chapters query fetching one page of the chapter list per offset in `starts`.
+        """
+        variables = "".join(f", $s{i}: Int" for i in range(len(starts)))
+        pages = "".join(
+            f"p{i}: get_comic_chapterList(comicId: $comicId, start: $s{i}) {{{Bato.CHAPTERS_FIELDS}}}\n"
+            for i in range(len(starts))
+        )
+        query_vars = {f"s{i}": start for i, start in enumerate(starts)}
+        return {
+            "query": f"query Chapters($comicId: ID!{variables}) {{\n{pages}}}",
+            "variables": {"comicId": id, **query_vars, "operationName": "Chapters"}
+        }
+
+    @staticmethod
+    def _add_pages(chapters: ChaptersDict, data, count: int, last_order: int, page_size: int):
+        """
+        Adds the pages of a Chapters query to the chapter list.
+
+        Returns:
+            tuple: (highest chapter order seen, page size, whether the whole list has been fetched).
+                   The list is complete when a page comes back short, or when none of the pages
+                   reached past the chapters already known.
+        """
+        results = data.get("data") or {}
+        pages = [results.get(f"p{i}") or [] for i in range(count)]
+        page_size = max([page_size] + [len(page) for page in pages])
+
+        highest = last_order
+        for page in pages:
+            Bato._add_chapters(chapters, page)
+            highest = max([highest] + [chap["data"]["order"] for chap in page])
+
+        done = highest == last_order or any(len(page) < page_size for page in pages)
+        return highest, page_size, done
+
+    @staticmethod
+    def _add_chapters(chapters: ChaptersDict, data) -> None:
+        """
+        Adds one page of a Chapters query to the chapter list.
+        """
+        for chap in data:
+            volume = f"Vol {chap['data']['volume']}" if chap["data"]["volume"] is not None else "Vol 1"
+            chapter_num = str(chap["data"]["serial"])
+            chapter_id = str(chap["data"]["id"])
+
+            if volume not in chapters:
+                chapters[volume] = VolumeData(volume=volume, chapters={})
+
+            chapters[volume].chapters[chapter_num] = ChapterInfo(id=chapter_id, chapter=chapter_num)
+
+    @staticmethod
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -198,23 +294,70 @@ class Bato:
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
         try:
-            for i, chap_id in enumerate(ids):
+            chapter_ids = [Bato._split_id(chap_id) for chap_id in ids]
+            image_lists = {}
+            for i, (chap_id_val, chap_num) in enumerate(chapter_ids):
                 if update_progress:
                     update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                temp = chap_id.split("_")
-                if len(temp) != 2:
-                    chap_id_val, chap_num = "_".join(temp[:-1]), temp[-1]
-                else:
-                    chap_id_val, chap_num = temp
-                ch_path = f"{path}/{chap_num}"
-                os.makedirs(ch_path, exist_ok=True)
-                r = req.post(f'{Bato.BASE_URL}/ap2/', json={"query": Bato.IMAGES_QUERY, "variables": {"getChapterNodeId": chap_id_val, "operationName": "Images"}})
-                r.raise_for_status()
-                image_links = r.json()["data"]["get_chapterNode"]["data"]["imageFile"]["urlList"]
-                download_chapter_images(image_links, chap_num, path)
+                ch_path = load_chapter("Bato", chap_id_val, chap_num, path)
+                if ch_path:
+                    if on_chapter:
+                        on_chapter(ch_path)
+                    continue
+                if chap_id_val not in image_lists:
+                    # Resolves this chapter together with the next ones
+                    batch = [val for val, _ in chapter_ids[i:i + BATO_IMAGES_BATCH]]
+                    r = http_post(f'{Bato.BASE_URL}/ap2/', json=Bato._images_request(batch))
+                    r.raise_for_status()
+                    image_lists.update(Bato._image_lists(r.json(), batch))
+                image_links = image_lists.get(chap_id_val)
+                if image_links is None:
+                    raise Exception(f"Chapter {chap_num} not found on Bato.")
+                _, ch_path = download_chapter_images(image_links, chap_num, path, cache_key=("Bato", chap_id_val))
+                if on_chapter:
+                    on_chapter(ch_path)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
             raise e
 
-    
\ No newline at end of file
+    @staticmethod
+    def _split_id(chap_id: str):
+        """
+        Splits a "{id}_{chapter number}" identifier.
+        """
+        temp = chap_id.split("_")
+        if len(temp) != 2:
+            return "_".join(temp[:-1]), temp[-1]
+        return temp[0], temp[1]
+
+    @staticmethod
+    def _images_request(chap_ids) -> dict:
+        """
+        Builds the body of an Images query resolving all of `chap_ids` at once.
+        """
+        variables = ", ".join(f"$c{i}: ID!" for i in range(len(chap_ids)))
+        nodes = "".join(
+            f"c{i}: get_chapterNode(id: $c{i}) {{{Bato.IMAGES_FIELDS}}}\n"
+            for i in range(len(chap_ids))
+        )
+        query_vars = {f"c{i}": chap_id for i, chap_id in enumerate(chap_ids)}
+        return {
+            "query": f"query Images({variables}) {{\n{nodes}}}",
+            "variables": {**query_vars, "operationName": "Images"}
+        }
+
+    @staticmethod
+    def _image_lists(data, chap_ids) -> dict:
+        """
+        Maps every chapter of an Images query to its image URLs, chapters Bato couldn't resolve are left out.
+        """
+        results = data.get("data") or {}
+        image_lists = {}
+        for i, chap_id in enumerate(chap_ids):
+            node = results.get(f"c{i}") or {}
+            try:
+                image_lists[chap_id] = node["data"]["imageFile"]["urlList"]
+            except (KeyError, TypeError):
+                continue
+        return image_lists
@@ -5,10 +5,11 @@ from zipfile import ZipFile
 from Formats.pdf import gen_pdf
 from Utils.cleanup import cleanup
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
-from Utils.bot_evasion import get_with_captcha
-from seleniumbase import SB
+from Utils.bot_evasion import fetch_page, fetch_chapter_list
 import re
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
+from Utils.chapter_runner import run_chapters
 
 
 class Kunmanga:
@@ -50,7 +51,7 @@ class Kunmanga:
         """
         
         try:
-            soup = get_with_captcha(f"{Kunmanga.BASE_URL}?s={title}{Kunmanga.SEARCH_PARAMS}", Kunmanga.SEARCH_ELEM[0])
+            soup = fetch_page(f"{Kunmanga.BASE_URL}?s={title}{Kunmanga.SEARCH_PARAMS}", Kunmanga.SEARCH_ELEM[0])
         except Exception as e:
             raise Exception(f"Failed to fetch data from Kunmanga: {e}")
         
@@ -96,9 +97,9 @@ class Kunmanga:
         """
         
         try:
-            soup = get_with_captcha(f"{Kunmanga.BASE_URL}/manga/{id}", Kunmanga.CHAPTERS_ELEM[0][0])
+            soup = fetch_chapter_list(f"{Kunmanga.BASE_URL}/manga/{id}", Kunmanga.CHAPTERS_ELEM[0][0])
             if type(soup) is dict:
-                soup = get_with_captcha(f"{Kunmanga.BASE_URL}/manga/{id}", Kunmanga.CHAPTERS_ELEM[1][0])
+                soup = fetch_chapter_list(f"{Kunmanga.BASE_URL}/manga/{id}", Kunmanga.CHAPTERS_ELEM[1][0])
                 data = soup.find("ul",Kunmanga.CHAPTERS_ELEM[1][1] ).find_all("li")
             else:
                 data = soup.find("ul",Kunmanga.CHAPTERS_ELEM[0][1] ).find_all("li")
@@ -117,13 +118,14 @@ class Kunmanga:
         return chapters
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -138,39 +140,39 @@ class Kunmanga:
         Raises:
             Exception: If a critical error occurs during the download process (e.g., network failure, site structure change).
         """
-        total_chapters = len(ids)
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
         try:
-            with SB(uc=True, xvfb=True) as sb:
-                for i, chap_id in enumerate(ids):
-                    if update_progress:
-                        update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                    chap_id_val, chap_num = chap_id.split("_")
-                    try:
-                        sb.uc_open_with_reconnect(f"{Kunmanga.BASE_URL}/manga/{chap_id_val}/", 4)
-                        sb.uc_gui_click_captcha()
-                        soup = sb.get_beautiful_soup()
-                    except Exception as e:
-                        print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
-                        continue
-                    read_container = soup.find("div", {"class": "reading-content"})
-                    if not read_container:
-                        print(f"Skipping chapter {chap_num} - reading-content not found.")
-                        continue
-                    images = read_container.find_all("img")
+            def download_chapter(chap_id):
+                chap_id_val, chap_num = chap_id.split("_")
+                ch_path = load_chapter("Kunmanga", chap_id_val, chap_num, path)
+                if ch_path:
+                    return ch_path
+                try:
+                    soup = fetch_page(f"{Kunmanga.BASE_URL}/manga/{chap_id_val}/")
+                except Exception as e:
+                    print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
+                    return None
+                read_container = soup.find("div", {"class": "reading-content"})
+                if not read_container:
+                    print(f"Skipping chapter {chap_num} - reading-content not found.")
+                    return None
+                images = read_container.find_all("img")
+                image_links = [
+                    re.sub(r'[\t\r\n]', "", img.get("data-src", "")) for img in images if img.get("data-src")
+                ]
+                if not image_links:
+                    # If no data-src, try src
                     image_links = [
-                        re.sub(r'[\t\r\n]', "", img.get("data-src", "")) for img in images if img.get("data-src")
+                        re.sub(r'[\t\r\n]', "", img.get("src", "")) for img in images if img.get("src")
                     ]
-                    if not image_links:
-                        # If no data-src, try src
-                        image_links = [
-                            re.sub(r'[\t\r\n]', "", img.get("src", "")) for img in images if img.get("src")
-                        ]
-                    if not image_links:
-                        print(f"No images found for chapter {chap_num}. Skipping.")
-                        continue
-                    download_chapter_images(image_links, chap_num, path)
+                if not image_links:
+                    print(f"No images found for chapter {chap_num}. Skipping.")
+                    return None
+                _, ch_path = download_chapter_images(image_links, chap_num, path, cache_key=("Kunmanga", chap_id_val))
+                return ch_path
+
+            run_chapters(ids, download_chapter, Kunmanga.BASE_URL, update_progress, on_chapter)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
@@ -1,12 +1,89 @@
 import os
 import uuid
+import time
+import asyncio
+import threading
+import aiohttp
 import requests as req
+from concurrent.futures import ThreadPoolExecutor
+from Utils.http_session import http_get, ahttp_get_json
 import shutil
 from zipfile import ZipFile
 from Formats.pdf import gen_pdf
 from Utils.cleanup import cleanup
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
 from Formats.image_downloader import download_chapter_images
+from Formats.image_probe import read_manifest
+from Utils.chapter_cache import load_chapter
+from Utils.rate_limit import register_limits, throttle
+
+
+# At-home server lookups allowed per minute across all workers, MangaDex's published limit is 40 per IP
+AT_HOME_PER_MINUTE = int(os.getenv("MANGADEX_AT_HOME_PER_MINUTE", 40))
+# At-home servers resolved at the same time, ahead of the chapter being downloaded
+AT_HOME_WORKERS = int(os.getenv("MANGADEX_AT_HOME_WORKERS", 4))
+# Image qualities served by MangaDex, "data-saver" pages are compressed JPEGs
+QUALITIES = ("data", "data-saver")
+# Search results fetched per query, in pages of `SEARCH_PAGE_SIZE`
+MANGADEX_SEARCH_RESULTS = int(os.getenv("MANGADEX_SEARCH_RESULTS", 300))
+# How long the chapter list of a manga is reused (seconds), 0 disables the cache
+MANGADEX_CACHE_TTL = int(os.getenv("MANGADEX_CACHE_TTL", 600))
+# Largest pages accepted by /manga and /manga/{id}/feed
+SEARCH_PAGE_SIZE = 100
+FEED_PAGE_SIZE = 500
+# MangaDex refuses lists where offset + limit goes past this
+MAX_LIST_ITEMS = 10000
+# Pages of a list fetched at the same time once the total is known
+LIST_WORKERS = 3
+
+SEARCH_PARAMS = {
+    "includes[]": ["cover_art"],
+    "order[relevance]": "desc",
+}
+FEED_PARAMS = {
+    "translatedLanguage[]": ["en"],
+    "includes[]": ["scanlation_group"],
+    "contentRating[]": ["safe", "suggestive", "erotica", "pornographic"],
+    "order[volume]": "asc",
+    "order[chapter]": "asc",
+}
+
+_feed_cache = {}
+_feed_cache_lock = threading.Lock()
+
+# At-home lookups are limited apart from the rest of the API, by all workers together
+AT_HOME_LIMIT_KEY = "api.mangadex.org/at-home"
+register_limits(AT_HOME_LIMIT_KEY, rate=AT_HOME_PER_MINUTE / 60)
+
+def _cached_chapters(manga_id: str):
+    """
+    Returns the chapter list of a manga fetched less than `MANGADEX_CACHE_TTL` seconds ago, or None.
+    """
+    with _feed_cache_lock:
+        entry = _feed_cache.get(manga_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        _feed_cache.pop(manga_id, None)
+        return None
+
+
+def _cache_chapters(manga_id: str, chapters) -> None:
+    if MANGADEX_CACHE_TTL <= 0:
+        return
+    with _feed_cache_lock:
+        now = time.monotonic()
+        for key in [key for key, entry in _feed_cache.items() if entry[0] <= now]:
+            del _feed_cache[key]
+        _feed_cache[manga_id] = (now + MANGADEX_CACHE_TTL, chapters)
+
+
+def _page_offsets(total: int, page_size: int, max_items: int):
+    """
+    (offset, limit) of the pages of a list after the first one.
+    """
+    total = min(total, max_items, MAX_LIST_ITEMS)
+    return [(offset, min(page_size, total - offset)) for offset in range(page_size, total, page_size)]
+
 
 class MangaDex:
     """
@@ -22,11 +99,16 @@ class MangaDex:
     
     BASE_URL = "https://api.mangadex.org"
     AT_HOME = "https://api.mangadex.org/at-home/server/"
+    # Origin of the images, used when no MangaDex@Home node could serve a chapter
+    UPLOADS_URL = "https://uploads.mangadex.org"
 
     @staticmethod
     def search(title: str):
         """
         Search for comics on MangaDex by title.
+
+        Pages through /manga until `MANGADEX_SEARCH_RESULTS` results, by relevance. The
+        covers are included in the same responses.
         
         Args:
             title (str): The title or keyword to search for.
@@ -44,29 +126,98 @@ class MangaDex:
         """
         
         try:
-            r = req.get(f"{MangaDex.BASE_URL}/manga",
-                        params={"title": title,
-                                "includes[]":["cover_art"]}
-                        )
-            r.raise_for_status()
+            data = MangaDex._get_list("/manga", {"title": title, **SEARCH_PARAMS},
+                                      SEARCH_PAGE_SIZE, MANGADEX_SEARCH_RESULTS)
         except req.RequestException as e:
             raise Exception(f"Failed to fetch data from MangaDex: {e}")
         
-        data = r.json()["data"]
+        return MangaDex._search_results(data)
+
+    @staticmethod
+    async def asearch(title: str):
+        """
+        Same as `search`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await MangaDex._aget_list("/manga", {"title": title, **SEARCH_PARAMS},
+                                             SEARCH_PAGE_SIZE, MANGADEX_SEARCH_RESULTS)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from MangaDex: {e}")
+
+        return MangaDex._search_results(data)
+
+    @staticmethod
+    def _get_list(path: str, params: dict, page_size: int, max_items: int = MAX_LIST_ITEMS):
+        """
+        Fetches every item of a paginated MangaDex list.
+
+        The first page gives the total, the other pages are then fetched `LIST_WORKERS` at a time.
+
+        Args:
+            path (str): Endpoint, e.g. "/manga".
+            params (dict): Query parameters, without limit and offset.
+            page_size (int): Items per page, at most the limit accepted by the endpoint.
+            max_items (int, optional): Stops after this many items.
+
+        Returns:
+            list: The "data" items of all pages, in order.
+
+        Raises:
+            requests.RequestException: If a page could not be fetched.
+        """
+        def get_page(offset, limit):
+            r = http_get(f"{MangaDex.BASE_URL}{path}", params={**params, "limit": limit, "offset": offset})
+            r.raise_for_status()
+            return r.json()
+
+        first = get_page(0, min(page_size, max_items))
+        items = list(first["data"])
+        offsets = _page_offsets(first.get("total", 0), page_size, max_items)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=min(LIST_WORKERS, len(offsets))) as executor:
+                for page in executor.map(lambda page: get_page(*page), offsets):
+                    items += page["data"]
+        return items
+
+    @staticmethod
+    async def _aget_list(path: str, params: dict, page_size: int, max_items: int = MAX_LIST_ITEMS):
+        """
+        Same as `_get_list`, on the shared aiohttp session.
+        """
+        semaphore = asyncio.Semaphore(LIST_WORKERS)
+
+        async def get_page(offset, limit):
+            async with semaphore:
+                return await ahttp_get_json(f"{MangaDex.BASE_URL}{path}",
+                                            params={**params, "limit": limit, "offset": offset})
+
+        first = await get_page(0, min(page_size, max_items))
+        items = list(first["data"])
+        pages = await asyncio.gather(*(get_page(*page) for page in _page_offsets(first.get("total", 0), page_size, max_items)))
+        for page in pages:
+            items += page["data"]
+        return items
+
+    @staticmethod
+    def _search_results(data) -> ComicsDict:
+        """
+        Builds the search results from the manga list of /manga responses.
+        """
         if not data:
             return {"message": "No results found."}
         
         comics: ComicsDict = {}
         for num, com in enumerate(data):
-            if "amz" in com["attributes"]["links"]:
+            if "amz" in (com["attributes"]["links"] or {}):
                 print(True)
                 continue
             title = com["attributes"]["title"]
             com_id = com["id"]
             rel = com["relationships"]
             trans = com["attributes"]["availableTranslatedLanguages"]
+            cover_art = ""
             for i in rel:
-                if i["type"] == "cover_art":
+                if i["type"] == "cover_art" and i.get("attributes"):
                     cover_art = f'/api/proxy-image?url=https://uploads.mangadex.org/covers/{com_id}/{i["attributes"]["fileName"]}.256.jpg&hd='
                     break
             comics[num] = Comic(
@@ -83,6 +234,9 @@ class MangaDex:
         """
         Retrieve the list of chapters for a given comic from MangaDex.
 
+        Pages through the English feed of the manga, 500 chapters per request, with the
+        scanlation groups included. The list is kept for `MANGADEX_CACHE_TTL` seconds.
+
         Args:
             id (str): The comic ID to fetch chapters for.
 
@@ -92,92 +246,216 @@ class MangaDex:
                 - chapters: Dict of chapters, where each key is a numeric index and each value is a dict with:
                     - id: Chapter ID
                     - chapter: Chapter number/label
+                    - title, groups, pages: Chapter title, scanlation groups and page count
             Raises an Exception if no chapters are found.
 
         Raises:
             Exception: If the MangaDex API request fails or no chapters are found.
         """
-        
+        chapters = _cached_chapters(id)
+        if chapters is not None:
+            return chapters
+
         try:
-            r = req.get(f"{MangaDex.BASE_URL}/manga/{id}/aggregate",
-                        params={"translatedLanguage[]": ["en"]
-                                }
-                        )
-            r.raise_for_status()
+            data = MangaDex._get_list(f"/manga/{id}/feed", FEED_PARAMS, FEED_PAGE_SIZE)
         except req.RequestException as e:
             raise Exception(f"Failed to fetch data from MangaDex: {e}")
         
-        data = r.json()["volumes"]
-        
+        chapters = MangaDex._volumes(data)
+        _cache_chapters(id, chapters)
+        return chapters
+
+    @staticmethod
+    async def aget_chapters(id):
+        """
+        Same as `get_chapters`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        chapters = _cached_chapters(id)
+        if chapters is not None:
+            return chapters
+
+        try:
+            data = await MangaDex._aget_list(f"/manga/{id}/feed", FEED_PARAMS, FEED_PAGE_SIZE)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from MangaDex: {e}")
+
+        chapters = MangaDex._volumes(data)
+        _cache_chapters(id, chapters)
+        return chapters
+
+    @staticmethod
+    def _volumes(data) -> ChaptersDict:
+        """
+        Builds the chapter list from the chapters of a /manga/{id}/feed response.
+
+        Chapters hosted on other sites can't be downloaded and are left out. When several
+        groups translated the same chapter, the first one in the feed is listed.
+        """
         new_data: ChaptersDict = {}
 
-        for vol in data:
-            new_vol = f"Vol {vol}"
+        for chap in data:
+            attributes = chap["attributes"]
+            if attributes.get("externalUrl"):
+                continue
+            new_vol = f"Vol {attributes['volume'] or 'none'}"
+            chapter = attributes["chapter"] or "none"
 
-            chapters = {
-                chap: ChapterInfo(**{
-                    k: v for k, v in data[vol]["chapters"][chap].items() # Freaky magic 
-                    if k in ("id", "chapter") 
-                })
-                for chap in data[vol]["chapters"]
-            }
+            if new_vol not in new_data:
+                new_data[new_vol] = VolumeData(volume=new_vol, chapters={})
+            if chapter in new_data[new_vol].chapters:
+                continue
 
-            new_data[new_vol] = VolumeData(
-                volume=new_vol,
-                chapters=chapters
+            groups = [
+                rel["attributes"]["name"] for rel in chap["relationships"]
+                if rel["type"] == "scanlation_group" and rel.get("attributes")
+            ]
+            new_data[new_vol].chapters[chapter] = ChapterInfo(
+                id=chap["id"],
+                chapter=chapter,
+                title=attributes.get("title") or None,
+                groups=groups,
+                pages=attributes.get("pages")
             )
 
         return new_data
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None, quality="data"):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
+            quality (str, optional): "data" for the original pages, "data-saver" for compressed ones.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
 
         Behavior:
-            - For each chapter ID, fetches the chapter page and extracts all image URLs.
-            - Downloads all images for the chapter into a dedicated subdirectory.
-            - Skips chapters for which no images are found or if scraping fails.
-            - Handles site-specific anti-bot measures (e.g., Selenium, captchas) as needed.
+            - Chapters found in the chapter cache are taken from it.
+            - The at-home servers of the next `AT_HOME_WORKERS` chapters are resolved concurrently
+              while a chapter downloads, within `AT_HOME_PER_MINUTE`.
+            - Failed lookups are retried by `http_get`, see `Utils.retry`.
+            - If pages fail on the assigned MangaDex@Home node, the chapter is downloaded again from
+              another node, then from the MangaDex origin.
             - If an error occurs, cleans up the created directories and raises the exception.
 
         Raises:
             Exception: If a critical error occurs during the download process (e.g., network failure, site structure change).
         """
+        if quality not in QUALITIES:
+            raise ValueError(f"Invalid quality: {quality}. Allowed: {', '.join(QUALITIES)}")
+        # Data saver pages are different files, they are cached apart from the originals
+        cache_source = "MangaDex" if quality == "data" else f"MangaDex:{quality}"
         total_chapters = len(ids)
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
+        executor = ThreadPoolExecutor(max_workers=max(1, AT_HOME_WORKERS))
         try:
-            for i, chap_id in enumerate(ids):
+            chapters = [chap_id.split("_") for chap_id in ids]
+            cached = [load_chapter(cache_source, chap_id, chap_num, path) for chap_id, chap_num in chapters]
+            pending = [i for i, ch_path in enumerate(cached) if not ch_path]
+            lookups = {}
+
+            for i, (chap_id, chap_num) in enumerate(chapters):
                 if update_progress:
                     update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                chap_id, chap_num = chap_id.split("_")
-                for retry in range(3):
-                    try:
-                        response = req.get(f"{MangaDex.AT_HOME}{chap_id}", timeout=10)
-                        response.raise_for_status()
-                        data = response.json()
-                    except req.RequestException as e:
-                        if retry == 2:
-                            raise Exception(f"Failed to retrieve chapter data after multiple attempts: {e}")
-                        continue
-                    baseUrl = data.get("baseUrl")
-                    hash_url = data["chapter"].get("hash")
-                    images = data["chapter"].get("data")
-                    if baseUrl and hash_url and images:
-                        break
-                else:
-                    raise Exception("Failed to retrieve chapter data after multiple attempts.")
-                image_links = [f"{baseUrl}/data/{hash_url}/{image}" for image in images]
-                download_chapter_images(image_links, chap_num, path)
+                ch_path = cached[i]
+                if not ch_path:
+                    # Keeps the lookups of the next chapters running while this one downloads
+                    while pending and len(lookups) < AT_HOME_WORKERS + 1:
+                        j = pending.pop(0)
+                        lookups[j] = executor.submit(MangaDex._resolve_chapter, chapters[j][0], quality)
+                    image_links = lookups.pop(i).result()
+                    ch_path = MangaDex._download_chapter(chap_id, chap_num, path, image_links, quality, cache_source)
+                if on_chapter:
+                    on_chapter(ch_path)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
-            raise e
\ No newline at end of file
+            raise e
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _resolve_chapter(chap_id: str, quality: str = "data", force_443: bool = False):
+        """
+        Asks the at-home API for a MangaDex@Home node serving a chapter.
+
+        Args:
+            chap_id (str): Chapter ID.
+            quality (str, optional): "data" or "data-saver".
+            force_443 (bool, optional): Requests a node on port 443, MangaDex then usually assigns another one.
+
+        Returns:
+            list of str: The page URLs on the assigned node.
+
+        Raises:
+            Exception: If the lookup failed, transient errors are retried by `http_get` first.
+        """
+        params = {"forcePort443": "true"} if force_443 else None
+        url = f"{MangaDex.AT_HOME}{chap_id}"
+        try:
+            with throttle(url, key=AT_HOME_LIMIT_KEY):
+                response = http_get(url, params=params, timeout=10)
+            response.raise_for_status()
+        except req.RequestException as e:
+            raise Exception(f"Failed to retrieve chapter data: {e}")
+        image_links = MangaDex._image_links(response.json(), quality)
+        if not image_links:
+            raise Exception("Failed to retrieve chapter data: incomplete at-home response")
+        return image_links
+
+    @staticmethod
+    def _download_chapter(chap_id, chap_num, path, image_links, quality, cache_source):
+        """
+        Downloads the pages of a chapter, moving to another node when the assigned one fails.
+
+        Pages that fail are replaced with `corrupt.jpg` by the downloader, so a chapter with
+        corrupt pages is downloaded again from a node on port 443, then from the origin.
+
+        Returns:
+            str: Path to the chapter directory.
+        """
+        fallbacks = [
+            lambda: MangaDex._resolve_chapter(chap_id, quality, force_443=True),
+            lambda: MangaDex._origin_links(image_links, quality),
+        ]
+        while True:
+            _, ch_path = download_chapter_images(image_links, chap_num, path, cache_key=(cache_source, chap_id))
+            pages = read_manifest(ch_path) or []
+            if not fallbacks or not any(page.get("corrupt") for page in pages):
+                return ch_path
+            print(f"MangaDex node failed for chapter {chap_num}, trying another one")
+            next_links = None
+            while fallbacks and not next_links:
+                try:
+                    next_links = fallbacks.pop(0)()
+                except Exception as e:
+                    print(f"Failed to get another node for chapter {chap_num}: {e}")
+            if not next_links:
+                return ch_path
+            image_links = next_links
+            shutil.rmtree(ch_path, ignore_errors=True)
+
+    @staticmethod
+    def _origin_links(image_links, quality):
+        """
+        Rewrites page URLs of a MangaDex@Home node to the MangaDex origin.
+        """
+        marker = f"/{quality}/"
+        return [MangaDex.UPLOADS_URL + link[link.index(marker):] for link in image_links]
+
+    @staticmethod
+    def _image_links(data, quality="data"):
+        """
+        Builds the page URLs of a chapter from an at-home server response, or None if it is incomplete.
+        """
+        baseUrl = data.get("baseUrl")
+        hash_url = data["chapter"].get("hash")
+        images = data["chapter"].get("dataSaver" if quality == "data-saver" else "data")
+        if not (baseUrl and hash_url and images):
+            return None
+        return [f"{baseUrl}/{quality}/{hash_url}/{image}" for image in images]
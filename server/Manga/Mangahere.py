@@ -1,7 +1,10 @@
 import os
 import re
 import uuid
+import asyncio
+import aiohttp
 import requests as req
+from Utils.http_session import http_get, ahttp_get_json
 import shutil
 from zipfile import ZipFile
 from Formats.pdf import gen_pdf
@@ -9,6 +12,7 @@ from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, Comics
 from dotenv import load_dotenv
 from Utils.cleanup import cleanup
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
 load_dotenv()
 MANGAPI_URL = os.environ.get("MANGAPI_URL")
 
@@ -47,12 +51,29 @@ class Mangahere:
         """
         
         try:
-            r = req.get(f"{Mangahere.BASE_URL}/{title}")
+            r = http_get(f"{Mangahere.BASE_URL}/{title}")
         except req.RequestException as e:
-            raise Exception(f"Failed to fetch data from Mangahere API.")
-        
-        data = r.json()["results"]
+            raise Exception(f"Failed to fetch data from Mangahere API: {e}")
         
+        return Mangahere._search_results(r.json()["results"])
+
+    @staticmethod
+    async def asearch(title: str):
+        """
+        Same as `search`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await ahttp_get_json(f"{Mangahere.BASE_URL}/{title}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from Mangahere API: {e}")
+
+        return Mangahere._search_results(data["results"])
+
+    @staticmethod
+    def _search_results(data) -> ComicsDict:
+        """
+        Builds the search results from the results of a search response.
+        """
         comics: ComicsDict = {}
         for num, com in enumerate(data):
             com_id = com["id"]
@@ -90,13 +111,32 @@ class Mangahere:
         """
         
         try:
-            r = req.get(f'{Mangahere.BASE_URL}/info', params={"id": id})
+            r = http_get(f'{Mangahere.BASE_URL}/info', params={"id": id})
             r.raise_for_status()
         except req.RequestException as e:
             raise Exception(f"Failed to fetch data from Mangahere API: {e}")
         
+        return Mangahere._volumes(r.json()["chapters"])
+
+    @staticmethod
+    async def aget_chapters(id):
+        """
+        Same as `get_chapters`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await ahttp_get_json(f'{Mangahere.BASE_URL}/info', params={"id": id})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from Mangahere API: {e}")
+
+        return Mangahere._volumes(data["chapters"])
+
+    @staticmethod
+    def _volumes(chapters) -> ChaptersDict:
+        """
+        Builds the chapter list from the chapters of an info response, grouped by the volume in their title.
+        """
         data: ChaptersDict = {}
-        for num, chap in enumerate(r.json()["chapters"]):
+        for num, chap in enumerate(chapters):
             title_raw = chap["title"]
 
             if "Vol" in title_raw:
@@ -124,13 +164,14 @@ class Mangahere:
         return data
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -157,14 +198,21 @@ class Mangahere:
                     chap_id_val, chap_num = "_".join(temp[:-1]), temp[-1]
                 else:
                     chap_id_val, chap_num = temp
+                ch_path = load_chapter("Mangahere", chap_id_val, chap_num, path)
+                if ch_path:
+                    if on_chapter:
+                        on_chapter(ch_path)
+                    continue
                 ch_path = f"{path}/{chap_num}"
                 os.makedirs(ch_path, exist_ok=True)
-                response = req.get(f"{Mangahere.BASE_URL}/read", timeout=10, params={"chapterId": chap_id_val})
+                response = http_get(f"{Mangahere.BASE_URL}/read", timeout=10, params={"chapterId": chap_id_val})
                 response.raise_for_status()
                 data = response.json()
                 image_links = [(page["img"], page["headerForImage"]["Referer"]) for page in data]
-                download_chapter_images(image_links, chap_num, path, referer=True)
+                _, ch_path = download_chapter_images(image_links, chap_num, path, referer=True, cache_key=("Mangahere", chap_id_val))
+                if on_chapter:
+                    on_chapter(ch_path)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
-            raise e
\ No newline at end of file
+            raise e
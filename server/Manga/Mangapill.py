@@ -1,7 +1,10 @@
 import os
 import re
 import uuid
+import asyncio
+import aiohttp
 import requests as req
+from Utils.http_session import http_get, ahttp_get_json
 import shutil
 from zipfile import ZipFile
 from Formats.pdf import gen_pdf
@@ -9,6 +12,7 @@ from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, Comics
 from dotenv import load_dotenv
 from Utils.cleanup import cleanup
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
 load_dotenv()
 MANGAPI_URL = os.environ.get("MANGAPI_URL")
 
@@ -48,12 +52,29 @@ class Mangapill:
         """
         
         try:
-            r = req.get(f"{Mangapill.BASE_URL}/{title}")
+            r = http_get(f"{Mangapill.BASE_URL}/{title}")
         except req.RequestException as e:
-            raise Exception(f"Failed to fetch data from Mangapill API.")
-        
-        data = r.json()["results"]
+            raise Exception(f"Failed to fetch data from Mangapill API: {e}")
         
+        return Mangapill._search_results(r.json()["results"])
+
+    @staticmethod
+    async def asearch(title: str):
+        """
+        Same as `search`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await ahttp_get_json(f"{Mangapill.BASE_URL}/{title}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from Mangapill API: {e}")
+
+        return Mangapill._search_results(data["results"])
+
+    @staticmethod
+    def _search_results(data) -> ComicsDict:
+        """
+        Builds the search results from the results of a search response.
+        """
         comics: ComicsDict = {}
         for num, com in enumerate(data):
             com_id = com["id"]
@@ -91,15 +112,34 @@ class Mangapill:
         """
         
         try:
-            r = req.get(f'{Mangapill.BASE_URL}/info', params={"id": id})
+            r = http_get(f'{Mangapill.BASE_URL}/info', params={"id": id})
             r.raise_for_status()
         except req.RequestException as e:
             raise Exception(f"Failed to fetch data from Mangapill API: {e}")
         
+        return Mangapill._volumes(r.json()["chapters"])
+
+    @staticmethod
+    async def aget_chapters(id):
+        """
+        Same as `get_chapters`, awaited on the shared aiohttp session instead of blocking a thread.
+        """
+        try:
+            data = await ahttp_get_json(f'{Mangapill.BASE_URL}/info', params={"id": id})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Failed to fetch data from Mangapill API: {e}")
+
+        return Mangapill._volumes(data["chapters"])
+
+    @staticmethod
+    def _volumes(data) -> ChaptersDict:
+        """
+        Builds the chapter list from the chapters of an info response, all in a single volume.
+        """
         chapters: ChaptersDict = {}
         volume = "Vol 1"
         chapters[volume] = VolumeData(volume=volume, chapters={})
-        for num, chap in enumerate(r.json()["chapters"]):
+        for num, chap in enumerate(data):
             chapters[volume].chapters[str(num)] = ChapterInfo(
                 id=chap["id"],
                 chapter=chap["chapter"]
@@ -108,13 +148,14 @@ class Mangapill:
         return chapters
 
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -141,14 +182,21 @@ class Mangapill:
                     chap_id_val, chap_num = "_".join(temp[:-1]), temp[-1]
                 else:
                     chap_id_val, chap_num = temp
+                ch_path = load_chapter("Mangapill", chap_id_val, chap_num, path)
+                if ch_path:
+                    if on_chapter:
+                        on_chapter(ch_path)
+                    continue
                 ch_path = f"{path}/{chap_num}"
                 os.makedirs(ch_path, exist_ok=True)
-                response = req.get(f"{Mangapill.BASE_URL}/read", timeout=10, params={"chapterId": chap_id_val})
+                response = http_get(f"{Mangapill.BASE_URL}/read", timeout=10, params={"chapterId": chap_id_val})
                 response.raise_for_status()
                 data = response.json()
                 image_links = [(page["img"], Mangapill.HEADER) for page in data]
-                download_chapter_images(image_links, chap_num, path, referer=True)
+                _, ch_path = download_chapter_images(image_links, chap_num, path, referer=True, cache_key=("Mangapill", chap_id_val))
+                if on_chapter:
+                    on_chapter(ch_path)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
-            raise e
\ No newline at end of file
+            raise e
@@ -5,10 +5,11 @@ from zipfile import ZipFile
 from Formats.pdf import gen_pdf
 from Utils.cleanup import cleanup
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
-from Utils.bot_evasion import get_with_captcha, get_cookies
-from seleniumbase import SB
+from Utils.bot_evasion import fetch_page, fetch_chapter_list, ensure_cf_cookies
 import re
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
+from Utils.chapter_runner import run_chapters
 
 
 class Toongod:
@@ -49,10 +50,10 @@ class Toongod:
             Exception: If scraping Toongod website fails.
         """
         
-        get_cookies("https://www.toongod.org/?s=&post_type=wp-manga")
+        ensure_cf_cookies("https://www.toongod.org/?s=&post_type=wp-manga")
         
         try:
-            soup = get_with_captcha(f"{Toongod.BASE_URL}/?s={title}&post_type=wp-manga", '')
+            soup = fetch_page(f"{Toongod.BASE_URL}/?s={title}&post_type=wp-manga", '')
         except Exception as e:
             raise Exception(f"Failed to fetch data from Toongod: {e}")
         
@@ -96,7 +97,7 @@ class Toongod:
         """
         
         try:
-            soup = get_with_captcha(f"{Toongod.BASE_URL}/webtoon/{id}", Toongod.CHAPTERS_ELEM[0])
+            soup = fetch_chapter_list(f"{Toongod.BASE_URL}/webtoon/{id}", Toongod.CHAPTERS_ELEM[0])
             data = soup.find_all("li",Toongod.CHAPTERS_ELEM[1])
         except Exception as e:
             raise Exception(f"Failed to fetch data from Toongod: {e}")
@@ -114,13 +115,14 @@ class Toongod:
 
     # Cloudflare block, so ain't bothering with it for now
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -135,40 +137,40 @@ class Toongod:
         Raises:
             Exception: If a critical error occurs during the download process (e.g., network failure, site structure change).
         """
-        total_chapters = len(ids)
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
         try:
-            with SB(uc=True, xvfb=True) as sb:
-                for i, chap_id in enumerate(ids):
-                    if update_progress:
-                        update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                    chap_id_val, chap_num = chap_id.split("_")
-                    try:
-                        sb.uc_open_with_reconnect(f"{Toongod.BASE_URL}/webtoon/{chap_id_val}/", 4)
-                        sb.uc_gui_click_captcha()
-                        soup = sb.get_beautiful_soup()
-                    except Exception as e:
-                        print(f"Skipping chapter {chap_num} due to bot detection: {e}")
-                        continue
-                    read_container = soup.find("div", {"class": "read-container"})
-                    if not read_container:
-                        read_container = soup.find("div", {"class": "reading-content"})
-                    if not read_container:
-                        print(f"Skipping chapter {chap_num} - read-container not found.")
-                        continue
-                    images = read_container.find_all("img")
+            def download_chapter(chap_id):
+                chap_id_val, chap_num = chap_id.split("_")
+                ch_path = load_chapter("Toongod", chap_id_val, chap_num, path)
+                if ch_path:
+                    return ch_path
+                try:
+                    soup = fetch_page(f"{Toongod.BASE_URL}/webtoon/{chap_id_val}/")
+                except Exception as e:
+                    print(f"Skipping chapter {chap_num} due to bot detection: {e}")
+                    return None
+                read_container = soup.find("div", {"class": "read-container"})
+                if not read_container:
+                    read_container = soup.find("div", {"class": "reading-content"})
+                if not read_container:
+                    print(f"Skipping chapter {chap_num} - read-container not found.")
+                    return None
+                images = read_container.find_all("img")
+                image_links = [
+                    re.sub(r'[\t\r\n]', "", img.get("data-src", "")) for img in images if img.get("data-src")
+                ]
+                if not image_links:
                     image_links = [
-                        re.sub(r'[\t\r\n]', "", img.get("data-src", "")) for img in images if img.get("data-src")
+                        re.sub(r'[\t\r\n]', "", img.get("src", "")) for img in images if img.get("src")
                     ]
-                    if not image_links:
-                        image_links = [
-                            re.sub(r'[\t\r\n]', "", img.get("src", "")) for img in images if img.get("src")
-                        ]
-                    if not image_links:
-                        print(f"No images found for chapter {chap_num}. Skipping.")
-                        continue
-                    download_chapter_images(image_links, chap_num, path)
+                if not image_links:
+                    print(f"No images found for chapter {chap_num}. Skipping.")
+                    return None
+                _, ch_path = download_chapter_images(image_links, chap_num, path, cache_key=("Toongod", chap_id_val))
+                return ch_path
+
+            run_chapters(ids, download_chapter, Toongod.BASE_URL, update_progress, on_chapter)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
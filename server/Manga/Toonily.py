@@ -2,10 +2,11 @@ import os
 import uuid
 import shutil
 from Manga.BaseTypes import Comic, ChapterInfo, VolumeData, ChaptersDict, ComicsDict
-from Utils.bot_evasion import get_with_captcha, get_cookies
-from seleniumbase import SB
+from Utils.bot_evasion import fetch_page, ensure_cf_cookies
 import re
 from Formats.image_downloader import download_chapter_images
+from Utils.chapter_cache import load_chapter
+from Utils.chapter_runner import run_chapters
 
 
 class Toonily:
@@ -46,9 +47,9 @@ class Toonily:
             Exception: If scraping Toonily website fails.
         """
         
-        get_cookies(Toonily.BASE_URL)
+        ensure_cf_cookies(Toonily.BASE_URL)
         try:
-            soup = get_with_captcha(f"{Toonily.BASE_URL}/search/{title}{Toonily.SEARCH_PARAMS}", '')
+            soup = fetch_page(f"{Toonily.BASE_URL}/search/{title}{Toonily.SEARCH_PARAMS}", '')
         except Exception as e:
             raise Exception(f"Failed to fetch data from Toonily: {e}")
         
@@ -94,7 +95,7 @@ class Toonily:
         """
         
         try:
-            soup = get_with_captcha(f"{Toonily.BASE_URL}/serie/{id}", '')
+            soup = fetch_page(f"{Toonily.BASE_URL}/serie/{id}", '')
             data = soup.find_all("li", class_="wp-manga-chapter")
         except Exception as e:
             raise Exception(f"Failed to fetch data from Toonily: {e}")
@@ -113,13 +114,14 @@ class Toonily:
 
     # Cloudflare block, so ain't bothering with it for now
     @staticmethod
-    def download_chapters(ids, update_progress=None):
+    def download_chapters(ids, update_progress=None, on_chapter=None):
         """
         Download selected chapters and save all images for each chapter in a separate directory.
 
         Args:
             ids (list of str): List of chapter identifiers. Each identifier should be in the format required by the source.
             update_progress (callable, optional): Callback function for reporting progress.
+            on_chapter (callable, optional): Called with the chapter directory as soon as its images are downloaded.
 
         Returns:
             str: Path to the main directory containing subdirectories for each downloaded chapter. Each subdirectory contains all images for that chapter.
@@ -134,39 +136,39 @@ class Toonily:
         Raises:
             Exception: If a critical error occurs during the download process (e.g., network failure, site structure change).
         """
-        total_chapters = len(ids)
         path = f'Downloads/{uuid.uuid4().hex}'
         os.makedirs(path, exist_ok=True)
         try:
-            with SB(uc=True, xvfb=True) as sb:
-                for i, chap_id in enumerate(ids):
-                    if update_progress:
-                        update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
-                    chap_id_val, chap_num = chap_id.split("_")
-                    try:
-                        sb.uc_open_with_reconnect(f"{Toonily.BASE_URL}/serie/{chap_id_val}/", 4)
-                        sb.uc_gui_click_captcha()
-                        soup = sb.get_beautiful_soup()
-                    except Exception as e:
-                        print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
-                        continue
-                    read_container = soup.find("div", {"class": "reading-content"})
-                    if not read_container:
-                        print(f"Skipping chapter {chap_num} - reading-content not found.")
-                        continue
-                    images = read_container.find_all("div",{"class":"page-break no-gaps"})
+            def download_chapter(chap_id):
+                chap_id_val, chap_num = chap_id.split("_")
+                ch_path = load_chapter("Toonily", chap_id_val, chap_num, path)
+                if ch_path:
+                    return ch_path
+                try:
+                    soup = fetch_page(f"{Toonily.BASE_URL}/serie/{chap_id_val}/")
+                except Exception as e:
+                    print(f"Skipping chapter {chap_num} due to bot evasion: {e}")
+                    return None
+                read_container = soup.find("div", {"class": "reading-content"})
+                if not read_container:
+                    print(f"Skipping chapter {chap_num} - reading-content not found.")
+                    return None
+                images = read_container.find_all("div",{"class":"page-break no-gaps"})
+                image_links = [
+                    (re.sub(r'[\t\r\n]', "", div.img.get("data-src", "")), f"{Toonily.BASE_URL}/") for div in images if div.img.get("data-src")
+                ]
+                if not image_links:
                     image_links = [
-                        (re.sub(r'[\t\r\n]', "", div.img.get("data-src", "")), f"{Toonily.BASE_URL}/") for div in images if div.img.get("data-src")
+                        (re.sub(r'[\t\r\n]', "", div.img.get("src", "")), f"{Toonily.BASE_URL}/") for div in images if div.img.get("src")
                     ]
-                    if not image_links:
-                        image_links = [
-                            (re.sub(r'[\t\r\n]', "", div.img.get("src", "")), f"{Toonily.BASE_URL}/") for div in images if div.img.get("src")
-                        ]
-                    if not image_links:
-                        print(f"No images found for chapter {chap_num}. Skipping.")
-                        continue
-                    print(image_links)
-                    download_chapter_images(image_links, chap_num, path, True)
+                if not image_links:
+                    print(f"No images found for chapter {chap_num}. Skipping.")
+                    return None
+                print(image_links)
+                _, ch_path = download_chapter_images(image_links, chap_num, path, True, cache_key=("Toonily", chap_id_val))
+                return ch_path
+
+            run_chapters(ids, download_chapter, Toonily.BASE_URL, update_progress, on_chapter)
             return path
         except Exception as e:
             shutil.rmtree(path, ignore_errors=True)
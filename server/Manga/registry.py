@@ -0,0 +1,149 @@
+import importlib
+import os
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+
+load_dotenv()
+
+
+class SourceSpec(BaseModel):
+    """
+    Declares a manga source, its plugin class is only imported on first use.
+
+    Attributes:
+        id: Source number used by the API and the frontend.
+        name: Display name.
+        module: Module of the plugin class.
+        class_name: Name of the plugin class in `module`.
+        base_url: Website of the source, checked by /status.
+        browser: Whether the plugin drives a SeleniumBase browser.
+        capabilities: Operations the plugin implements ("search", "chapters", "download"), and "async"
+                      for plugins that also provide `asearch` and `aget_chapters`,
+                      "data-saver" for plugins that can download compressed pages (`quality="data-saver"`).
+        concurrency: Chapters of the source fetched at the same time by one worker process.
+        multiplier: Cost of a chapter relative to MangaDex, scales the task time limits.
+        rate_limit: Requests per second allowed towards the source, None for no limit.
+        max_inflight: Simultaneous requests towards the source, None for no limit.
+        hosts: Other hosts the plugin sends its requests to, limited like `base_url`.
+        retries: Retries of a failed request to the source, None for `Utils.retry.RETRY_ATTEMPTS`.
+    """
+
+    id: int = Field(..., description="Source number")
+    name: str = Field(..., description="Display name of the source")
+    module: str = Field(..., description="Module of the plugin class")
+    class_name: str = Field(..., description="Plugin class in the module")
+    base_url: str = Field(..., description="Website of the source")
+    browser: bool = Field(False, description="Whether the plugin needs a browser")
+    capabilities: List[str] = Field(["search", "chapters", "download"], description="Implemented operations")
+    concurrency: int = Field(3, description="Chapters fetched at the same time per worker process")
+    multiplier: float = Field(1.0, description="Cost of a chapter relative to MangaDex")
+    rate_limit: Optional[float] = Field(None, description="Requests per second towards the source")
+    max_inflight: Optional[int] = Field(None, description="Simultaneous requests towards the source")
+    hosts: List[str] = Field([], description="Other hosts requested by the plugin")
+    retries: Optional[int] = Field(None, description="Retries of a failed request")
+
+    class Config:
+        frozen = True
+
+
+# Host of the Consumet container scraping Mangahere and Mangapill for their plugins
+MANGAPI_HOST = urlparse(os.getenv("MANGAPI_URL") or "http://mangapi").hostname
+
+# Plugins of JSON API sources, awaited natively by the API
+ASYNC_CAPABILITIES = ["search", "chapters", "download", "async"]
+
+SOURCES: Dict[int, SourceSpec] = {spec.id: spec for spec in [
+    SourceSpec(id=0, name="MangaDex", module="Manga.MangaDex", class_name="MangaDex",
+               capabilities=ASYNC_CAPABILITIES + ["data-saver"],
+               base_url="https://api.mangadex.org", concurrency=4, multiplier=1, rate_limit=5, max_inflight=10),
+    SourceSpec(id=1, name="Manhuaus", module="Manga.Manhuaus", class_name="Manhuaus",
+               base_url="https://manhuaus.com", browser=True, multiplier=1.4, rate_limit=3, max_inflight=6,
+               retries=2),
+    SourceSpec(id=2, name="Yakshascans", module="Manga.Yakshascans", class_name="Yaksha",
+               base_url="https://yakshascans.com", browser=True, multiplier=1.3, rate_limit=3, max_inflight=6,
+               retries=2),
+    SourceSpec(id=3, name="Asurascans", module="Manga.Asurascans", class_name="Asura",
+               base_url="https://asuracomic.net", browser=True, concurrency=2, multiplier=1.3),
+    SourceSpec(id=4, name="Kunmanga", module="Manga.Kunmanga", class_name="Kunmanga",
+               base_url="https://kunmanga.com", browser=True, multiplier=1.2, rate_limit=3, max_inflight=6,
+               retries=2),
+    SourceSpec(id=5, name="Toonily", module="Manga.Toonily", class_name="Toonily",
+               base_url="https://toonily.com", browser=True, multiplier=1.4, rate_limit=3, max_inflight=6,
+               retries=2),
+    SourceSpec(id=6, name="Toongod", module="Manga.Toongod", class_name="Toongod",
+               base_url="https://toongod.org", browser=True, multiplier=1.4, rate_limit=3, max_inflight=6,
+               retries=2),
+    SourceSpec(id=7, name="Mangahere", module="Manga.Mangahere", class_name="Mangahere",
+               capabilities=ASYNC_CAPABILITIES,
+               base_url="https://mangahere.cc", concurrency=4, multiplier=1.15,
+               hosts=[MANGAPI_HOST], rate_limit=10, max_inflight=8, retries=4),
+    SourceSpec(id=8, name="Mangapill", module="Manga.Mangapill", class_name="Mangapill",
+               capabilities=ASYNC_CAPABILITIES,
+               base_url="https://mangapill.com", concurrency=4, multiplier=1.15,
+               hosts=[MANGAPI_HOST], rate_limit=10, max_inflight=8, retries=4),
+    SourceSpec(id=9, name="Bato", module="Manga.Bato", class_name="Bato",
+               capabilities=ASYNC_CAPABILITIES,
+               base_url="https://bato.si", concurrency=4, multiplier=1, rate_limit=5, max_inflight=8),
+    SourceSpec(id=10, name="Weebcentral", module="Manga.Weebcentral", class_name="Weeb",
+               base_url="https://weebcentral.com", browser=True, concurrency=2, multiplier=1.3),
+]}
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def get_source(source) -> SourceSpec:
+    """
+    Returns the declaration of a source.
+
+    Args:
+        source: Source number, as int or str.
+
+    Raises:
+        ValueError: If there is no such source.
+    """
+    try:
+        return SOURCES[int(source)]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
+
+
+def load_source(source, capability: str = None):
+    """
+    Imports the plugin class of a source on first use.
+
+    Args:
+        source: Source number, as int or str.
+        capability (str, optional): Operation the caller needs, e.g. "download".
+
+    Returns:
+        The plugin class, e.g. `Manga.MangaDex.MangaDex`.
+
+    Raises:
+        ValueError: If there is no such source or it doesn't support `capability`.
+    """
+    spec = get_source(source)
+    if capability and capability not in spec.capabilities:
+        raise ValueError(f"Source {spec.name} does not support {capability}.")
+    plugin = _loaded.get(spec.id)
+    if plugin is None:
+        with _load_lock:
+            plugin = _loaded.get(spec.id)
+            if plugin is None:
+                plugin = _loaded[spec.id] = getattr(importlib.import_module(spec.module), spec.class_name)
+    return plugin
+
+
+def find_source(url: str) -> Optional[SourceSpec]:
+    """
+    Returns the source whose website or API (`hosts`) hosts `url`, or None.
+    """
+    host = urlparse(url).hostname or url
+    host = host[4:] if host.startswith("www.") else host
+    for spec in SOURCES.values():
+        if urlparse(spec.base_url).hostname == host or host in spec.hosts:
+            return spec
+    return None
@@ -36,5 +36,7 @@ celery_app.conf.update(
 # Configuration for download tasks
 celery_app.conf.task_routes = {
     "Queue.tasks.download_chapters": {"queue": "downloads"},
+    "Queue.tasks.download_chapter": {"queue": "downloads"},
+    "Queue.tasks.package_chapters": {"queue": "downloads"},
     "Queue.tasks.cleanup_task": {"queue": "cleanup"},
 }
\ No newline at end of file
@@ -1,9 +1,15 @@
 from Queue.celery_app import celery_app
 import ArchiveGen
+from Utils import artifact_cache, single_flight
+from Utils.browser_pool import close_browsers
+from Utils.retry import job_budget
 import os
 import shutil
 import logging
-from typing import List, Dict, Any
+import uuid
+from typing import List, Dict, Any, Optional
+from celery import chord
+from celery.signals import worker_process_shutdown
 from dotenv import load_dotenv
 from redis import Redis
 
@@ -24,9 +30,23 @@ logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 redis_client = Redis.from_url(REDIS_URL)
 
+# Requests with at least this many chapters are split into one subtask per chapter, 0 disables it
+FANOUT_MIN_CHAPTERS = int(os.getenv("FANOUT_MIN_CHAPTERS", 10))
+# Retries of a single chapter before it is skipped
+CHAPTER_MAX_RETRIES = int(os.getenv("CHAPTER_MAX_RETRIES", 2))
+
+
+@worker_process_shutdown.connect
+def shutdown_browsers(**kwargs):
+    """
+    Closes the pooled browsers of a worker process, pool processes don't run atexit handlers.
+    """
+    close_browsers()
+
 
 @celery_app.task(bind=True, name="Queue.tasks.download_chapters")
-def download_chapters(self, ids: List[str], source: str, comic_title: str = "Chapters", format: str = "pdf") -> Dict[str, Any]:
+def download_chapters(self, ids: List[str], source: str, comic_title: str = "Chapters", format: str = "pdf",
+                      quality: str = "data") -> Dict[str, Any]:
     """
     Celery task to download chapters in the background.
     
@@ -35,11 +55,13 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
         source: Source identifier (number)
         comic_title: Title of the comic
         format: Format of the comic
+        quality: Image quality (data, data-saver)
     
     Returns:
         Dict with task status information
     """
     task_id = self.request.id  # Use the actual Celery task ID
+    cache_key = artifact_cache.job_key(ids, source, format, comic_title, quality)
     
     def progress_callback(progress: int, status: str):
         """Callback for updating task progress"""
@@ -58,6 +80,19 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
     
     try:
         print(f"DEBUG: Starting task {task_id} for {len(ids)} chapters" if debug else "")
+
+        # The same archive may have been built while this task was waiting in the queue
+        cached = artifact_cache.lookup(cache_key)
+        if cached:
+            logger.info(f"Task {task_id}: serving cached archive {cached['zip_path']}")
+            return {
+                "task_id": task_id,
+                "status": "SUCCESS",
+                "zip_path": cached["zip_path"],
+                "file_size": cached["file_size"],
+                "total_chapters": len(ids),
+                "comic_title": comic_title
+            }
         
         # Update task status
         self.update_state(
@@ -77,7 +112,8 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
         progress_callback(10, "Testing callback...")
         
         # Call the download function from pdf_gen with progress callback
-        zip_path = ArchiveGen.get_chapter_images(ids, source, progress_callback,comic_title, comic_f=format)
+        with job_budget(len(ids)):
+            zip_path = ArchiveGen.get_chapter_images(ids, source, progress_callback,comic_title, comic_f=format, quality=quality)
         
         print(f"DEBUG: get_chapter_images finished, zip_path: {zip_path}" if debug else "")
         
@@ -87,6 +123,12 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
         # Check if the ZIP file exists
         if not os.path.exists(zip_path):
             raise Exception("ZIP file was not created")
+
+        # Keep the archive for identical requests, the rest of the job directory is no longer needed
+        tmpdir = os.path.dirname(zip_path)
+        zip_path = artifact_cache.store(cache_key, zip_path)
+        if artifact_cache.is_cached(zip_path):
+            shutil.rmtree(tmpdir, ignore_errors=True)
         
         file_size = os.path.getsize(zip_path)
         
@@ -108,8 +150,10 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
         
         logger.info(f"Download completed successfully. File: {zip_path}, Size: {file_size} bytes")
         
-        tmpdir = os.path.dirname(zip_path)
-        redis_client.set(f"task_tmpdir:{task_id}", tmpdir)
+        if not artifact_cache.is_cached(zip_path):
+            redis_client.set(f"task_tmpdir:{task_id}", tmpdir)
+            # Not cached, every requester attached to this task downloads this file before it is removed
+            artifact_cache.acquire(zip_path, single_flight.requesters(task_id))
         
         return {
             "task_id": task_id,
@@ -143,12 +187,214 @@ def download_chapters(self, ids: List[str], source: str, comic_title: str = "Cha
             "error": str(e),
             "comic_title": comic_title
         }
+    finally:
+        # Later identical requests are served from the artifact cache or start a new task
+        single_flight.release(cache_key, task_id)
+
+
+def start_fanout(ids: List[str], source: str, comic_title: str, format: str, job_id: str,
+                 chapter_time_limits: tuple, package_time_limits: tuple, quality: str = "data") -> str:
+    """
+    Queues a download as one `download_chapter` subtask per chapter and a `package_chapters`
+    chord callback that builds the archive once every chapter is done.
+
+    Args:
+        ids: List of chapter IDs to download
+        source: Source identifier (number)
+        comic_title: Title of the comic
+        format: Format of the comic
+        job_id: Task ID of the chord callback, used by the client to track the whole job
+        chapter_time_limits: (soft, hard) time limit of every chapter subtask
+        package_time_limits: (soft, hard) time limit of the packaging callback
+        quality: Image quality (data, data-saver)
+
+    Returns:
+        str: The job ID
+    """
+    # Subtasks may run on any worker, so the job directory has to live on the shared Downloads volume
+    job_dir = f"Downloads/{uuid.uuid4().hex}"
+    os.makedirs(job_dir, exist_ok=True)
+    redis_client.set(f"task_tmpdir:{job_id}", job_dir)
+
+    subtask_ids = [str(uuid.uuid4()) for _ in ids]
+    redis_client.rpush(f"job_subtasks:{job_id}", *subtask_ids)
+    redis_client.expire(f"job_subtasks:{job_id}", package_time_limits[1] + chapter_time_limits[1] * len(ids))
+
+    header = [
+        download_chapter.s(chap_id, source, job_id, job_dir, len(ids), comic_title, quality).set(
+            task_id=subtask_id,
+            soft_time_limit=chapter_time_limits[0],
+            time_limit=chapter_time_limits[1]
+        )
+        for chap_id, subtask_id in zip(ids, subtask_ids)
+    ]
+    callback = package_chapters.s(job_dir, ids, source, comic_title, format, quality).set(
+        task_id=job_id,
+        soft_time_limit=package_time_limits[0],
+        time_limit=package_time_limits[1]
+    )
+    # A subtask killed by its time limit or a lost worker fails the chord, the callback then never runs
+    cache_key = artifact_cache.job_key(ids, source, format, comic_title, quality)
+    callback.on_error(fanout_failed.s(job_dir, cache_key))
+    chord(header)(callback)
+    return job_id
+
+
+@celery_app.task(bind=True, name="Queue.tasks.download_chapter")
+def download_chapter(self, chap_id: str, source: str, job_id: str, job_dir: str, total_chapters: int,
+                     comic_title: str = "Chapters", quality: str = "data") -> Optional[str]:
+    """
+    Celery subtask downloading a single chapter of a fan-out job into the job directory.
+
+    A failing chapter is retried on its own. After `CHAPTER_MAX_RETRIES` it is skipped,
+    like the sources skip chapters they can't scrape.
+
+    Returns:
+        Path to the chapter directory, or None if the chapter was skipped
+    """
+    try:
+        with job_budget(1):
+            path = ArchiveGen.download_chapters(source, [chap_id], quality=quality)
+    except Exception as e:
+        if self.request.retries < CHAPTER_MAX_RETRIES:
+            logger.warning(f"Job {job_id}: retrying chapter {chap_id}: {e}")
+            raise self.retry(exc=e, countdown=5 * 2 ** self.request.retries)
+        logger.error(f"Job {job_id}: skipping chapter {chap_id}: {e}")
+        path = None
+
+    ch_path = None
+    if path:
+        # The source created its own directory, move the chapter into the shared job directory
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                ch_path = os.path.join(job_dir, entry.name)
+                shutil.rmtree(ch_path, ignore_errors=True)
+                shutil.move(entry.path, ch_path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    done = redis_client.incr(f"job_done:{job_id}")
+    redis_client.expire(f"job_done:{job_id}", 24 * 60 * 60)
+    self.backend.store_result(job_id, {
+        "task_id": job_id,
+        "status": f"Downloaded {done}/{total_chapters} chapters",
+        "progress": int(done / total_chapters * 90),
+        "total_chapters": total_chapters,
+        "comic_title": comic_title
+    }, "PROGRESS")
+    return ch_path
+
+
+@celery_app.task(bind=True, name="Queue.tasks.package_chapters")
+def package_chapters(self, ch_paths: List[Optional[str]], job_dir: str, ids: List[str], source: str,
+                     comic_title: str = "Chapters", format: str = "pdf", quality: str = "data") -> Dict[str, Any]:
+    """
+    Chord callback of a fan-out job, builds the archive from the downloaded chapters.
+
+    Args:
+        ch_paths: Results of the `download_chapter` subtasks, in chapter order
+        job_dir: Job directory holding the chapters
+        ids: List of chapter IDs of the job
+        source: Source identifier (number)
+        comic_title: Title of the comic
+        format: Format of the comic
+        quality: Image quality (data, data-saver)
+
+    Returns:
+        Dict with task status information, same as `download_chapters`
+    """
+    task_id = self.request.id
+    cache_key = artifact_cache.job_key(ids, source, format, comic_title, quality)
+    try:
+        ch_paths = [ch_path for ch_path in ch_paths if ch_path and os.path.isdir(ch_path)]
+        if not ch_paths:
+            raise Exception("None of the chapters could be downloaded")
+
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "task_id": task_id,
+                "status": f"Creating {ArchiveGen.FORMAT_NAMES.get(format, 'PDF')}...",
+                "progress": 95,
+                "total_chapters": len(ids),
+                "comic_title": comic_title
+            }
+        )
+        zip_path = ArchiveGen.package_chapters(job_dir, ch_paths, format, comic_title)
+        if not zip_path or not os.path.exists(zip_path):
+            raise Exception("ZIP file was not created")
+
+        zip_path = artifact_cache.store(cache_key, zip_path)
+        if artifact_cache.is_cached(zip_path):
+            shutil.rmtree(job_dir, ignore_errors=True)
+            redis_client.delete(f"task_tmpdir:{task_id}")
+        else:
+            artifact_cache.acquire(zip_path, single_flight.requesters(task_id))
+        file_size = os.path.getsize(zip_path)
+
+        logger.info(f"Job {task_id} completed successfully. File: {zip_path}, Size: {file_size} bytes")
+        return {
+            "task_id": task_id,
+            "status": "SUCCESS",
+            "zip_path": zip_path,
+            "file_size": file_size,
+            "total_chapters": len(ids),
+            "comic_title": comic_title
+        }
+
+    except Exception as e:
+        logger.error(f"Error during packaging of job {task_id}: {str(e)}")
+        self.update_state(
+            state="FAILURE",
+            meta={
+                "task_id": task_id,
+                "status": f"Error: {str(e)}",
+                "error": str(e),
+                "comic_title": comic_title
+            }
+        )
+        shutil.rmtree(job_dir, ignore_errors=True)
+        redis_client.delete(f"task_tmpdir:{task_id}")
+        return {
+            "task_id": task_id,
+            "status": "FAILURE",
+            "error": str(e),
+            "comic_title": comic_title
+        }
+    finally:
+        redis_client.delete(f"job_done:{task_id}", f"job_subtasks:{task_id}")
+        single_flight.release(cache_key, task_id)
+
+
+@celery_app.task(name="Queue.tasks.fanout_failed")
+def fanout_failed(request, exc, traceback, job_dir: str, cache_key: str) -> None:
+    """
+    Error callback of a fan-out job, cleans up what `package_chapters` would have.
+
+    Celery calls it with the request of the `package_chapters` callback when a chapter
+    subtask failed instead of returning, so the job can't be packaged.
+
+    Args:
+        request: Request of the chord callback, its ID is the job ID
+        exc: Error of the failed subtask
+        traceback: Traceback of the error
+        job_dir: Job directory holding the chapters
+        cache_key: Request key the job claimed in `single_flight`
+    """
+    job_id = request.id
+    logger.error(f"Job {job_id} failed before packaging: {exc}")
+    shutil.rmtree(job_dir, ignore_errors=True)
+    redis_client.delete(f"task_tmpdir:{job_id}", f"job_done:{job_id}", f"job_subtasks:{job_id}")
+    single_flight.release(cache_key, job_id)
 
 
 @celery_app.task(name="Queue.tasks.cleanup_task")
 def cleanup_task(zip_path: str) -> Dict[str, Any]:
     """
     Celery task to clean up temporary files.
+
+    Archives from the artifact cache are only released, they are removed by the cache
+    eviction once no other download is streaming them. Other archives are removed once
+    every requester of their task has downloaded them.
     
     Args:
         zip_path: Path to the ZIP file to remove
@@ -157,6 +403,20 @@ def cleanup_task(zip_path: str) -> Dict[str, Any]:
         Dict with task status information
     """
     try:
+        if artifact_cache.is_cached(zip_path):
+            artifact_cache.release(zip_path)
+            artifact_cache.evict()
+            return {
+                "status": "SUCCESS",
+                "message": f"Released cached file: {zip_path}"
+            }
+
+        if artifact_cache.release(zip_path) > 0:
+            return {
+                "status": "SUCCESS",
+                "message": f"Kept file for the other requesters: {zip_path}"
+            }
+
         if os.path.exists(zip_path):
             # Remove the ZIP file
             os.remove(zip_path)
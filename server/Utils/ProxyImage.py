@@ -1,11 +1,199 @@
-from fastapi.responses import StreamingResponse
+import asyncio
+import hashlib
 import io
-import requests as req
-from Utils.bot_evasion import get_cookies, load_cf_cookies, delete_cf_cookies
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Mapping, Optional
+import aiohttp
+from fastapi import Response
+from fastapi.responses import FileResponse, StreamingResponse
+from PIL import Image, features
+from Utils.http_session import get_aiohttp_session
+from Utils.rate_limit import aacquire
+from Utils.retry import is_retryable, retry_delay, should_retry
+from Utils.bot_evasion import load_cf_cookies, load_cf_user_agent
 
 
-def proxy_image(url: str, header: str = None):
+# Covers fetched through the proxy, kept on disk next to the other caches
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", "Downloads/.covers")
+# How long a cached cover is served without asking the source again (seconds), 0 disables the cache
+COVER_CACHE_TTL = int(os.getenv("COVER_CACHE_TTL", 7 * 24 * 60 * 60))
+# Size budget of the cached covers
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+# Largest cover written to the cache, bigger bodies are relayed but not kept
+COVER_MAX_BYTES = int(os.getenv("COVER_MAX_BYTES", 20 * 1024 ** 2))
+# Browser cache lifetime sent in Cache-Control (seconds)
+COVER_MAX_AGE = int(os.getenv("COVER_MAX_AGE", 24 * 60 * 60))
+# Resized covers: widest thumbnail served, default encoder quality and resizing threads
+THUMBNAIL_MAX_WIDTH = int(os.getenv("THUMBNAIL_MAX_WIDTH", 1024))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 75))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", os.cpu_count() or 1))
+# Largest image resized, checked from the header before the pixels are decoded (decompression bombs)
+THUMBNAIL_MAX_PIXELS = int(os.getenv("THUMBNAIL_MAX_PIXELS", 50 * 1000 ** 2))
+CHUNK_SIZE = 64 * 1024
+# Minimum number of seconds between two eviction passes
+EVICT_INTERVAL = 600
 
+_last_evict = 0.0
+# Pillow releases the GIL while resizing and encoding, threads keep the event loop free
+thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+
+def _cover_paths(url: str) -> tuple:
+    key = hashlib.sha256(url.encode()).hexdigest()
+    base = os.path.join(COVER_CACHE_DIR, key[:2], key)
+    return base, f"{base}.json"
+
+
+def _read_meta(meta_path: str) -> Optional[dict]:
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path: str, meta: dict) -> None:
+    tmp_meta = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+
+
+def _cache_headers(meta: dict) -> dict:
+    headers = {"Cache-Control": f"public, max-age={COVER_MAX_AGE}", "ETag": meta["etag"]}
+    if meta.get("last_modified"):
+        headers["Last-Modified"] = meta["last_modified"]
+    return headers
+
+
+def _not_modified(meta: dict, request_headers: Optional[Mapping]) -> bool:
+    """
+    Whether the browser already has the cached cover, from its conditional request headers.
+    """
+    if not request_headers:
+        return False
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        return meta["etag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    return bool(meta.get("last_modified")) and request_headers.get("if-modified-since") == meta["last_modified"]
+
+
+def _serve_cached(body_path: str, meta: dict, request_headers: Optional[Mapping]) -> Response:
+    headers = _cache_headers(meta)
+    if _not_modified(meta, request_headers):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(body_path, media_type=meta["content_type"], headers=headers)
+
+
+def _evict() -> None:
+    """
+    Removes the least recently used covers while the cache is over `COVER_CACHE_MAX_BYTES`.
+    """
+    if not os.path.isdir(COVER_CACHE_DIR):
+        return
+
+    covers = []
+    for prefix in os.scandir(COVER_CACHE_DIR):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.name.endswith((".json", ".tmp")):
+                continue
+            stat = entry.stat()
+            covers.append((stat.st_mtime, entry.path, stat.st_size))
+
+    total = sum(cover[2] for cover in covers)
+    for _, body_path, size in sorted(covers):
+        if total <= COVER_CACHE_MAX_BYTES:
+            break
+        for path in (body_path, f"{body_path}.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def _schedule_evict() -> None:
+    """
+    Runs `_evict` in the background, at most once every `EVICT_INTERVAL` seconds.
+    """
+    global _last_evict
+    if time.time() - _last_evict < EVICT_INTERVAL:
+        return
+    _last_evict = time.time()
+    asyncio.get_running_loop().run_in_executor(None, _evict)
+
+
+def _fresh_meta(body_path: str, meta_path: str) -> tuple:
+    """
+    Reads the cached meta of a cover, runs in a thread.
+
+    Returns:
+        tuple: (meta, fresh) where meta is None if the cover isn't cached, fresh covers are
+               moved to the end of the LRU order.
+    """
+    meta = _read_meta(meta_path)
+    if meta and not os.path.exists(body_path):
+        return None, False
+    if meta and time.time() - meta["fetched_at"] < COVER_CACHE_TTL:
+        os.utime(body_path)
+        return meta, True
+    return meta, False
+
+
+def _revalidated(body_path: str, meta_path: str, meta: dict) -> None:
+    """
+    Marks a stale cover as fresh again after the source answered 304, runs in a thread.
+    """
+    meta["fetched_at"] = time.time()
+    _write_meta(meta_path, meta)
+    os.utime(body_path)
+
+
+def _touch(path: str) -> bool:
+    """
+    Moves a cached file to the end of the LRU order, returns False if it doesn't exist.
+    """
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _open_part(body_path: str):
+    os.makedirs(os.path.dirname(body_path), exist_ok=True)
+    part_path = f"{body_path}.{uuid.uuid4().hex}.tmp"
+    return part_path, open(part_path, "wb")
+
+
+def _commit_part(part, part_path: str, body_path: str, meta_path: str, meta: dict) -> None:
+    """
+    Moves a fully received cover into the cache, runs in a thread.
+    """
+    part.close()
+    os.replace(part_path, body_path)
+    _write_meta(meta_path, meta)
+
+
+def _discard_part(part, part_path: str) -> None:
+    part.close()
+    try:
+        os.remove(part_path)
+    except OSError:
+        pass
+
+
+def _request_options(url: str, header: str = None) -> tuple:
+    """
+    Headers and Cloudflare cookies needed to fetch an image from its source.
+    """
     cookies_dict = None
     if header:
         header = {"Referer": header}
@@ -13,7 +201,8 @@ def proxy_image(url: str, header: str = None):
     if "toongod" in url:
         cookies_dict = load_cf_cookies("https://www.toongod.org/?s=&post_type=wp-manga")
         header = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 OPR/119.0.0.0",
+            # Cloudflare only accepts the cookies with the User-Agent of the browser that got them
+            "User-Agent": load_cf_user_agent(url) or "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 OPR/119.0.0.0",
             "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
             "Accept-Encoding": "gzip, deflate, br, zstd",
             "Accept-Language": "en-US,en;q=0.9",
@@ -21,16 +210,254 @@ def proxy_image(url: str, header: str = None):
         }
     elif "toonily" in url:
         cookies_dict = load_cf_cookies("https://toonily.com")
+        user_agent = load_cf_user_agent("https://toonily.com")
+        if user_agent:
+            header = {**(header or {}), "User-Agent": user_agent}
+    return header or {}, cookies_dict or None
+
+
+def _negotiate_format(request_headers: Optional[Mapping]) -> str:
+    """
+    Picks the smallest thumbnail format the browser accepts.
+    """
+    accept = request_headers.get("accept", "") if request_headers else ""
+    if "image/avif" in accept and features.check("avif"):
+        return "avif"
+    if "image/webp" in accept:
+        return "webp"
+    return "jpeg"
+
+
+def _make_thumbnail(source, width: int, quality: int, fmt: str, target: str = None) -> Optional[bytes]:
+    """
+    Downscales an image to `width` pixels, runs on `thumbnail_executor`.
+
+    Args:
+        source: Path or file object of the full-size image.
+        width (int): Maximum width, the aspect ratio is kept and images are never upscaled.
+        quality (int): Encoder quality, 1-100.
+        fmt (str): Output format, "avif", "webp" or "jpeg".
+        target (str, optional): Where to write the thumbnail. If not given, it is returned instead.
+
+    Returns:
+        Optional[bytes]: The encoded thumbnail when no target is given.
+
+    Raises:
+        Exception: If the image has more than `THUMBNAIL_MAX_PIXELS` pixels.
+    """
+    with Image.open(source) as im:
+        if im.width * im.height > THUMBNAIL_MAX_PIXELS:
+            raise Exception(f"Image too large to resize: {im.width}x{im.height}")
+        im.thumbnail((width, width * 10))
+        if fmt == "jpeg" and im.mode != "RGB":
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA")
+        out = io.BytesIO()
+        im.save(out, format=fmt.upper(), quality=quality)
+
+    if target is None:
+        return out.getvalue()
+    tmp_target = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_target, "wb") as f:
+        f.write(out.getbuffer())
+    os.replace(tmp_target, target)
+    return None
+
+
+async def _fetch_source(url: str, header: str, body_path: str, meta_path: str) -> tuple:
+    """
+    Returns the cached cover if it is fresh, otherwise asks the source for it.
+
+    Stale covers are revalidated with the validators of the source (ETag / Last-Modified),
+    and still served when the source can't be reached or answers with an error.
+
+    Returns:
+        tuple: (meta, response, release) where meta is set when the cached cover can be served,
+               response is the aiohttp response of a new image and release frees its rate limit
+               slot once the body is read, or (None, None, None) if the source didn't return the image.
+    """
+    meta = None
+    if COVER_CACHE_TTL > 0:
+        meta, fresh = await asyncio.to_thread(_fresh_meta, body_path, meta_path)
+        if fresh:
+            return meta, None, None
+
+    headers, cookies_dict = await asyncio.to_thread(_request_options, url, header)
+    if meta:
+        # Stale cover, ask the source whether it changed
+        if meta.get("source_etag"):
+            headers["If-None-Match"] = meta["source_etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
 
+    session = get_aiohttp_session()
+    attempt = 0
+    while True:
+        # The rate limit slot is held while the body streams, `_tee` releases it
+        release = await aacquire(url)
+        try:
+            response = await session.get(url, headers=headers, cookies=cookies_dict)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await release()
+            # A stale cover is better than none while the source is unreachable, only missing covers are retried
+            if meta or not should_retry(url, attempt):
+                print(f"Error proxying image: {e}")
+                return meta, None, None
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
+            continue
+        except BaseException:
+            await release()
+            raise
+        if meta or not is_retryable(response.status, response.headers) or not should_retry(url, attempt):
+            break
+        response.release()
+        await release()
+        await asyncio.sleep(retry_delay(attempt, response.headers))
+        attempt += 1
+
+    if response.status != 200:
+        response.release()
+        await release()
+    if response.status == 304 and meta:
+        await asyncio.to_thread(_revalidated, body_path, meta_path, meta)
+        return meta, None, None
+    if response.status != 200:
+        # Source errors fall back to the stale cover as well
+        return meta, None, None
+    return None, response, release
+
+
+async def _tee(response: aiohttp.ClientResponse, release, body_path: str, meta_path: str):
+    """
+    Yields the body of a source response in chunks while writing it into the cover cache.
+
+    Only images of at most `COVER_MAX_BYTES` are cached, error pages served with a 200 and
+    oversized bodies are relayed once. The rate limit slot of the request is released with
+    `release` once the body is read.
+    """
+    content_type = response.headers.get("content-type", "image/jpeg")
+    source_etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified") or formatdate(usegmt=True)
+    part_path = None
+    part = None
+    size = 0
+    digest = hashlib.sha256()
     try:
-        response = req.get(url, headers=header, stream=True,
-                           cookies=cookies_dict if cookies_dict else None)
-        if response.status_code == 200:
-            return StreamingResponse(
-                io.BytesIO(response.content),
-                media_type=response.headers.get('content-type', 'image/jpeg')
+        if COVER_CACHE_TTL > 0 and content_type.startswith("image/") and \
+                (response.content_length or 0) <= COVER_MAX_BYTES:
+            part_path, part = await asyncio.to_thread(_open_part, body_path)
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if part and size > COVER_MAX_BYTES:
+                await asyncio.to_thread(_discard_part, part, part_path)
+                part = None
+            if part:
+                await asyncio.to_thread(part.write, chunk)
+                digest.update(chunk)
+            yield chunk
+        if part:
+            await asyncio.to_thread(_commit_part, part, part_path, body_path, meta_path, {
+                "content_type": content_type,
+                "etag": f'"{digest.hexdigest()}"',
+                "source_etag": source_etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time()
+            })
+            part = None
+            _schedule_evict()
+    finally:
+        # Client gone or source failed mid-stream, nothing is cached
+        if part:
+            await asyncio.to_thread(_discard_part, part, part_path)
+        response.release()
+        await release()
+
+
+async def _proxy_thumbnail(url: str, header: str, request_headers: Optional[Mapping],
+                           width: int, quality: int) -> Optional[Response]:
+    """
+    Serves a resized copy of an image, cached by (url, width, quality, format).
+    """
+    fmt = _negotiate_format(request_headers)
+    width = max(16, min(width, THUMBNAIL_MAX_WIDTH))
+    quality = max(1, min(quality, 100))
+    headers = {"Cache-Control": f"public, max-age={COVER_MAX_AGE}", "Vary": "Accept"}
+
+    body_path, meta_path = _cover_paths(url)
+    meta, response, release = await _fetch_source(url, header, body_path, meta_path)
+    loop = asyncio.get_running_loop()
+    if response is not None:
+        # The source image is held in memory until it is resized, within the size of a cached cover
+        chunks = []
+        size = 0
+        tee = _tee(response, release, body_path, meta_path)
+        try:
+            async for chunk in tee:
+                size += len(chunk)
+                if size > COVER_MAX_BYTES:
+                    raise Exception(f"Image larger than {COVER_MAX_BYTES} bytes, not resized")
+                chunks.append(chunk)
+        finally:
+            await tee.aclose()
+        meta = await asyncio.to_thread(_read_meta, meta_path) if COVER_CACHE_TTL > 0 else None
+        if meta is None:
+            # Cover cache disabled, resize from memory
+            data = await loop.run_in_executor(
+                thumbnail_executor, _make_thumbnail, io.BytesIO(b"".join(chunks)), width, quality, fmt
             )
+            return Response(data, media_type=f"image/{fmt}", headers=headers)
+    if meta is None:
         return None
-    except Exception as e:
-        print(f"Error proxying image: {e}")
+
+    # The ETag of the original is part of the name, thumbnails of a replaced cover are left to the LRU
+    etag = meta["etag"].strip('"')[:16]
+    thumb_path = f"{body_path}.{etag}.{width}w{quality}q.{fmt}"
+    thumb_meta = {"etag": f'"{etag}-{width}-{quality}-{fmt}"', "last_modified": meta.get("last_modified")}
+    headers.update(_cache_headers(thumb_meta))
+    if _not_modified(thumb_meta, request_headers):
+        return Response(status_code=304, headers=headers)
+
+    if not await asyncio.to_thread(_touch, thumb_path):
+        await loop.run_in_executor(thumbnail_executor, _make_thumbnail, body_path, width, quality, fmt, thumb_path)
+    return FileResponse(thumb_path, media_type=f"image/{fmt}", headers=headers)
+
+
+async def proxy_image(url: str, header: str = None, request_headers: Optional[Mapping] = None,
+                      width: int = None, quality: int = THUMBNAIL_QUALITY):
+    """
+    Streams an image from its source to the browser, through a disk cache of covers.
+
+    Fresh cached covers are served without contacting the source, stale ones are revalidated
+    with the source. Conditional requests of the browser are answered with 304 Not Modified.
+
+    Args:
+        url (str): URL of the image.
+        header (str, optional): Referer sent to the source.
+        request_headers (Mapping, optional): Headers of the incoming request, for Accept and If-None-Match / If-Modified-Since.
+        width (int, optional): Resize the image to this width, in the best format the browser accepts.
+        quality (int, optional): Encoder quality of resized images.
+
+    Returns:
+        Response: The image, a 304 response, or None if the source didn't return the image.
+    """
+    if width:
+        return await _proxy_thumbnail(url, header, request_headers, width, quality)
+
+    body_path, meta_path = _cover_paths(url)
+    meta, response, release = await _fetch_source(url, header, body_path, meta_path)
+    if meta:
+        return _serve_cached(body_path, meta, request_headers)
+    if response is None:
         return None
+
+    headers = {
+        "Cache-Control": f"public, max-age={COVER_MAX_AGE}",
+        "Last-Modified": response.headers.get("Last-Modified") or formatdate(usegmt=True)
+    }
+    return StreamingResponse(
+        _tee(response, release, body_path, meta_path),
+        media_type=response.headers.get("content-type", "image/jpeg"),
+        headers=headers
+    )
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import List, Optional
+from dotenv import load_dotenv
+from redis import Redis
+
+load_dotenv()
+
+# Finished archives, kept in the Downloads volume shared by the API and the workers
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "Downloads/.artifacts")
+# How long a finished archive is served again for the same request (seconds), 0 disables the cache
+ARTIFACT_CACHE_TTL = int(os.getenv("ARTIFACT_CACHE_TTL", 6 * 60 * 60))
+# Size budget of the cached archives
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+# Safety expiry of the reference counters, in case a download never releases its reference
+REF_TTL = 24 * 60 * 60
+
+REDIS_URL = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+redis_client = Redis.from_url(REDIS_URL)
+
+
+def job_key(ids: List[str], source, format: str, comic_title: str = "Chapters", quality: str = "data") -> str:
+    """
+    Hashes a normalized download request.
+
+    Args:
+        ids: List of chapter IDs, in request order
+        source: Source number
+        format: Output format (pdf, cbz, cbr, epub)
+        comic_title: Title of the comic, only part of the key for formats that embed it
+        quality: Image quality (data, data-saver), only part of the key when not the default
+
+    Returns:
+        str: Hex digest identifying the requested archive.
+    """
+    format = (format or "pdf").lower()
+    request = {
+        "source": str(int(source)),
+        "ids": [str(chap_id).strip() for chap_id in ids],
+        "format": format,
+        "title": comic_title if format in ("cbz", "epub") else None,
+    }
+    if quality and quality != "data":
+        request["quality"] = quality
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def _meta_key(key: str) -> str:
+    return f"artifact:{key}"
+
+
+def _ref_key(path: str) -> str:
+    return f"artifact_refs:{os.path.abspath(path)}"
+
+
+def is_cached(path: str) -> bool:
+    """
+    Whether `path` points into the artifact cache.
+    """
+    cache_dir = os.path.abspath(ARTIFACT_CACHE_DIR)
+    return os.path.abspath(path).startswith(cache_dir + os.sep)
+
+
+def lookup(key: str) -> Optional[dict]:
+    """
+    Returns the cached archive of a request.
+
+    Returns:
+        Optional[dict]: `zip_path` and `file_size` of the archive, or None on a miss.
+    """
+    if ARTIFACT_CACHE_TTL <= 0:
+        return None
+    try:
+        meta = redis_client.get(_meta_key(key))
+        if not meta:
+            return None
+        meta = json.loads(meta)
+        if not os.path.exists(meta["zip_path"]):
+            redis_client.delete(_meta_key(key))
+            return None
+    except Exception as e:
+        print(f"Error reading artifact cache: {e}")
+        return None
+    return meta
+
+
+def store(key: str, zip_path: str) -> str:
+    """
+    Moves a finished archive into the cache.
+
+    Args:
+        key: Request key from `job_key`
+        zip_path: Path to the generated archive
+
+    Returns:
+        str: The new path of the archive, or `zip_path` if the cache is disabled or unavailable.
+    """
+    if ARTIFACT_CACHE_TTL <= 0:
+        return zip_path
+    target_dir = os.path.join(ARTIFACT_CACHE_DIR, key)
+    target = os.path.join(target_dir, os.path.basename(zip_path))
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.move(zip_path, target)
+        meta = {"zip_path": target, "file_size": os.path.getsize(target)}
+        redis_client.set(_meta_key(key), json.dumps(meta), ex=ARTIFACT_CACHE_TTL)
+    except Exception as e:
+        print(f"Failed to cache artifact {zip_path}: {e}")
+        return target if os.path.exists(target) else zip_path
+    evict(keep=key)
+    return target
+
+
+def acquire(path: str, count: int = 1) -> None:
+    """
+    Marks an archive as being streamed, so it isn't evicted meanwhile.
+
+    Archives outside the cache are held for every requester of their task, see `Queue.tasks.cleanup_task`.
+    """
+    ref_key = _ref_key(path)
+    pipe = redis_client.pipeline()
+    pipe.incrby(ref_key, count)
+    pipe.expire(ref_key, REF_TTL)
+    pipe.execute()
+
+
+def release(path: str) -> int:
+    """
+    Drops a reference taken by `acquire`.
+
+    Returns:
+        int: Number of references left.
+    """
+    ref_key = _ref_key(path)
+    refs = redis_client.decr(ref_key)
+    if refs <= 0:
+        redis_client.delete(ref_key)
+    return max(refs, 0)
+
+
+def _refs(path: str) -> int:
+    refs = redis_client.get(_ref_key(path))
+    return int(refs) if refs else 0
+
+
+def evict(keep: str = None) -> None:
+    """
+    Removes expired archives and, while the cache is over `ARTIFACT_CACHE_MAX_BYTES`, the oldest ones.
+
+    Archives that are still being streamed are never removed.
+
+    Args:
+        keep: Key of an archive to leave in place, the one `store` just added
+    """
+    if not os.path.isdir(ARTIFACT_CACHE_DIR):
+        return
+
+    entries = []
+    for entry in os.scandir(ARTIFACT_CACHE_DIR):
+        if not entry.is_dir():
+            continue
+        files = [f for f in os.scandir(entry.path) if f.is_file()]
+        size = sum(f.stat().st_size for f in files)
+        entries.append((entry.stat().st_mtime, entry.name, entry.path, files, size))
+
+    total = sum(entry[4] for entry in entries)
+    now = time.time()
+    for mtime, key, path, files, size in sorted(entries):
+        expired = not redis_client.exists(_meta_key(key)) and now - mtime > 60
+        if not expired and total <= ARTIFACT_CACHE_MAX_BYTES:
+            continue
+        if key == keep or any(_refs(f.path) for f in files):
+            continue
+        redis_client.delete(_meta_key(key))
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
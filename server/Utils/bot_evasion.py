@@ -1,4 +1,12 @@
-from seleniumbase import SB
+from Utils.browser_pool import lease_browser
+from Utils.deadline import cap
+from Utils.http_session import http_get, http_post
+from Utils.rate_limit import throttle
+from bs4 import BeautifulSoup
+from typing import Optional
+from urllib.parse import urlparse
+import requests as req
+import threading
 import redis
 import os
 import json
@@ -8,6 +16,37 @@ redis_url =  os.getenv("REDIS_URL", "redis://redis:6379/1")
 
 redis_client = redis.Redis.from_url(redis_url)
 
+# Lifetime of harvested Cloudflare cookies in Redis (seconds)
+CF_COOKIE_TTL = int(os.getenv("CF_COOKIE_TTL", 1800))
+# Cookies expiring sooner than this are refreshed by a browser in the background
+CF_COOKIE_REFRESH_BEFORE = int(os.getenv("CF_COOKIE_REFRESH_BEFORE", 300))
+# How long a worker harvesting cookies holds the lock of a domain, and how long others wait for it (seconds)
+CF_LOCK_TIMEOUT = int(os.getenv("CF_LOCK_TIMEOUT", 120))
+# Markers of a Cloudflare challenge page
+CHALLENGE_MARKERS = ("Just a moment...", "cf-chl-", "challenge-platform", "cf_chl_opt")
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _cookie_host(domain: str) -> str:
+    """
+    Normalizes a URL or domain to the host cookies are stored under, e.g. "toongod.org".
+    """
+    host = urlparse(domain if "://" in domain else f"https://{domain}").hostname or domain
+    return host[4:] if host.startswith("www.") else host
+
+
+def _save_browser_cookies(sb, url: str) -> dict:
+    """
+    Saves the Cloudflare cookies and the User-Agent of a browser that passed the challenge.
+    """
+    cf_cookies = {cookie["name"]: cookie["value"]
+                  for cookie in sb.driver.get_cookies() if "cf" in cookie["name"]}
+    if cf_cookies:
+        save_cf_cookies(url, cf_cookies, sb.get_user_agent())
+    return cf_cookies
+
 
 def get_with_captcha(url: str, elem: str, click: bool = False) -> dict:
     """
@@ -21,18 +60,23 @@ def get_with_captcha(url: str, elem: str, click: bool = False) -> dict:
     Returns:
         dict: A BeautifulSoup object of the page content if successful, otherwise an empty dictionary.
     """
-    with SB(uc=True, xvfb=True) as sb:
-        sb.uc_open_with_reconnect(url, 4)
+    with lease_browser() as sb:
+        # Waits are shortened to the time limit of the caller, see `Utils.deadline`
+        with throttle(url):
+            sb.uc_open_with_reconnect(url, cap(4))
         sb.uc_gui_click_captcha()
         if elem:
             print("Waiting for element:", elem)
+            timeout = cap(10)
             try:
-                sb.wait_for_element(elem, timeout=10)
+                sb.wait_for_element(elem, timeout=timeout)
             except Exception as e:
                 return {}
         if click:
             sb.click('button:contains("Show All Chapters")')
         soup = sb.get_beautiful_soup()
+        # Lets the next pages of the source skip the browser, see `fetch_page`
+        _save_browser_cookies(sb, url)
     return soup
 
 
@@ -50,30 +94,80 @@ def get_cookies(url: str) -> dict:
         Exception: If the cookies could not be retrieved.
     """
     try:
-        with SB(uc=True, xvfb=True) as sb:
-            sb.uc_open_with_reconnect(url)
+        with lease_browser() as sb:
+            with throttle(url):
+                sb.uc_open_with_reconnect(url)
             sb.uc_gui_click_captcha()
             sb.wait_for_element("body", timeout=15)
-            selenium_cookies = sb.driver.get_cookies()
-            cf_cookies = {cookie["name"]: cookie["value"]
-                          for cookie in selenium_cookies if "cf" in cookie["name"]}
-            save_cf_cookies(url, cf_cookies)
-            return cf_cookies
+            return _save_browser_cookies(sb, url)
     except Exception as e:
         raise Exception(
-            f"Failed to retrieve cookies from Toongod using SeleniumBase: {e}")
+            f"Failed to retrieve cookies from {url} using SeleniumBase: {e}")
 
 
-def save_cf_cookies(domain: str, cookies: dict) -> None:
+def ensure_cf_cookies(url: str, rejected: dict = None) -> dict:
+    """
+    Returns the Cloudflare cookies of a site, starting a browser only when there are none.
+
+    Cookies saved in Redis are reused until they expire or a request is rejected with them.
+    Only one worker harvests the cookies of a domain at a time (Redis lock `cf_lock:{host}`),
+    the others wait for it and reuse its result.
+
+    Args:
+        url (str): The URL to retrieve cookies from.
+        rejected (dict, optional): Cookies a request was just rejected with (403), they are
+                                   replaced unless another worker already did it.
+
+    Returns:
+        dict: A dictionary of cookie name-value pairs.
+
+    Raises:
+        Exception: If the cookies could not be retrieved.
+    """
+    def usable(cookies):
+        return bool(cookies) and cookies != rejected
+
+    cookies = load_cf_cookies(url)
+    if usable(cookies):
+        return cookies
+
+    lock = redis_client.lock(f"cf_lock:{_cookie_host(url)}", timeout=CF_LOCK_TIMEOUT,
+                             blocking_timeout=CF_LOCK_TIMEOUT)
+    try:
+        acquired = lock.acquire()
+    except redis.RedisError as e:
+        print(f"Error locking cookie harvest for {url}: {e}")
+        acquired = False
+    try:
+        # Harvested by another worker while this one was waiting
+        cookies = load_cf_cookies(url)
+        if usable(cookies):
+            return cookies
+        return get_cookies(url)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except redis.RedisError:
+                pass
+
+
+def save_cf_cookies(domain: str, cookies: dict, user_agent: str = None) -> None:
     """
     Save Cloudflare cookies to Redis.
 
+    Cookies are stored per host, so any URL of a site finds them.
+
     Args:
-        domain (str): Domain for which cookies are saved.
+        domain (str): URL or domain for which cookies are saved.
         cookies (str): JSON string of cookies.
+        user_agent (str, optional): User-Agent of the browser, Cloudflare only accepts the cookies with it.
     """
+    host = _cookie_host(domain)
     try:
-        redis_client.set(f"cf_cookies:{domain}", json.dumps(cookies), ex=1800)
+        redis_client.set(f"cf_cookies:{host}", json.dumps(cookies), ex=CF_COOKIE_TTL)
+        if user_agent:
+            redis_client.set(f"cf_user_agent:{host}", user_agent, ex=CF_COOKIE_TTL)
         print(f"DEBUG: Cookies for {domain} saved successfully." if os.getenv(
             "DEBUG") else "")
     except Exception as e:
@@ -91,7 +185,7 @@ def load_cf_cookies(domain: str) -> dict:
         dict: Dictionary of cookies if found, otherwise an empty dictionary.
     """
     try:
-        cookies = redis_client.get(f"cf_cookies:{domain}")
+        cookies = redis_client.get(f"cf_cookies:{_cookie_host(domain)}")
         if cookies:
             return json.loads(cookies)
         return {}
@@ -108,8 +202,142 @@ def delete_cf_cookies(domain: str) -> None:
         domain (str): Domain for which cookies are deleted.
     """
     try:
-        redis_client.delete(f"cf_cookies:{domain}")
+        host = _cookie_host(domain)
+        redis_client.delete(f"cf_cookies:{host}", f"cf_user_agent:{host}")
         print(f"DEBUG: Cookies for {domain} deleted successfully." if os.getenv(
             "DEBUG") else "")
     except Exception as e:
         print(f"Error deleting cookies for {domain}: {e}")
+
+
+def load_cf_user_agent(domain: str) -> Optional[str]:
+    """
+    Load the User-Agent saved with the Cloudflare cookies of a domain.
+
+    Args:
+        domain (str): URL or domain for which the User-Agent is loaded.
+
+    Returns:
+        Optional[str]: The User-Agent, or None if none is saved.
+    """
+    try:
+        user_agent = redis_client.get(f"cf_user_agent:{_cookie_host(domain)}")
+        return user_agent.decode() if user_agent else None
+    except Exception as e:
+        print(f"Error loading User-Agent for {domain}: {e}")
+        return None
+
+
+def is_challenge(response: req.Response) -> bool:
+    """
+    Whether a response is a Cloudflare block or challenge page instead of the requested page.
+
+    A 403 or 503 alone is not one, the origin itself may be refusing or overloaded. Like
+    `Utils.retry.is_retryable`, only the `cf-mitigated` header or a challenge marker count.
+    """
+    if response.headers.get("cf-mitigated"):
+        return True
+    return any(marker in response.text[:20000] for marker in CHALLENGE_MARKERS)
+
+
+def _refresh_in_background(url: str) -> None:
+    """
+    Harvests new cookies in a background thread when the saved ones are about to expire.
+    """
+    host = _cookie_host(url)
+    try:
+        ttl = redis_client.ttl(f"cf_cookies:{host}")
+    except Exception:
+        return
+    if ttl < 0 or ttl > CF_COOKIE_REFRESH_BEFORE:
+        return
+    with _refreshing_lock:
+        if host in _refreshing:
+            return
+        _refreshing.add(host)
+
+    def refresh():
+        try:
+            # Replaces the expiring cookies unless another worker already did
+            ensure_cf_cookies(url, rejected=load_cf_cookies(url))
+        except Exception as e:
+            print(f"Background cookie refresh for {host} failed: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(host)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def fetch_page(url: str, elem: str = "") -> dict:
+    """
+    Fetches a page of a Cloudflare-protected source, using plain HTTP whenever possible.
+
+    The cookies and User-Agent saved by a browser that passed the challenge are tried first
+    with the pooled HTTP session. The browser is only used when there are no cookies, the
+    response is a challenge page, or `elem` is missing from the HTML. A 5xx response raises,
+    the saved cookies are kept as the site is struggling rather than challenging.
+
+    Args:
+        url (str): The URL of the webpage to open.
+        elem (str): A CSS selector string for an element the page must contain.
+
+    Returns:
+        dict: A BeautifulSoup object of the page content if successful, otherwise an empty dictionary.
+
+    Raises:
+        Exception: If the source answered with a server error after the retries of `http_get`.
+    """
+    cookies = load_cf_cookies(url)
+    user_agent = load_cf_user_agent(url)
+    if cookies and user_agent:
+        try:
+            response = http_get(url, cookies=cookies, headers={"User-Agent": user_agent})
+            if is_challenge(response):
+                delete_cf_cookies(url)
+            elif response.status_code >= 500:
+                # Already retried by http_get, a browser wouldn't get a better answer
+                raise Exception(f"{url} answered with status {response.status_code}")
+            else:
+                soup = BeautifulSoup(response.text, "html.parser")
+                if not elem or soup.select_one(elem):
+                    _refresh_in_background(url)
+                    return soup
+                print(f"{elem} is missing from the HTML of {url}, falling back to the browser")
+        except req.RequestException as e:
+            print(f"HTTP fetch of {url} failed, falling back to the browser: {e}")
+    return get_with_captcha(url, elem)
+
+
+def fetch_chapter_list(manga_url: str, elem: str) -> dict:
+    """
+    Fetches the chapter list of a manga of a Madara (WordPress) source.
+
+    Madara sites load the chapter list with JavaScript from `<manga url>/ajax/chapters/`, so it
+    is missing from the HTML of the manga page. That endpoint is requested over HTTP with the
+    saved cookies first, the manga page is loaded by `fetch_page` when it doesn't answer with `elem`.
+
+    Args:
+        manga_url (str): The URL of the manga page.
+        elem (str): A CSS selector string for the chapter list.
+
+    Returns:
+        dict: A BeautifulSoup object containing `elem` if successful, otherwise an empty dictionary.
+    """
+    cookies = load_cf_cookies(manga_url)
+    user_agent = load_cf_user_agent(manga_url)
+    if cookies and user_agent:
+        try:
+            response = http_post(f"{manga_url.rstrip('/')}/ajax/chapters/", cookies=cookies, headers={
+                "User-Agent": user_agent,
+                "Referer": manga_url,
+                "X-Requested-With": "XMLHttpRequest"
+            })
+            if response.ok and not is_challenge(response):
+                soup = BeautifulSoup(response.text, "html.parser")
+                if soup.select_one(elem):
+                    _refresh_in_background(manga_url)
+                    return soup
+        except req.RequestException as e:
+            print(f"HTTP fetch of the chapters of {manga_url} failed: {e}")
+    return fetch_page(manga_url, elem)
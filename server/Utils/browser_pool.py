@@ -0,0 +1,158 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from Utils.deadline import cap
+
+
+# Browsers kept open per process, also the number of pages that can load at the same time
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))
+# Leases after which a browser is restarted, long-lived Chrome instances slowly leak memory
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", 50))
+# Idle browsers are closed after this many seconds
+BROWSER_IDLE_TIMEOUT = int(os.getenv("BROWSER_IDLE_TIMEOUT", 600))
+# How long a caller waits for a free browser (seconds)
+BROWSER_LEASE_TIMEOUT = float(os.getenv("BROWSER_LEASE_TIMEOUT", 300))
+
+
+class _Browser:
+    """
+    A SeleniumBase browser kept open outside of a `with SB(...)` block.
+    """
+
+    def __init__(self):
+        # Imported here so modules using the pool load without a browser installed
+        from seleniumbase import SB
+
+        self._manager = SB(uc=True, xvfb=True)
+        self.sb = self._manager.__enter__()
+        self.uses = 0
+        self.last_used = time.time()
+
+    def healthy(self) -> bool:
+        """
+        Whether the browser still answers, a crashed Chrome raises on any driver call.
+        """
+        try:
+            return bool(self.sb.driver.window_handles)
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            self._manager.__exit__(None, None, None)
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+
+
+class BrowserPool:
+    """
+    Long-lived SeleniumBase browsers shared by the threads of a process.
+
+    Browsers are leased one caller at a time and returned warm, with their cookies, so
+    later pages of a Cloudflare source load without starting Chrome or solving the
+    challenge again. Crashed browsers are replaced, and every browser is restarted after
+    `max_uses` leases.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_uses: int = BROWSER_MAX_USES):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._max_uses = max_uses
+
+    def _take(self) -> _Browser:
+        while True:
+            with self._lock:
+                # Most recently used first, it is the most likely to still hold valid cookies
+                browser = self._idle.pop() if self._idle else None
+            if browser is None:
+                return _Browser()
+            if browser.healthy():
+                return browser
+            browser.close()
+
+    def _return(self, browser: _Browser, broken: bool) -> None:
+        browser.uses += 1
+        browser.last_used = time.time()
+        if broken or browser.uses >= self._max_uses:
+            browser.close()
+            browser = None
+        with self._lock:
+            if browser:
+                self._idle.append(browser)
+            expired = [b for b in self._idle if time.time() - b.last_used > BROWSER_IDLE_TIMEOUT]
+            self._idle = [b for b in self._idle if b not in expired]
+        for idle_browser in expired:
+            idle_browser.close()
+
+    @contextmanager
+    def lease(self, timeout: float = BROWSER_LEASE_TIMEOUT):
+        """
+        Lends a browser to the caller for the duration of the `with` block.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free browser, at most the time limit of the caller.
+
+        Yields:
+            The SeleniumBase `sb` object, used like the one of `with SB(...) as sb`.
+
+        Raises:
+            Exception: If no browser became available within `timeout`.
+        """
+        if not self._slots.acquire(timeout=cap(timeout)):
+            raise Exception(f"No browser available after {timeout:g}s")
+        browser = None
+        broken = False
+        try:
+            browser = self._take()
+            yield browser.sb
+        except Exception:
+            # Page errors are common with Cloudflare, only drop the browser if it died
+            broken = browser is not None and not browser.healthy()
+            raise
+        finally:
+            if browser is not None:
+                self._return(browser, broken)
+            self._slots.release()
+
+    def close(self) -> None:
+        """
+        Closes the idle browsers, leased ones are closed when they are returned.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.close()
+
+
+browser_pool = BrowserPool()
+
+
+def _reset_pool():
+    """
+    Browsers of the parent process belong to it, a forked worker starts with an empty pool.
+    """
+    global browser_pool
+    browser_pool = BrowserPool()
+
+
+def close_browsers() -> None:
+    """
+    Closes the idle browsers of the process-wide pool, called when the process shuts down.
+    """
+    browser_pool.close()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+atexit.register(close_browsers)
+
+
+@contextmanager
+def lease_browser(timeout: float = BROWSER_LEASE_TIMEOUT):
+    """
+    Lends a browser of the process-wide pool, see `BrowserPool.lease`.
+    """
+    with browser_pool.lease(timeout) as sb:
+        yield sb
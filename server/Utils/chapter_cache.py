@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Optional
+from Formats.image_probe import read_manifest, write_manifest
+
+
+# Persistent cache of downloaded chapters, kept next to the job directories so pages can be hardlinked
+CHAPTER_CACHE_DIR = os.getenv("CHAPTER_CACHE_DIR", "Downloads/.cache")
+# Size budget of the cached pages, 0 disables the cache
+CHAPTER_CACHE_MAX_BYTES = int(os.getenv("CHAPTER_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+# Minimum number of seconds between two eviction passes of a process
+EVICT_INTERVAL = 60
+# Unreferenced pages younger than this may belong to a chapter that is being stored right now
+ORPHAN_GRACE = 600
+
+_last_evict = 0.0
+_evict_lock = threading.Lock()
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(CHAPTER_CACHE_DIR, "blobs", digest[:2], digest)
+
+
+def _index_path(source: str, chap_id: str) -> str:
+    key = hashlib.sha1(f"{source}:{chap_id}".encode()).hexdigest()
+    return os.path.join(CHAPTER_CACHE_DIR, "chapters", f"{key}.json")
+
+
+def file_hash(path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link(src: str, dst: str) -> None:
+    """
+    Hardlinks `src` to `dst`, copying when both aren't on the same filesystem.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def load_chapter(source: str, chap_id: str, chap_num, path: str) -> Optional[str]:
+    """
+    Materialises a cached chapter into a job directory.
+
+    Args:
+        source (str): Name of the source, e.g. "MangaDex".
+        chap_id (str): Identifier of the chapter on the source.
+        chap_num (str or int): The chapter number, used to name the subdirectory.
+        path (str): The base directory of the job.
+
+    Returns:
+        Optional[str]: Path to the chapter directory with hardlinked pages and its manifest,
+                       or None if the chapter is not cached.
+    """
+    if CHAPTER_CACHE_MAX_BYTES <= 0:
+        return None
+    index_path = _index_path(source, chap_id)
+    try:
+        with open(index_path) as f:
+            pages = json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+    ch_path = os.path.join(path, str(chap_num))
+    os.makedirs(ch_path, exist_ok=True)
+    try:
+        for page in pages:
+            _link(_blob_path(page["hash"]), os.path.join(ch_path, page["file"]))
+        write_manifest(ch_path, pages)
+        # Hits keep the chapter at the end of the LRU order
+        os.utime(index_path)
+    except OSError as e:
+        print(f"Cached chapter {source}:{chap_id} is incomplete, downloading it again: {e}")
+        shutil.rmtree(ch_path, ignore_errors=True)
+        return None
+    return ch_path
+
+
+def store_chapter(source: str, chap_id: str, ch_path: str) -> None:
+    """
+    Adds a downloaded chapter to the cache.
+
+    Pages are stored once per content hash, so identical pages of different chapters share
+    a single file. Chapters with pages that failed to download are not cached.
+
+    Args:
+        source (str): Name of the source, e.g. "MangaDex".
+        chap_id (str): Identifier of the chapter on the source.
+        ch_path (str): Path to the chapter directory, with the manifest written by the downloader.
+    """
+    if CHAPTER_CACHE_MAX_BYTES <= 0:
+        return
+    pages = read_manifest(ch_path)
+    if not pages or any(page.get("corrupt") for page in pages):
+        return
+
+    try:
+        for page in pages:
+            page_path = os.path.join(ch_path, page["file"])
+            if not page.get("hash"):
+                page["hash"] = file_hash(page_path)
+            blob = _blob_path(page["hash"])
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                tmp_blob = f"{blob}.{uuid.uuid4().hex}.tmp"
+                _link(page_path, tmp_blob)
+                os.replace(tmp_blob, blob)
+
+        index_path = _index_path(source, chap_id)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_index = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_index, "w") as f:
+            json.dump({"source": source, "chapter": chap_id, "pages": pages}, f)
+        os.replace(tmp_index, index_path)
+    except OSError as e:
+        print(f"Failed to cache chapter {source}:{chap_id}: {e}")
+        return
+
+    evict()
+
+
+def evict(force: bool = False) -> None:
+    """
+    Shrinks the cache below `CHAPTER_CACHE_MAX_BYTES`.
+
+    Least recently used chapters are dropped first, then every page that no remaining
+    chapter refers to. Hardlinks in running jobs keep their pages alive on disk.
+
+    Args:
+        force (bool): Run even if the last pass of this process was less than `EVICT_INTERVAL` ago.
+    """
+    global _last_evict
+    with _evict_lock:
+        if not force and time.time() - _last_evict < EVICT_INTERVAL:
+            return
+        _last_evict = time.time()
+
+    chapters_dir = os.path.join(CHAPTER_CACHE_DIR, "chapters")
+    blobs_dir = os.path.join(CHAPTER_CACHE_DIR, "blobs")
+    if not os.path.isdir(chapters_dir) or not os.path.isdir(blobs_dir):
+        return
+
+    indexes = []
+    refs = {}
+    for entry in os.scandir(chapters_dir):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path) as f:
+                hashes = {page["hash"] for page in json.load(f)["pages"]}
+            indexes.append((entry.stat().st_mtime, entry.path, hashes))
+        except (OSError, ValueError, KeyError):
+            continue
+        for digest in hashes:
+            refs[digest] = refs.get(digest, 0) + 1
+
+    sizes = {}
+    for prefix in os.scandir(blobs_dir):
+        for blob in os.scandir(prefix.path):
+            if blob.name.endswith(".tmp"):
+                continue
+            stat = blob.stat()
+            if blob.name not in refs:
+                # Orphaned page, e.g. from an evicted or overwritten chapter
+                if time.time() - stat.st_mtime > ORPHAN_GRACE:
+                    try:
+                        os.remove(blob.path)
+                    except OSError:
+                        pass
+                continue
+            sizes[blob.name] = stat.st_size
+
+    total = sum(sizes.values())
+    for _, index_path, hashes in sorted(indexes):
+        if total <= CHAPTER_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(index_path)
+        except OSError:
+            continue
+        for digest in hashes:
+            refs[digest] -= 1
+            if refs[digest] == 0 and digest in sizes:
+                total -= sizes.pop(digest)
+                try:
+                    os.remove(_blob_path(digest))
+                except OSError:
+                    pass
@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from Manga.registry import find_source
+
+
+# Chapters of one site processed at the same time by a worker process, overrides the
+# concurrency declared in `Manga.registry` when set
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY") or 0)
+# Per-site overrides, e.g. "asuracomic.net=2,kunmanga.com=4"
+CHAPTER_CONCURRENCY_PER_DOMAIN = {
+    domain.strip(): int(limit)
+    for domain, limit in (
+        item.split("=") for item in os.getenv("CHAPTER_CONCURRENCY_PER_DOMAIN", "").split(",") if "=" in item
+    )
+}
+
+_domain_limits = {}
+_domain_limits_lock = threading.Lock()
+
+
+def domain_concurrency(url: str) -> int:
+    """
+    Number of chapters of the site of `url` that may be fetched at the same time.
+    """
+    host = urlparse(url).hostname or url
+    host = host[4:] if host.startswith("www.") else host
+    if host in CHAPTER_CONCURRENCY_PER_DOMAIN:
+        return max(1, CHAPTER_CONCURRENCY_PER_DOMAIN[host])
+    if CHAPTER_CONCURRENCY:
+        return CHAPTER_CONCURRENCY
+    spec = find_source(url)
+    return spec.concurrency if spec else 3
+
+
+def _domain_semaphore(url: str) -> threading.BoundedSemaphore:
+    """
+    Returns the semaphore capping the chapters of a site in flight in this process, shared by all jobs.
+    """
+    host = urlparse(url).hostname or url
+    with _domain_limits_lock:
+        semaphore = _domain_limits.get(host)
+        if semaphore is None:
+            semaphore = _domain_limits[host] = threading.BoundedSemaphore(domain_concurrency(url))
+        return semaphore
+
+
+def run_chapters(ids, download_chapter, base_url, update_progress=None, on_chapter=None):
+    """
+    Downloads several chapters of a site at the same time, keeping the callbacks in chapter order.
+
+    At most `domain_concurrency(base_url)` chapters of the site are fetched at once in the
+    process, each with its own pooled browser or HTTP connection. Chapters are handed to
+    `on_chapter` in the order of `ids`, as soon as all the chapters before them are done.
+
+    Args:
+        ids (list of str): Chapter identifiers, in reading order.
+        download_chapter (callable): Called as `download_chapter(chap_id)` on a worker thread, returns
+                                     the chapter directory or None if the chapter was skipped.
+        base_url (str): URL of the source, selects the concurrency cap.
+        update_progress (callable, optional): Callback function for reporting progress.
+        on_chapter (callable, optional): Called with every chapter directory, in chapter order.
+
+    Returns:
+        list of str: The downloaded chapter directories, in chapter order.
+
+    Raises:
+        Exception: The first error raised by `download_chapter`, pending chapters are cancelled.
+    """
+    semaphore = _domain_semaphore(base_url)
+
+    def run(chap_id):
+        with semaphore:
+            return download_chapter(chap_id)
+
+    total_chapters = len(ids)
+    ch_paths = []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(domain_concurrency(base_url), total_chapters)))
+    try:
+        futures = [executor.submit(run, chap_id) for chap_id in ids]
+        for i, future in enumerate(futures):
+            if update_progress:
+                update_progress(i, f"Downloading chapter {i+1}/{total_chapters}")
+            ch_path = future.result()
+            if ch_path:
+                ch_paths.append(ch_path)
+                if on_chapter:
+                    on_chapter(ch_path)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return ch_paths
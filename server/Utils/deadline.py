@@ -0,0 +1,67 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+
+# Monotonic time at which the caller of the current scraper call stops waiting for it,
+# and the event set when the caller gave up before
+_deadline: ContextVar[Optional[Tuple[Optional[float], Optional[threading.Event]]]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by blocking calls made after the time limit of the current call ran out.
+    """
+
+
+@contextmanager
+def time_limit(seconds: Optional[float], cancelled: Optional[threading.Event] = None):
+    """
+    Limits the blocking calls made in the `with` block of this thread to `seconds` in total.
+
+    HTTP requests, rate limit and browser waits take their timeouts from `cap`, so a thread
+    abandoned by `asyncio.wait_for` finishes soon after its caller gave up instead of
+    running on in the background.
+
+    Args:
+        seconds (float, optional): Time limit, None or 0 for no limit.
+        cancelled (threading.Event, optional): Ends the time limit early once set.
+    """
+    if not seconds and cancelled is None:
+        yield
+        return
+    token = _deadline.set((time.monotonic() + seconds if seconds else None, cancelled))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the time limit of the current thread, None without a limit.
+    """
+    limit = _deadline.get()
+    if limit is None:
+        return None
+    deadline, cancelled = limit
+    if cancelled is not None and cancelled.is_set():
+        return 0
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def cap(seconds: float) -> float:
+    """
+    Shortens a timeout or wait to the time left before the time limit of the current thread.
+
+    Raises:
+        DeadlineExceeded: If the time limit has already run out.
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    if left <= 0:
+        raise DeadlineExceeded("Time limit exceeded")
+    return min(seconds, left)
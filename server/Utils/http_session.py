@@ -0,0 +1,243 @@
+import asyncio
+import os
+from http.cookiejar import DefaultCookiePolicy
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+import aiohttp
+import requests as req
+from requests.adapters import HTTPAdapter
+from Utils.deadline import cap
+from Utils.rate_limit import acquire, athrottle
+from Utils.retry import is_retryable, retry_delay, should_retry
+
+
+# Connection pool tuning for the shared sessions
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 32))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+
+DEFAULT_HEADERS = {
+    "User-Agent": f"manhwa-downloader {req.utils.default_user_agent()}",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive",
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_aiohttp_session: Optional[aiohttp.ClientSession] = None
+
+
+def _reset_sessions():
+    """
+    Drops the sessions inherited from the parent process, their sockets must not be shared after a fork.
+    """
+    global _sessions_lock, _aiohttp_session
+    _sessions.clear()
+    _sessions_lock = threading.Lock()
+    _aiohttp_session = None
+
+
+os.register_at_fork(after_in_child=_reset_sessions)
+
+
+def _new_session() -> req.Session:
+    session = req.Session()
+    # Sessions are shared by every job of the process, Set-Cookie of one job must not reach
+    # the next ones. Cookies are passed explicitly per request, e.g. the Cloudflare ones.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session(url: str) -> req.Session:
+    """
+    Returns the keep-alive session shared by all requests to the host of `url` in this process.
+
+    The session doesn't keep the cookies set by responses, pass them with `cookies=` instead.
+
+    Args:
+        url (str): Any URL on the target host.
+
+    Returns:
+        requests.Session: Session with a tuned connection pool and default headers.
+    """
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _new_session()
+        return session
+
+
+def _release_when_read(response: req.Response, release) -> None:
+    """
+    Holds the rate limit slot of a streamed response until its body is read to the end or it is closed.
+
+    Leaving a `with` block closes the response. Slots of responses that are never closed
+    are reclaimed after `Utils.rate_limit.INFLIGHT_TTL`.
+    """
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+    response.close = close_and_release
+
+    # urllib3 hands the connection back to the pool once the body has been read
+    release_conn = getattr(response.raw, "release_conn", None)
+    if release_conn:
+        def release_conn_and_slot():
+            try:
+                release_conn()
+            finally:
+                release()
+        response.raw.release_conn = release_conn_and_slot
+
+
+def _send(method: str, url: str, **kwargs) -> req.Response:
+    """
+    Sends a request through the pooled session of the target host, retrying transient failures.
+
+    Every attempt waits for the rate limits of the host, see `Utils.rate_limit`, and holds a
+    slot of the host until the response is read (for `stream=True`, until the caller has read
+    its body or closed it). Connection
+    errors, timeouts and the statuses of `Utils.retry.RETRY_STATUSES` are retried with backoff
+    as long as `should_retry` allows it. Then the last response is returned, or the last error
+    raised, so callers handle the failure as without retries. Within `Utils.deadline.time_limit`,
+    timeouts and backoff are shortened to the time left.
+    """
+    timeout = kwargs.pop("timeout", HTTP_TIMEOUT)
+    attempt = 0
+    while True:
+        release = acquire(url)
+        try:
+            response = get_session(url).request(
+                method, url, timeout=cap(timeout) if isinstance(timeout, (int, float)) else timeout, **kwargs
+            )
+        except (req.ConnectionError, req.Timeout):
+            if not should_retry(url, attempt):
+                raise
+            headers = None
+        else:
+            if not is_retryable(response.status_code, response.headers) or not should_retry(url, attempt):
+                if kwargs.get("stream"):
+                    # The body is read by the caller, the request still counts until then
+                    _release_when_read(response, release)
+                    release = None
+                return response
+            headers = response.headers
+            response.close()
+        finally:
+            if release:
+                release()
+        time.sleep(cap(retry_delay(attempt, headers)))
+        attempt += 1
+
+
+def http_get(url: str, **kwargs) -> req.Response:
+    """
+    Sends a GET request through the pooled session of the target host.
+
+    Accepts the same keyword arguments as `requests.get`, the timeout defaults to `HTTP_TIMEOUT`.
+    Rate limits and retries are handled as described in `_send`.
+    """
+    return _send("GET", url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> req.Response:
+    """
+    Sends a POST request through the pooled session of the target host.
+
+    Accepts the same keyword arguments as `requests.post`, the timeout defaults to `HTTP_TIMEOUT`.
+    Rate limits and retries are handled as described in `_send`.
+    """
+    return _send("POST", url, **kwargs)
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """
+    Returns the aiohttp session shared by the async code of this process (the API).
+
+    Must be called from the running event loop, the session is closed by `close_aiohttp_session`.
+
+    Returns:
+        aiohttp.ClientSession: Session with a pooled connector, `DEFAULT_HEADERS` and `HTTP_TIMEOUT`.
+    """
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                                         limit_per_host=HTTP_POOL_MAXSIZE)
+        headers = {key: value for key, value in DEFAULT_HEADERS.items() if key != "Connection"}
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return _aiohttp_session
+
+
+async def close_aiohttp_session() -> None:
+    """
+    Closes the shared aiohttp session, called when the API shuts down.
+    """
+    global _aiohttp_session
+    if _aiohttp_session is not None and not _aiohttp_session.closed:
+        await _aiohttp_session.close()
+    _aiohttp_session = None
+
+
+async def _asend_json(method: str, url: str, **kwargs):
+    """
+    Same as `_send` on the shared aiohttp session, returns the decoded JSON body.
+    """
+    attempt = 0
+    while True:
+        headers = None
+        try:
+            async with athrottle(url):
+                async with get_aiohttp_session().request(method, url, **kwargs) as response:
+                    if not is_retryable(response.status, response.headers) or not should_retry(url, attempt):
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    headers = response.headers
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if not should_retry(url, attempt):
+                raise
+        await asyncio.sleep(retry_delay(attempt, headers))
+        attempt += 1
+
+
+async def ahttp_get_json(url: str, **kwargs):
+    """
+    Sends a GET request through the shared aiohttp session and decodes the JSON body.
+
+    Accepts the same keyword arguments as `aiohttp.ClientSession.get`. Transient failures
+    are retried like in `http_get`.
+
+    Raises:
+        aiohttp.ClientError: On network errors and error statuses.
+        asyncio.TimeoutError: If the request takes longer than `HTTP_TIMEOUT`.
+    """
+    return await _asend_json("GET", url, **kwargs)
+
+
+async def ahttp_post_json(url: str, **kwargs):
+    """
+    Sends a POST request through the shared aiohttp session and decodes the JSON body.
+
+    Accepts the same keyword arguments as `aiohttp.ClientSession.post`. Transient failures
+    are retried like in `http_post`.
+
+    Raises:
+        aiohttp.ClientError: On network errors and error statuses.
+        asyncio.TimeoutError: If the request takes longer than `HTTP_TIMEOUT`.
+    """
+    return await _asend_json("POST", url, **kwargs)
@@ -0,0 +1,288 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+from Manga.registry import find_source
+from Utils.deadline import cap
+
+load_dotenv()
+
+REDIS_URL = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+# Per-host limits added to or overriding the ones of Manga/registry.py, as "host=rate/inflight",
+# e.g. "mangapi=10/4,uploads.mangadex.org=/8". An empty side means no limit.
+RATE_LIMITS = {
+    host.strip(): tuple(limits.partition("/")[::2])
+    for host, limits in (
+        item.split("=", 1) for item in os.getenv("RATE_LIMITS", "").split(",") if "=" in item
+    )
+}
+# Seconds after which the slot of a request that never released it is reclaimed
+INFLIGHT_TTL = int(os.getenv("RATE_INFLIGHT_TTL", 120))
+# Longest wait for a slot, requests go ahead anyway afterwards rather than failing
+RATE_MAX_WAIT = float(os.getenv("RATE_MAX_WAIT", 60))
+# Interval between two attempts to get a slot (seconds)
+POLL_INTERVAL = 0.05
+# Redis is not asked again for this long after it failed, requests are not limited meanwhile
+REDIS_RETRY_AFTER = 30
+
+# Takes a token from the bucket of a host, the bucket may go negative so requests queue up
+# in order. Returns the milliseconds the caller has to wait before sending its request.
+_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+if tokens >= 0 then
+    return 0
+end
+return math.ceil(-tokens / rate * 1000)
+"""
+
+# Adds a holder to the slots of a host if fewer than ARGV[1] are taken, after dropping the
+# holders older than ARGV[3] seconds. Returns 1 if the slot was taken.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[3]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+redis_client = Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+_bucket = redis_client.register_script(_BUCKET_SCRIPT)
+_acquire = redis_client.register_script(_ACQUIRE_SCRIPT)
+
+_async_client = None
+_redis_down_until = 0.0
+_state_lock = threading.Lock()
+# Limits of endpoints limited apart from their host, see `register_limits`
+_key_limits = {}
+
+
+def _reset_clients():
+    """
+    Connections of the parent process must not be shared after a fork.
+    """
+    global redis_client, _bucket, _acquire, _async_client, _state_lock
+    redis_client = Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    _bucket = redis_client.register_script(_BUCKET_SCRIPT)
+    _acquire = redis_client.register_script(_ACQUIRE_SCRIPT)
+    _async_client = None
+    _state_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_clients)
+
+
+def _host(url: str) -> str:
+    host = urlparse(url).hostname or url
+    return host[4:] if host.startswith("www.") else host
+
+
+def _number(value: str, cast):
+    value = value.strip()
+    return cast(value) if value else None
+
+
+@lru_cache(maxsize=1024)
+def host_limits(host: str) -> Tuple[Optional[float], Optional[int]]:
+    """
+    Limits of the requests sent to a host by all processes together.
+
+    `RATE_LIMITS` entries match the host and its subdomains, otherwise the limits are the
+    ones declared for the source whose website or API is on the host.
+
+    Returns:
+        tuple: (requests per second, simultaneous requests), None for no limit.
+    """
+    for pattern, (rate, inflight) in RATE_LIMITS.items():
+        if host == pattern or host.endswith(f".{pattern}"):
+            return _number(rate, float), _number(inflight, int)
+    if host in _key_limits:
+        return _key_limits[host]
+    spec = find_source(f"https://{host}")
+    if spec:
+        return spec.rate_limit, spec.max_inflight
+    return None, None
+
+
+def register_limits(key: str, rate: Optional[float] = None, inflight: Optional[int] = None) -> None:
+    """
+    Declares the limits of an endpoint that has its own on top of the ones of its host.
+
+    Requests are limited under the key with `throttle(url, key=key)`, `RATE_LIMITS` may
+    override the declared limits with an entry for the key.
+
+    Args:
+        key (str): Name of the limits, e.g. "api.mangadex.org/at-home".
+        rate (float, optional): Requests per second, None for no limit.
+        inflight (int, optional): Simultaneous requests, None for no limit.
+    """
+    _key_limits[key] = (rate, inflight)
+    host_limits.cache_clear()
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_down_until
+
+
+def _redis_failed(e: Exception) -> None:
+    """
+    Lets requests through unlimited for `REDIS_RETRY_AFTER` seconds, a Redis outage must not stop the downloads.
+    """
+    global _redis_down_until
+    with _state_lock:
+        if _redis_available():
+            print(f"Rate limiter disabled for {REDIS_RETRY_AFTER}s, Redis is unavailable: {e}")
+        _redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+def _bucket_args(rate: float):
+    # The bucket holds one second of requests, so bursts stay within the declared rate
+    return [rate, max(1.0, rate)]
+
+
+def acquire(url: str, key: str = None) -> Callable[[], None]:
+    """
+    Waits until a request to the host of `url` is allowed and takes one of its slots.
+
+    A token of the host's bucket is taken, then one of its slots is held until the returned
+    function is called. Both are kept in Redis, so the limits apply to the API and every
+    worker together. Hosts without declared limits and Redis errors are not delayed.
+
+    Args:
+        url (str): URL of the request.
+        key (str, optional): Limits registered with `register_limits` to apply instead of the ones of the host.
+
+    Returns:
+        callable: Releases the slot, calling it again does nothing.
+    """
+    host = key or _host(url)
+    rate, inflight = host_limits(host)
+    holder = None
+    if (rate or inflight) and _redis_available():
+        try:
+            if rate:
+                wait = _bucket(keys=[f"rate_tokens:{host}"], args=_bucket_args(rate))
+                if wait:
+                    time.sleep(cap(wait / 1000))
+            if inflight:
+                holder = uuid.uuid4().hex
+                deadline = time.monotonic() + cap(RATE_MAX_WAIT)
+                while not _acquire(keys=[f"rate_slots:{host}"], args=[inflight, holder, INFLIGHT_TTL]):
+                    if time.monotonic() > deadline:
+                        print(f"No free slot for {host} after {RATE_MAX_WAIT:g}s, sending the request anyway")
+                        holder = None
+                        break
+                    time.sleep(POLL_INTERVAL)
+        except RedisError as e:
+            _redis_failed(e)
+            holder = None
+
+    def release():
+        nonlocal holder
+        if holder:
+            try:
+                redis_client.zrem(f"rate_slots:{host}", holder)
+            except RedisError as e:
+                _redis_failed(e)
+            holder = None
+    return release
+
+
+@contextmanager
+def throttle(url: str, key: str = None):
+    """
+    Same as `acquire`, the slot is held for the duration of the `with` block.
+    """
+    release = acquire(url, key)
+    try:
+        yield
+    finally:
+        release()
+
+
+def _get_async_client() -> AsyncRedis:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncRedis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _async_client
+
+
+async def aacquire(url: str, key: str = None) -> Callable[[], Awaitable[None]]:
+    """
+    Same as `acquire`, for the event loop of the API. The returned function is awaited.
+    """
+    host = key or _host(url)
+    rate, inflight = host_limits(host)
+    holder = None
+    if (rate or inflight) and _redis_available():
+        client = _get_async_client()
+        try:
+            if rate:
+                wait = await client.eval(_BUCKET_SCRIPT, 1, f"rate_tokens:{host}", *_bucket_args(rate))
+                if wait:
+                    await asyncio.sleep(wait / 1000)
+            if inflight:
+                holder = uuid.uuid4().hex
+                deadline = time.monotonic() + RATE_MAX_WAIT
+                while not await client.eval(_ACQUIRE_SCRIPT, 1, f"rate_slots:{host}", inflight, holder, INFLIGHT_TTL):
+                    if time.monotonic() > deadline:
+                        print(f"No free slot for {host} after {RATE_MAX_WAIT:g}s, sending the request anyway")
+                        holder = None
+                        break
+                    await asyncio.sleep(POLL_INTERVAL)
+        except RedisError as e:
+            _redis_failed(e)
+            holder = None
+
+    async def release():
+        nonlocal holder
+        if holder:
+            try:
+                await _get_async_client().zrem(f"rate_slots:{host}", holder)
+            except RedisError as e:
+                _redis_failed(e)
+            holder = None
+    return release
+
+
+@asynccontextmanager
+async def athrottle(url: str, key: str = None):
+    """
+    Same as `throttle`, for the event loop of the API.
+    """
+    release = await aacquire(url, key)
+    try:
+        yield
+    finally:
+        await release()
+
+
+async def close_rate_limiter() -> None:
+    """
+    Closes the Redis connection of the async limiter, called when the API shuts down.
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
@@ -0,0 +1,117 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Mapping, Optional
+from urllib.parse import urlparse
+from Manga.registry import find_source
+
+
+# Retries of a request that failed with a transient error, sources may declare their own in Manga/registry.py
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", 3))
+# First backoff delay (seconds), the upper bound of the random delay doubles after every retry
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", 0.5))
+# Longest wait before a retry, also caps the waits asked for by Retry-After
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 60))
+# Retries a job may spend per chapter, past it failures are final for the rest of the job
+RETRY_BUDGET_PER_CHAPTER = int(os.getenv("RETRY_BUDGET_PER_CHAPTER", 20))
+
+# Statuses worth another attempt, including the origin errors of Cloudflare
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def max_retries(host: str) -> int:
+    """
+    Retries allowed for a request to a host, as declared by its source or `RETRY_ATTEMPTS`.
+    """
+    spec = find_source(f"https://{host}")
+    if spec and spec.retries is not None:
+        return spec.retries
+    return RETRY_ATTEMPTS
+
+
+def should_retry(url: str, attempt: int) -> bool:
+    """
+    Whether a request that failed `attempt + 1` times may be sent again.
+
+    Takes one retry from the budget of the current job when there is one.
+    """
+    if attempt >= max_retries(urlparse(url).hostname or url):
+        return False
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            return True
+        if _budget <= 0:
+            return False
+        _budget -= 1
+        return True
+
+
+def _retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Seconds to wait as told by the server, from Retry-After or the X-RateLimit-Retry-After of MangaDex.
+    """
+    if not headers:
+        return None
+    retry_at = headers.get("X-RateLimit-Retry-After")
+    if retry_at and retry_at.isdigit():
+        return max(0.0, int(retry_at) - time.time())
+    retry_after = headers.get("Retry-After")
+    if not retry_after:
+        return None
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt + 1`.
+
+    Honours the wait asked for by a 429 or 503 response, otherwise exponential backoff with
+    full jitter, so the workers that failed together don't retry together.
+
+    Args:
+        attempt (int): Retries already made, 0 for the first one.
+        headers (Mapping, optional): Headers of the failed response.
+    """
+    server_wait = _retry_after(headers)
+    if server_wait is not None:
+        return min(RETRY_MAX_DELAY, server_wait + random.uniform(0, 1))
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2 ** attempt))
+
+
+def is_retryable(status: int, headers: Optional[Mapping[str, str]] = None) -> bool:
+    """
+    Whether a response status is transient. Cloudflare challenges are not, they need a browser.
+    """
+    return status in RETRY_STATUSES and not (headers and headers.get("cf-mitigated"))
+
+
+@contextmanager
+def job_budget(chapters: int):
+    """
+    Limits the retries of the process to `RETRY_BUDGET_PER_CHAPTER` per chapter for the duration of a job.
+
+    A source that is down then fails the job quickly instead of retrying every page. Celery
+    runs one job per worker process at a time, so the budget is shared by all its threads.
+    """
+    global _budget
+    with _budget_lock:
+        _budget = max(1, chapters) * RETRY_BUDGET_PER_CHAPTER
+    try:
+        yield
+    finally:
+        with _budget_lock:
+            _budget = None
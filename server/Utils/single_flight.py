@@ -0,0 +1,95 @@
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from redis import Redis
+
+load_dotenv()
+
+REDIS_URL = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+redis_client = Redis.from_url(REDIS_URL)
+
+# Deletes the in-flight marker only if it still belongs to the given task
+_RELEASE_SCRIPT = redis_client.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+# Takes the in-flight marker, or adds a requester to the task holding it. Returns the ID of
+# that task, or nothing if ARGV[1] took the marker.
+_CLAIM_SCRIPT = redis_client.register_script("""
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('set', ARGV[3] .. ARGV[1], 1, 'EX', ARGV[2])
+    return false
+end
+local running = redis.call('get', KEYS[1])
+redis.call('incr', ARGV[3] .. running)
+return running
+""")
+
+
+def _flight_key(key: str) -> str:
+    return f"inflight:{key}"
+
+
+WAITERS_PREFIX = "inflight_waiters:"
+
+
+def _waiters_key(task_id: str) -> str:
+    return f"{WAITERS_PREFIX}{task_id}"
+
+
+def claim(key: str, task_id: str, ttl: int) -> Optional[str]:
+    """
+    Registers `task_id` as the task building the archive of a request.
+
+    Args:
+        key: Request key, see `Utils.artifact_cache.job_key`
+        task_id: ID of the task that would be queued for this request
+        ttl: Seconds after which the claim expires, e.g. the hard time limit of the task
+
+    Returns:
+        Optional[str]: ID of the task already running for the same request, which the caller
+                       should attach to, or None if `task_id` now owns the request.
+    """
+    # Claiming and attaching happen in one script, a release in between can't leave the caller without either
+    running = _CLAIM_SCRIPT(keys=[_flight_key(key)], args=[task_id, ttl, WAITERS_PREFIX])
+    return running.decode() if running else None
+
+
+def takeover(key: str, task_id: str, ttl: int) -> None:
+    """
+    Replaces the claim of a task that failed or was revoked.
+    """
+    redis_client.set(_flight_key(key), task_id, ex=ttl)
+    redis_client.set(_waiters_key(task_id), 1, ex=ttl)
+
+
+def detach(task_id: str) -> int:
+    """
+    Removes one requester from a task.
+
+    Returns:
+        int: Number of requesters still waiting for the task.
+    """
+    remaining = redis_client.decr(_waiters_key(task_id))
+    if remaining <= 0:
+        redis_client.delete(_waiters_key(task_id))
+    return max(remaining, 0)
+
+
+def requesters(task_id: str) -> int:
+    """
+    Number of requesters waiting for a task, at least the one that queued it.
+    """
+    waiters = redis_client.get(_waiters_key(task_id))
+    return max(int(waiters), 1) if waiters else 1
+
+
+def release(key: str, task_id: str) -> None:
+    """
+    Ends the claim of `task_id`, later requests are served by the artifact cache or start a new task.
+    """
+    _RELEASE_SCRIPT(keys=[_flight_key(key)], args=[task_id])
+    redis_client.delete(_waiters_key(task_id))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Formats.pdf.gen_pdf
+Builds a synthetic fixture of chapters with generated pages and compares the
+sequential conversion with the process pool. Both run in a daemonic process,
+like in the Celery prefork worker processes.
+
+Usage (from the server directory):
+    python -m benchmarks.pdf_benchmark --chapters 100 --pages 4
+"""
+
+import argparse
+import billiard
+import os
+import shutil
+import sys
+import tempfile
+import time
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Formats import pdf
+
+
+def build_fixture(path, chapters, pages, size):
+    """
+    Writes `chapters` directories with `pages` noise images each, laid out like a download directory.
+    """
+    noise = Image.effect_noise(size, 16)
+    page = Image.merge("RGB", (Image.linear_gradient("L").resize(size), noise, noise))
+    os.makedirs(path)
+    first = os.path.join(path, "fixture.png")
+    page.save(first, "PNG")
+    for chap in range(1, chapters + 1):
+        ch_path = os.path.join(path, str(chap))
+        os.makedirs(ch_path)
+        for i in range(pages):
+            shutil.copy(first, os.path.join(ch_path, f"{i}.png"))
+    os.remove(first)
+
+
+def convert(path, parallel, results):
+    start = time.perf_counter()
+    zip_path = pdf.gen_pdf(path, parallel=parallel)
+    results.put((time.perf_counter() - start, os.path.getsize(zip_path)))
+
+
+def run(parallel, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Downloads")
+        build_fixture(path, args.chapters, args.pages, (args.width, args.height))
+        results = billiard.Queue()
+        worker = billiard.Process(target=convert, args=(path, parallel, results), daemon=True)
+        worker.start()
+        elapsed, size = results.get()
+        worker.join()
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs. parallel PDF generation")
+    parser.add_argument("--chapters", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--width", type=int, default=720)
+    parser.add_argument("--height", type=int, default=1600)
+    args = parser.parse_args()
+
+    print(f"Fixture: {args.chapters} chapters x {args.pages} pages ({args.width}x{args.height}), "
+          f"PDF_WORKERS={pdf.PDF_WORKERS}")
+
+    sequential, seq_size = run(False, args)
+    print(f"Sequential: {sequential:.2f}s ({seq_size} bytes)")
+
+    parallel, par_size = run(True, args)
+    print(f"Parallel:   {parallel:.2f}s ({par_size} bytes)")
+
+    print(f"Speedup:    {sequential / parallel:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
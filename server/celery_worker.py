@@ -20,7 +20,7 @@ if __name__ == "__main__":
     celery_app.worker_main([
         "worker",
         "--loglevel=info",
-        "--concurrency=2",  # Number of worker processes
+        f"--concurrency={os.getenv('WORKER_CONCURRENCY', 2)}",  # Number of worker processes
         "--queues=downloads,cleanup",  # Queues to handle
         "--hostname=manhwa-worker@%h"  # Worker name
     ])
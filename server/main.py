@@ -1,9 +1,13 @@
-from fastapi import FastAPI, Query, Response, status, HTTPException
+from fastapi import FastAPI, Query, Request, Response, status, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from starlette.background import BackgroundTask
-from Utils.ProxyImage import proxy_image
+from Utils.ProxyImage import proxy_image, THUMBNAIL_QUALITY
+from Utils.http_session import get_aiohttp_session, close_aiohttp_session
+from Utils.rate_limit import close_rate_limiter
 import scraper
+from Manga.registry import SOURCES, get_source
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi_cache import FastAPICache
@@ -11,13 +15,19 @@ from fastapi_cache.coder import JsonCoder
 from fastapi_cache.backends.redis import RedisBackend
 from fastapi_cache.decorator import cache
 import asyncio
+import threading
 import aiohttp
-from Queue.tasks import download_chapters, cleanup_task
+from Queue.tasks import download_chapters, cleanup_task, start_fanout, FANOUT_MIN_CHAPTERS
 from Queue.celery_app import celery_app
+from Utils import artifact_cache, single_flight
+from Utils.deadline import time_limit
 import os
 import re
 from redis import Redis
 import json
+import uuid
+from celery import states
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import BackgroundTasks
 
 load_dotenv()
@@ -28,11 +38,59 @@ REDIS_URL = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 redis_client = Redis.from_url(REDIS_URL)
 redis_url = os.getenv("REDIS_DB1","redis://redis:6379/1")
 
+# Scrapers are synchronous (some drive a browser), they run on this pool instead of the event loop
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 16))
+# Deadline of a single source in /search/all (seconds)
+SEARCH_SOURCE_TIMEOUT = float(os.getenv("SEARCH_SOURCE_TIMEOUT", 20))
+scraper_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="scraper")
+
+
+async def run_scraper(func, *args, timeout: float = None):
+    """
+    Runs a blocking scraper call on `scraper_executor`, keeping the event loop free.
+
+    With `timeout`, the requests and browser waits of the call are cut short once it has
+    passed, so the thread is freed even though `asyncio.wait_for` can't stop it. They are
+    also cut short when the awaiting task is cancelled.
+    """
+    cancelled = threading.Event()
+
+    def call():
+        with time_limit(timeout, cancelled):
+            return func(*args)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(scraper_executor, call)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+async def search_comics(title: str, source: str, timeout: float = None):
+    """
+    Searches a source, awaiting async plugins natively and running the others on `scraper_executor`.
+    """
+    if scraper.is_async(source):
+        return await scraper.asearch(title, source)
+    return await run_scraper(scraper.search, title, source, timeout=timeout)
+
+
+async def list_chapters(id: str, source: str):
+    """
+    Lists the chapters of a comic, awaiting async plugins natively and running the others on `scraper_executor`.
+    """
+    if scraper.is_async(source):
+        return await scraper.aget_chapters(id, source)
+    return await run_scraper(scraper.get_chapters, id, source)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):    
     redis_backend = RedisBackend(redis_url)
     FastAPICache.init(redis_backend, prefix="fastapi-cache", coder=JsonCoder())
     yield
+    await close_aiohttp_session()
+    await close_rate_limiter()
     try:
         redis_client.flushdb()
         print("Redis cache cleared on startup")
@@ -55,26 +113,15 @@ async def root():
     return {"message": "It Works!"}
 
 
-SOURCE_URLS = {
-    "0": "https://api.mangadex.org",
-    "1": "https://manhuaus.com",
-    "2": "https://yakshascans.com",
-    "3": "https://asuracomic.net",
-    "4": "https://kunmanga.com",
-    "5": "https://toonily.com",
-    "6": "https://toongod.org",  
-    "7": "https://mangahere.cc",
-    "8": "https://mangapill.com",
-    "9": "https://bato.si",
-    "10": "https://weebcentral.com",
-}
+# Website of every source, checked by /status
+SOURCE_URLS = {str(spec.id): spec.base_url for spec in SOURCES.values()}
 
 
 async def check_url(session, url):
     if not url:
         return "null"
     try:
-        async with session.get(url, timeout=5) as response:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
             return "ok" if response.status in (200,403) else "null" # 403 toongod cheat :p
     except Exception:
         return "null"
@@ -83,11 +130,11 @@ async def check_url(session, url):
 @app.get("/status")
 async def get_status():
     status = {}
-    async with aiohttp.ClientSession() as session:
-        tasks = [check_url(session, url) for url in SOURCE_URLS.values()]
-        results = await asyncio.gather(*tasks)
-        for i, res in enumerate(results):
-            status[str(i)] = res
+    session = get_aiohttp_session()
+    tasks = [check_url(session, url) for url in SOURCE_URLS.values()]
+    results = await asyncio.gather(*tasks)
+    for i, res in enumerate(results):
+        status[str(i)] = res
     return {"status": status}
 
 
@@ -96,7 +143,8 @@ async def start_download(
     ids: list = Query(..., description="List of IDs", alias="ids[]"),
     source: str = Query(..., description="Source number"),
     comic_title: str = Query("Chapters", description="Title of the comic"),
-    format: str = Query("pdf", description="Output format (pdf, cbz, cbr, epub)")
+    format: str = Query("pdf", description="Output format (pdf, cbz, cbr, epub)"),
+    quality: str = Query("data", description="Image quality (data, data-saver), data-saver is only used by sources supporting it")
 ):
     """
     Start downloading chapters in the background.
@@ -112,36 +160,79 @@ async def start_download(
         
         if format not in ["pdf", "cbz", "cbr", "epub"]:
             raise HTTPException(status_code=400, detail="Invalid format. Allowed: pdf, cbz, cbr, epub")
+
+        if quality not in ["data", "data-saver"]:
+            raise HTTPException(status_code=400, detail="Invalid quality. Allowed: data, data-saver")
         
         chapters_count = len(ids)
-        source_multipliers = {
-            "0": 1,  # MangaDex
-            "1": 1.4,  # Manhuaus
-            "2": 1.3,  # Yakshascans
-            "3": 1.3,  # Asurascan
-            "4": 1.2,  # Kunmanga
-            "5": 1.4,  # Toonily
-            "6": 1.4,  # Toongod
-            "7": 1.15,  # Mangahere
-            "8": 1.15,  # Mangapill
-            "9": 1,  # Bato
-            "10": 1.3,  # Weebcentral
-        }
-        soft_time = int(200 * chapters_count * source_multipliers[source])
-        hard_time = int(240 * chapters_count * source_multipliers[source])
+        try:
+            spec = get_source(source)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        multiplier = spec.multiplier
+        # Sources without compressed pages always download the originals, and share their cache entries
+        if quality == "data-saver" and "data-saver" not in spec.capabilities:
+            quality = "data"
+        # Identical requests are answered from the artifact cache without queueing a new job
+        cache_key = artifact_cache.job_key(ids, source, format, comic_title, quality)
+        cached = artifact_cache.lookup(cache_key)
+        if cached:
+            task_id = str(uuid.uuid4())
+            celery_app.backend.store_result(task_id, {
+                "task_id": task_id,
+                "status": "SUCCESS",
+                "zip_path": cached["zip_path"],
+                "file_size": cached["file_size"],
+                "total_chapters": chapters_count,
+                "comic_title": comic_title
+            }, states.SUCCESS)
+            return {
+                "task_id": task_id,
+                "status": "Task has been completed from cache",
+                "message": f"Started downloading {len(ids)} chapters"
+            }
 
-        task = download_chapters.apply_async(
-            args=[ids, source, comic_title, format],
-            soft_time_limit=soft_time,
-            time_limit=hard_time
-        )
+        soft_time = int(200 * chapters_count * multiplier)
+        hard_time = int(240 * chapters_count * multiplier)
+
+        # Identical requests that are still running share one task. The archive is then
+        # served to every requester through the artifact cache, so this needs it enabled.
+        task_id = str(uuid.uuid4())
+        if artifact_cache.ARTIFACT_CACHE_TTL > 0:
+            running = single_flight.claim(cache_key, task_id, hard_time)
+            if running:
+                if celery_app.AsyncResult(running).state not in (states.FAILURE, states.REVOKED):
+                    return {
+                        "task_id": running,
+                        "status": "Attached to a task already downloading these chapters",
+                        "message": f"Started downloading {len(ids)} chapters"
+                    }
+                single_flight.takeover(cache_key, task_id, hard_time)
+
+        if FANOUT_MIN_CHAPTERS and chapters_count >= FANOUT_MIN_CHAPTERS:
+            # Large jobs run as one subtask per chapter, spread over every worker
+            start_fanout(
+                ids, source, comic_title, format, task_id,
+                chapter_time_limits=(int(200 * multiplier), int(240 * multiplier)),
+                package_time_limits=(20 * chapters_count + 60, 30 * chapters_count + 120),
+                quality=quality
+            )
+        else:
+            download_chapters.apply_async(
+                args=[ids, source, comic_title, format, quality],
+                task_id=task_id,
+                soft_time_limit=soft_time,
+                time_limit=hard_time
+            )
         
         return {
-            "task_id": task.id,  # Use the actual Celery task ID
+            "task_id": task_id,
             "status": "Task has been added to the queue",
             "message": f"Started downloading {len(ids)} chapters"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error while starting task: {str(e)}")
 
@@ -255,6 +346,9 @@ async def download_file(task_id: str):
         if debug:
             print(f"DEBUG: File exists, size: {os.path.getsize(zip_path)} bytes")
             
+        if artifact_cache.is_cached(zip_path):
+            artifact_cache.acquire(zip_path)
+
         def iterfile(path):
             with open(path, mode="rb") as file_like:
                 while chunk := file_like.read(1024*1024):
@@ -286,34 +380,75 @@ async def search_endpoint(
     Search for a comic.
     """
     try:
-        comics = scraper.search(title, source)
+        comics = await search_comics(title, source)
         if comics:
             return comics
         return {"message": "No comics found"}
     except Exception as e:
         return {"message": str(e)}
 
+async def search_source(title: str, source_id: str):
+    """
+    Searches one source within SEARCH_SOURCE_TIMEOUT.
+
+    Returns:
+        tuple: (source_id, status, result) where status is "ok", "timeout" or "error"
+               and result is the list of comics or the error message.
+    """
+    try:
+        result = await asyncio.wait_for(search_comics(title, source_id, SEARCH_SOURCE_TIMEOUT), SEARCH_SOURCE_TIMEOUT)
+        return source_id, "ok", result
+    except asyncio.TimeoutError:
+        return source_id, "timeout", f"Timed out after {SEARCH_SOURCE_TIMEOUT:g}s"
+    except Exception as e:
+        return source_id, "error", str(e)
+
+
 @app.get("/search/all")
 async def search_all_sources(
     title: str = Query(..., description="Title of the comic")
 ):
     """
-    Search for a comic in all sources asynchronously.
+    Search for a comic in all sources in parallel.
+    Sources slower than SEARCH_SOURCE_TIMEOUT are reported as an error.
     Returns a dict: {source_id: [results], ...}
     """
-    async def search_one(source_id):
-        try:
-            # scraper.search może być sync lub async, obsłuż oba przypadki
-            result = scraper.search(title, source_id)
-            if asyncio.iscoroutine(result):
-                result = await result
-            return source_id, result
-        except Exception as e:
-            return source_id, {"error": str(e)}
-
-    tasks = [search_one(str(source_id)) for source_id in SOURCE_URLS.keys()]
+    tasks = [search_source(title, str(source_id)) for source_id in SOURCE_URLS.keys()]
     results = await asyncio.gather(*tasks)
-    return {src: res for src, res in results}
+    return {src: res if status == "ok" else {"error": res} for src, status, res in results}
+
+
+@app.get("/search/stream")
+async def search_stream(
+    title: str = Query(..., description="Title of the comic"),
+    format: str = Query("ndjson", description="Stream format (ndjson, sse)")
+):
+    """
+    Search for a comic in all sources, sending the results of every source as soon as it answers.
+    Every message is {"source": source_id, "status": "ok" | "timeout" | "error", "results": [...]}
+    or {..., "error": message}, one JSON object per line (ndjson) or per event (sse).
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Invalid format. Allowed: ndjson, sse")
+
+    async def messages():
+        tasks = [asyncio.create_task(search_source(title, str(source_id))) for source_id in SOURCE_URLS.keys()]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                source_id, status, result = await next_result
+                message = {"source": source_id, "status": status}
+                message["results" if status == "ok" else "error"] = result
+                data = json.dumps(jsonable_encoder(message))
+                yield f"data: {data}\n\n" if format == "sse" else f"{data}\n"
+            if format == "sse":
+                yield "event: end\ndata: {}\n\n"
+        finally:
+            # The client disconnected, the searches still running would hold scraper threads and browsers
+            for task in tasks:
+                task.cancel()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(messages(), media_type=media_type, headers={"Cache-Control": "no-cache"})
 
 @app.get("/chapters/")
 @cache(expire=60 * 60 * 12)
@@ -325,7 +460,7 @@ async def chapters_endpoint(
     Get chapters of a comic.
     """
     try:
-        chapters = scraper.get_chapters(id, source)
+        chapters = await list_chapters(id, source)
         return chapters
     except Exception as e:
         return {"error": str(e)}
@@ -333,14 +468,18 @@ async def chapters_endpoint(
 
 @app.get("/proxy-image")
 async def proxy_image_endpoint(
+    request: Request,
     url: str = Query(..., description="URL of the image to proxy"), 
-    hd: str = Query(..., description="Header of the image to proxy")
+    hd: str = Query(..., description="Header of the image to proxy"),
+    w: int = Query(None, gt=0, description="Resize the image to this width"),
+    q: int = Query(None, ge=1, le=100, description="Quality of the resized image")
     ):
     """
     Proxy image requests to handle MangaDex cover art.
+    With `w`, returns a cached thumbnail in the best format the browser accepts (AVIF, WebP or JPEG).
     """
     try:
-        return proxy_image(url,hd)
+        return await proxy_image(url, hd, request.headers, width=w, quality=q or THUMBNAIL_QUALITY)
     except Exception as e:
         return {"error": str(e)}
 
@@ -424,10 +563,18 @@ async def get_task_info(task_id: str):
 async def cancel_download(task_id: str):
     """
     Cancel a download task by task_id and remove any partially downloaded files.
+    Tasks shared with other requesters keep running until the last one cancels.
     """
     try:
         from Queue.celery_app import celery_app
+        if single_flight.detach(task_id) > 0:
+            return {"status": "cancelled", "task_id": task_id}
         celery_app.control.revoke(task_id, terminate=True)
+        # Chapter subtasks of a fan-out job
+        subtasks = [subtask_id.decode() for subtask_id in redis_client.lrange(f"job_subtasks:{task_id}", 0, -1)]
+        if subtasks:
+            celery_app.control.revoke(subtasks, terminate=True)
+            redis_client.delete(f"job_subtasks:{task_id}", f"job_done:{task_id}")
 
         tmpdir = redis_client.get(f"task_tmpdir:{task_id}")
         if tmpdir:
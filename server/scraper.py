@@ -1,101 +1,53 @@
-import requests as req
-import re
-import os
 from dotenv import load_dotenv
-from Manga.Bato import Bato
-from Manga.Asurascans import Asura
-from Manga.Manhuaus import Manhuaus
-from Manga.Yakshascans import Yaksha
-from Manga.Weebcentral import Weeb
-from Manga.MangaDex import MangaDex
-from Manga.Kunmanga import Kunmanga
-from Manga.Toonily import Toonily
-from Manga.Toongod import Toongod
-from Manga.Mangapill import Mangapill
-from Manga.Mangahere import Mangahere
+from Manga.registry import get_source, load_source
 
 load_dotenv()
 
-MANGAPI_URL = os.environ.get("MANGAPI_URL")
 
 def search(title, source):
-    try:
-        source = int(source)
-    except:
-        raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
-    
-    match source:
-        case 0: #MangaDex
-            return MangaDex.search(title)
+    """
+    Searches a source for comics, the plugin is imported on first use.
 
-        case 1: #Manhuaus
-            return Manhuaus.search(title)
+    Args:
+        title: Title of the comic
+        source: Source number
 
-        case 2: #Yakshascans
-            return Yaksha.search(title)
-        
-        case 3: #Asurascan
-            return Asura.search(title)
-        
-        case 4: #Kunmanga
-            return Kunmanga.search(title)
-        case 5: #Toonily
-            return Toonily.search(title)
-        case 6: #Toongod
-            return Toongod.search(title)
-        case 7: #Mangahere
-            return Mangahere.search(title)
+    Raises:
+        ValueError: If the source is invalid
+    """
+    return load_source(source, "search").search(title)
 
-        case 8: #Mangapill
-            return Mangapill.search(title)
-
-        case 9: #Bato
-            return Bato.search(title)
-                
-        case 10: # Weebcentral
-            return Weeb.search(title)
-        
-        case _:
-            raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
-    return
 
 def get_chapters(id: str, source: int):
-    try:
-        source = int(source)
-    except:
-        raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
-        
-    match source:
-        case 0: #MangaDex
-            return MangaDex.get_chapters(id)
+    """
+    Lists the chapters of a comic on a source.
+
+    Args:
+        id: Id of the comic on the source
+        source: Source number
+
+    Raises:
+        ValueError: If the source is invalid
+    """
+    return load_source(source, "chapters").get_chapters(id)
 
-        case 1: #Manhuaus
-            return Manhuaus.get_chapters(id)
 
-        case 2:  # Yakshascans
-            return Yaksha.get_chapters(id)
-            
-        case 3:  # Asurascan
-            return Asura.get_chapters(id)
+def is_async(source) -> bool:
+    """
+    Whether the plugin of a source can be awaited with `asearch` and `aget_chapters`.
+    """
+    return "async" in get_source(source).capabilities
 
-        case 4:  # Kunmanga
-            return Kunmanga.get_chapters(id)
-        case 5:  # Toonily
-            return Toonily.get_chapters(id)
-        case 6:  # Toongod
-            return Toongod.get_chapters(id)
-        case 7:  # Mangahere
-            return Mangahere.get_chapters(id)
 
-        case 8:  # Mangapill
-            return Mangapill.get_chapters(id)
+async def asearch(title, source):
+    """
+    Same as `search`, for sources where `is_async` is true.
+    """
+    return await load_source(source, "search").asearch(title)
 
-        case 9:  # Bato
-            return Bato.get_chapters(id)
-            
-        case 10:  # Weebcentral
-            return Weeb.get_chapters(id)
 
-        case _:
-            raise ValueError(f"Invalid source: {source}. Please choose a valid source.")
-        
\ No newline at end of file
+async def aget_chapters(id: str, source: int):
+    """
+    Same as `get_chapters`, for sources where `is_async` is true.
+    """
+    return await load_source(source, "chapters").aget_chapters(id)
@@ -0,0 +1,36 @@
+import http.server
+import os
+import sys
+import threading
+import pytest
+
+# Modules are imported as in the containers, from the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    """
+    Starts local HTTP servers answering GET and POST requests with `respond(handler)`, returns their URL.
+    """
+    servers = []
+
+    def start(respond) -> str:
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                respond(self)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
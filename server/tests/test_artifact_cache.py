@@ -0,0 +1,82 @@
+import os
+import fakeredis
+import pytest
+from Utils import artifact_cache
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "redis_client", fakeredis.FakeRedis())
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_TTL", 3600)
+    return tmp_path
+
+
+def make_zip(path, size=10):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"z" * size)
+    return str(path)
+
+
+def test_job_key_normalizes_the_request():
+    key = artifact_cache.job_key(["a_1", "b_2"], 1, "PDF", "Title")
+    assert key == artifact_cache.job_key([" a_1", "b_2 "], "1", "pdf", "Other title")
+    # Only CBZ and ePUB embed the title
+    assert artifact_cache.job_key(["a_1"], 1, "cbz", "Title") != artifact_cache.job_key(["a_1"], 1, "cbz", "Other")
+    assert artifact_cache.job_key(["a_1", "b_2"], 1, "pdf") != artifact_cache.job_key(["b_2", "a_1"], 1, "pdf")
+    assert artifact_cache.job_key(["a_1"], 1, "pdf", quality="data") == artifact_cache.job_key(["a_1"], 1, "pdf")
+    assert artifact_cache.job_key(["a_1"], 1, "pdf", quality="data-saver") != artifact_cache.job_key(["a_1"], 1, "pdf")
+
+
+def test_stored_archives_are_served_again(cache):
+    key = artifact_cache.job_key(["a_1"], 1, "pdf")
+    assert artifact_cache.lookup(key) is None
+
+    zip_path = artifact_cache.store(key, make_zip(cache / "job" / "Chapters.zip"))
+    assert artifact_cache.is_cached(zip_path)
+    assert artifact_cache.lookup(key) == {"zip_path": zip_path, "file_size": 10}
+
+    os.remove(zip_path)
+    assert artifact_cache.lookup(key) is None
+
+
+def test_redis_errors_are_cache_misses(cache, monkeypatch):
+    key = artifact_cache.job_key(["a_1"], 1, "pdf")
+    os.remove(artifact_cache.store(key, make_zip(cache / "job" / "Chapters.zip")))
+
+    def delete(*keys):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(artifact_cache.redis_client, "delete", delete)
+    assert artifact_cache.lookup(key) is None
+
+
+def test_disabled_cache_keeps_the_archive_in_place(cache, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_TTL", 0)
+    zip_path = make_zip(cache / "job" / "Chapters.zip")
+    assert artifact_cache.store("key", zip_path) == zip_path
+    assert not artifact_cache.is_cached(zip_path)
+
+
+def test_eviction_skips_archives_being_streamed(cache, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_MAX_BYTES", 15)
+    old = artifact_cache.store("old", make_zip(cache / "job1" / "Chapters.zip"))
+    os.utime(os.path.dirname(old), (1000, 1000))
+    artifact_cache.acquire(old)
+
+    new = artifact_cache.store("new", make_zip(cache / "job2" / "Chapters.zip"))
+    assert os.path.exists(old) and os.path.exists(new)
+
+    assert artifact_cache.release(old) == 0
+    artifact_cache.evict()
+    assert not os.path.exists(old)
+    assert artifact_cache.lookup("old") is None
+    assert os.path.exists(new)
+
+
+def test_references_are_counted(cache):
+    path = str(cache / "job" / "Chapters.zip")
+    artifact_cache.acquire(path, 2)
+    artifact_cache.acquire(path)
+    assert [artifact_cache.release(path) for _ in range(4)] == [2, 1, 0, 0]
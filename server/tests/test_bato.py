@@ -0,0 +1,72 @@
+import pytest
+from Manga import Bato as bato_module
+from Manga.Bato import Bato
+
+PAGE_SIZE = 30
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def chapter_api(monkeypatch):
+    """
+    Answers Chapters queries like Bato: every aliased page lists the next chapters from its start order.
+    """
+    orders = [order for order in range(1, 250) if order % 7]  # gaps in the order, like deleted chapters
+    queries = []
+
+    def http_post(url, json):
+        queries.append(json)
+        variables = json["variables"]
+        assert variables["comicId"] == "comic"
+        pages = {}
+        for i in range(len(json["query"].split("get_comic_chapterList")) - 1):
+            start = variables[f"s{i}"]
+            page = [order for order in orders if order >= start][:PAGE_SIZE]
+            pages[f"p{i}"] = [
+                {"data": {"id": 1000 + order, "volume": None, "serial": order, "order": order}} for order in page
+            ]
+        return FakeResponse({"data": pages})
+
+    monkeypatch.setattr(bato_module, "http_post", http_post)
+    return orders, queries
+
+
+def test_chapter_list_pages_are_batched_in_one_query(chapter_api):
+    orders, queries = chapter_api
+    chapters = Bato.get_chapters("comic")
+
+    listed = sorted(int(num) for volume in chapters.values() for num in volume.chapters)
+    assert listed == orders
+    # One query learns the page size, the next ones fetch `BATO_LIST_PAGES` pages each
+    assert len(queries) <= 3
+    assert chapters["Vol 1"].chapters["8"].id == "1008"
+
+
+def test_chapters_request_aliases_every_page():
+    request = Bato._chapters_request("comic", [1, 31, 61])
+    assert request["variables"] == {"comicId": "comic", "s0": 1, "s1": 31, "s2": 61, "operationName": "Chapters"}
+    for i in range(3):
+        assert f"p{i}: get_comic_chapterList(comicId: $comicId, start: $s{i})" in request["query"]
+
+
+def test_images_of_a_batch_are_mapped_back_to_their_chapters():
+    chap_ids = ["10", "11", "12"]
+    request = Bato._images_request(chap_ids)
+    assert request["variables"] == {"c0": "10", "c1": "11", "c2": "12", "operationName": "Images"}
+
+    data = {"data": {
+        "c0": {"data": {"imageFile": {"urlList": ["a1", "a2"]}}},
+        "c1": None,
+        "c2": {"data": {"imageFile": {"urlList": ["c1"]}}},
+    }}
+    assert Bato._image_lists(data, chap_ids) == {"10": ["a1", "a2"], "12": ["c1"]}
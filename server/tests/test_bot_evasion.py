@@ -0,0 +1,72 @@
+import fakeredis
+import pytest
+from Utils import bot_evasion, http_session
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(bot_evasion, "redis_client", client)
+    monkeypatch.setattr(http_session, "retry_delay", lambda attempt, headers=None: 0)
+    return client
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    loads = []
+
+    def get_with_captcha(url, elem, click=False):
+        loads.append(url)
+        return {}
+
+    monkeypatch.setattr(bot_evasion, "get_with_captcha", get_with_captcha)
+    return loads
+
+
+def respond_with(status, body, headers=None):
+    def respond(handler):
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body.encode())
+    return respond
+
+
+def test_overloaded_origin_keeps_the_cookies(redis_client, browser, serve):
+    url = serve(respond_with(503, "<html>Service Unavailable</html>"))
+    bot_evasion.save_cf_cookies(url, {"cf_clearance": "valid"}, "Agent")
+    with pytest.raises(Exception):
+        bot_evasion.fetch_page(url, "ul")
+    assert bot_evasion.load_cf_cookies(url) == {"cf_clearance": "valid"}
+    assert browser == []
+
+
+@pytest.mark.parametrize("status, headers, body", [
+    (403, {"cf-mitigated": "challenge"}, "<html></html>"),
+    (503, {}, "<html><title>Just a moment...</title></html>"),
+])
+def test_challenge_drops_the_cookies(redis_client, browser, serve, status, headers, body):
+    url = serve(respond_with(status, body, headers))
+    bot_evasion.save_cf_cookies(url, {"cf_clearance": "expired"}, "Agent")
+    bot_evasion.fetch_page(url, "ul")
+    assert not bot_evasion.load_cf_cookies(url)
+    assert browser == [url]
+
+
+def test_chapter_list_is_fetched_from_the_ajax_endpoint(redis_client, browser, serve):
+    def respond(handler):
+        if handler.command == "POST" and handler.path == "/manga/comic/ajax/chapters/":
+            respond_with(200, '<ul class="main version-chap"><li>Chapter 1</li></ul>')(handler)
+        else:
+            # The chapter list of the manga page is only filled in by JavaScript
+            respond_with(200, '<div id="manga-chapters-holder"></div>')(handler)
+
+    url = serve(respond)
+    bot_evasion.save_cf_cookies(url, {"cf_clearance": "valid"}, "Agent")
+    soup = bot_evasion.fetch_chapter_list(f"{url}manga/comic/", 'ul[class="main version-chap"]')
+    assert soup.find("li").text == "Chapter 1"
+    assert browser == []
+
+    bot_evasion.fetch_page(f"{url}manga/comic/", 'ul[class="main version-chap"]')
+    assert browser == [f"{url}manga/comic/"]
@@ -0,0 +1,93 @@
+import os
+import pytest
+from Formats.image_probe import read_manifest, write_manifest
+from Utils import chapter_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(chapter_cache, "CHAPTER_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(chapter_cache, "CHAPTER_CACHE_MAX_BYTES", 1024 ** 2)
+    return tmp_path / "cache"
+
+
+def make_chapter(path, pages, corrupt=False):
+    """
+    Writes a downloaded chapter the way the image downloader does, `pages` are the page bodies.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = []
+    for i, body in enumerate(pages):
+        with open(os.path.join(path, f"{i}.jpg"), "wb") as f:
+            f.write(body)
+        manifest.append({"file": f"{i}.jpg", "format": "jpeg", "width": 800, "height": 1200})
+    if corrupt:
+        manifest[-1]["corrupt"] = True
+    write_manifest(str(path), manifest)
+    return str(path)
+
+
+def test_stored_chapter_is_linked_into_new_jobs(tmp_path):
+    ch_path = make_chapter(tmp_path / "job1" / "1", [b"page one", b"page two"])
+    chapter_cache.store_chapter("Source", "chap", ch_path)
+
+    loaded = chapter_cache.load_chapter("Source", "chap", "1", str(tmp_path / "job2"))
+    assert loaded == os.path.join(str(tmp_path / "job2"), "1")
+    assert [page["file"] for page in read_manifest(loaded)] == ["0.jpg", "1.jpg"]
+    with open(os.path.join(loaded, "1.jpg"), "rb") as f:
+        assert f.read() == b"page two"
+    # Pages are hardlinked, not copied
+    assert os.stat(os.path.join(loaded, "0.jpg")).st_ino == os.stat(os.path.join(ch_path, "0.jpg")).st_ino
+
+
+def test_cache_is_keyed_by_source_and_chapter(tmp_path):
+    chapter_cache.store_chapter("Source", "chap", make_chapter(tmp_path / "job1" / "1", [b"page"]))
+    assert chapter_cache.load_chapter("Other", "chap", "1", str(tmp_path / "job2")) is None
+    assert chapter_cache.load_chapter("Source", "other", "1", str(tmp_path / "job2")) is None
+
+
+def test_chapters_with_corrupt_pages_are_not_cached(tmp_path):
+    ch_path = make_chapter(tmp_path / "job1" / "1", [b"page", b"failed"], corrupt=True)
+    chapter_cache.store_chapter("Source", "chap", ch_path)
+    assert chapter_cache.load_chapter("Source", "chap", "1", str(tmp_path / "job2")) is None
+
+
+def test_identical_pages_are_stored_once(tmp_path, cache_dir):
+    chapter_cache.store_chapter("Source", "a", make_chapter(tmp_path / "job1" / "1", [b"credits", b"page a"]))
+    chapter_cache.store_chapter("Source", "b", make_chapter(tmp_path / "job1" / "2", [b"credits", b"page b"]))
+    blobs = [name for _, _, names in os.walk(cache_dir / "blobs") for name in names]
+    assert len(blobs) == 3
+
+
+def test_missing_pages_are_downloaded_again(tmp_path, cache_dir):
+    chapter_cache.store_chapter("Source", "chap", make_chapter(tmp_path / "job1" / "1", [b"page"]))
+    for root, _, names in os.walk(cache_dir / "blobs"):
+        for name in names:
+            os.remove(os.path.join(root, name))
+
+    assert chapter_cache.load_chapter("Source", "chap", "1", str(tmp_path / "job2")) is None
+    assert not os.path.exists(tmp_path / "job2" / "1")
+
+
+def test_eviction_drops_the_least_recently_used_chapters(tmp_path, monkeypatch):
+    monkeypatch.setattr(chapter_cache, "CHAPTER_CACHE_MAX_BYTES", 1500)
+    for i, chap_id in enumerate(["old", "used", "new"]):
+        ch_path = make_chapter(tmp_path / "job1" / chap_id, [bytes([i]) * 600])
+        chapter_cache.store_chapter("Source", chap_id, ch_path)
+        index = chapter_cache._index_path("Source", chap_id)
+        os.utime(index, (1000 + i, 1000 + i))
+    # A hit moves the chapter to the end of the LRU order
+    assert chapter_cache.load_chapter("Source", "old", "old", str(tmp_path / "job2"))
+
+    chapter_cache.evict(force=True)
+    job = str(tmp_path / "job3")
+    assert chapter_cache.load_chapter("Source", "used", "used", job) is None
+    assert chapter_cache.load_chapter("Source", "old", "old", job)
+    assert chapter_cache.load_chapter("Source", "new", "new", job)
+
+
+def test_disabled_cache_stores_nothing(tmp_path, monkeypatch, cache_dir):
+    monkeypatch.setattr(chapter_cache, "CHAPTER_CACHE_MAX_BYTES", 0)
+    chapter_cache.store_chapter("Source", "chap", make_chapter(tmp_path / "job1" / "1", [b"page"]))
+    assert not cache_dir.exists()
+    assert chapter_cache.load_chapter("Source", "chap", "1", str(tmp_path / "job2")) is None
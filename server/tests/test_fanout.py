@@ -0,0 +1,52 @@
+import os
+import celery.exceptions
+import fakeredis
+import pytest
+from celery.contrib.testing.worker import start_worker
+from Queue import tasks
+from Queue.celery_app import celery_app
+from Utils import artifact_cache, single_flight
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(tasks, "redis_client", client)
+    monkeypatch.setattr(single_flight, "redis_client", client)
+    monkeypatch.setattr(single_flight, "_CLAIM_SCRIPT", client.register_script(single_flight._CLAIM_SCRIPT.script))
+    monkeypatch.setattr(single_flight, "_RELEASE_SCRIPT", client.register_script(single_flight._RELEASE_SCRIPT.script))
+    monkeypatch.setattr(artifact_cache, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setitem(celery_app.conf, "broker_url", "memory://")
+    monkeypatch.setitem(celery_app.conf, "result_backend", "cache+memory://")
+    with start_worker(celery_app, perform_ping_check=False, queues=["downloads"]):
+        yield
+
+
+def test_failed_subtask_cleans_up_the_job(redis_client, worker, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    def download_chapters(source, ids, quality="data"):
+        if ids == ["broken"]:
+            # Fails outside of the retry, like a subtask killed by its time limit
+            return str(tmp_path / "missing")
+        os.makedirs(tmp_path / ids[0] / "Chapter")
+        return str(tmp_path / ids[0])
+
+    monkeypatch.setattr(tasks.ArchiveGen, "download_chapters", download_chapters)
+    ids = ["ok", "broken"]
+    cache_key = artifact_cache.job_key(ids, "1", "pdf", "Comic")
+    assert single_flight.claim(cache_key, "job", 600) is None
+
+    tasks.start_fanout(ids, "1", "Comic", "pdf", "job", (60, 70), (60, 70))
+    with pytest.raises(Exception) as e:
+        celery_app.AsyncResult("job").get(timeout=10)
+    assert not isinstance(e.value, celery.exceptions.TimeoutError)
+
+    assert os.listdir(tmp_path / "Downloads") == []
+    assert not redis_client.exists("task_tmpdir:job", "job_done:job", "job_subtasks:job")
+    assert single_flight.claim(cache_key, "next", 600) is None
@@ -0,0 +1,55 @@
+import io
+import pytest
+from PIL import Image
+from Formats.image_probe import is_valid_size, probe_file, probe_image, read_manifest, write_manifest
+
+
+def encode(fmt, size=(320, 480), mode="RGB", color="white", **params):
+    out = io.BytesIO()
+    Image.new(mode, size, color).save(out, format=fmt, **params)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fmt, params", [
+    ("JPEG", {}),
+    ("JPEG", {"progressive": True}),
+    ("PNG", {}),
+    ("GIF", {}),
+    ("WEBP", {}),
+    ("WEBP", {"lossless": True}),
+])
+def test_dimensions_are_read_from_the_header(fmt, params):
+    assert probe_image(encode(fmt, **params)[:1024]) == (fmt.lower(), 320, 480)
+
+
+def test_transparent_webp_is_read_from_the_extended_header():
+    data = encode("WEBP", mode="RGBA", color=(255, 255, 255, 0))
+    assert data[12:16] == b"VP8X"
+    assert probe_image(data) == ("webp", 320, 480)
+
+
+def test_error_pages_are_not_images():
+    assert probe_image(b"<html><title>Just a moment...</title></html>") is None
+    assert probe_image(b"") is None
+
+
+def test_truncated_jpeg_header_is_not_an_image():
+    assert probe_image(encode("JPEG")[:12]) is None
+
+
+def test_probe_file_reads_the_header_only(tmp_path):
+    path = tmp_path / "page.png"
+    path.write_bytes(encode("PNG", size=(800, 12000)))
+    assert probe_file(str(path)) == ("png", 800, 12000)
+
+
+def test_spacers_are_too_small():
+    assert is_valid_size(800, 1200)
+    assert not is_valid_size(800, 10)
+
+
+def test_manifest_round_trip(tmp_path):
+    pages = [{"file": "0.jpg", "format": "jpeg", "width": 800, "height": 1200}]
+    assert read_manifest(str(tmp_path)) is None
+    write_manifest(str(tmp_path), pages)
+    assert read_manifest(str(tmp_path)) == pages
@@ -0,0 +1,18 @@
+import os
+import billiard
+from Formats import pdf
+
+
+def convert_in_worker(results):
+    results.put((os.getpid(), pdf.pdf_executor().submit(os.getpid).result(60)))
+
+
+def test_daemonic_processes_convert_on_a_process_pool(monkeypatch):
+    monkeypatch.setattr(pdf, "PDF_WORKERS", 2)
+    # Celery prefork children are daemonic
+    results = billiard.Queue()
+    worker = billiard.Process(target=convert_in_worker, args=(results,), daemon=True)
+    worker.start()
+    worker_pid, converter_pid = results.get(timeout=60)
+    worker.join()
+    assert converter_pid not in (worker_pid, os.getpid())
@@ -0,0 +1,58 @@
+import threading
+import time
+import pytest
+from Formats.pipeline import ChapterPipeline
+
+
+def test_chapters_are_converted_in_submission_order():
+    def convert(ch_path, index):
+        # Later chapters finish faster, the order must still hold
+        time.sleep(0.01 * (5 - index))
+        return f"{index}:{ch_path}"
+
+    pipeline = ChapterPipeline(convert)
+    for ch_path in ["c1", "c2", "c3", "c4", "c5"]:
+        pipeline.submit(ch_path)
+    assert pipeline.close() == ["0:c1", "1:c2", "2:c3", "3:c4", "4:c5"]
+
+
+def test_conversion_overlaps_with_the_next_download():
+    converting = threading.Event()
+    release = threading.Event()
+
+    def convert(ch_path, index):
+        converting.set()
+        release.wait(1)
+        return ch_path
+
+    pipeline = ChapterPipeline(convert)
+    pipeline.submit("c1")
+    # The caller is free to download the next chapter while the first one converts
+    assert converting.wait(1)
+    pipeline.submit("c2")
+    release.set()
+    assert pipeline.close() == ["c1", "c2"]
+
+
+def test_none_results_are_skipped():
+    pipeline = ChapterPipeline(lambda ch_path, index: None if ch_path == "empty" else ch_path)
+    for ch_path in ["c1", "empty", "c2"]:
+        pipeline.submit(ch_path)
+    assert pipeline.close() == ["c1", "c2"]
+
+
+def test_first_error_stops_the_stage_and_is_raised_by_close():
+    converted = []
+
+    def convert(ch_path, index):
+        if ch_path == "bad":
+            raise ValueError("broken chapter")
+        converted.append(ch_path)
+        return ch_path
+
+    pipeline = ChapterPipeline(convert)
+    for ch_path in ["c1", "bad", "c2"]:
+        pipeline.submit(ch_path)
+    with pytest.raises(ValueError, match="broken chapter"):
+        pipeline.close()
+    assert converted == ["c1"]
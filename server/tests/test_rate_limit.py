@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from Utils import http_session, rate_limit
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(rate_limit, "redis_client", client)
+    monkeypatch.setattr(rate_limit, "_bucket", client.register_script(rate_limit._BUCKET_SCRIPT))
+    monkeypatch.setattr(rate_limit, "_acquire", client.register_script(rate_limit._ACQUIRE_SCRIPT))
+    monkeypatch.setattr(rate_limit, "_async_client", fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(rate_limit, "_redis_down_until", 0.0)
+    monkeypatch.setattr(rate_limit, "_key_limits", {})
+    rate_limit.host_limits.cache_clear()
+    yield client
+    rate_limit.host_limits.cache_clear()
+
+
+def test_bucket_allows_a_burst_then_spaces_requests(redis_client):
+    waits = [rate_limit._bucket(keys=["rate_tokens:test"], args=[10, 10]) for _ in range(12)]
+    assert waits[:10] == [0] * 10
+    assert 90 <= waits[10] <= 110
+    assert 190 <= waits[11] <= 210
+
+
+def test_throttle_keeps_to_the_rate(redis_client):
+    rate_limit.register_limits("rate.test", rate=20)
+    start = time.monotonic()
+    for _ in range(30):
+        with rate_limit.throttle("https://rate.test/page"):
+            pass
+    # 20 requests of burst, the other 10 at 20 per second
+    assert time.monotonic() - start >= 0.45
+
+
+def test_slots_limit_simultaneous_requests(redis_client):
+    rate_limit.register_limits("slots.test", inflight=2)
+    url = "https://slots.test/page"
+    releases = [rate_limit.acquire(url), rate_limit.acquire(url)]
+    assert redis_client.zcard("rate_slots:slots.test") == 2
+
+    acquired = threading.Event()
+
+    def third():
+        rate_limit.acquire(url)
+        acquired.set()
+
+    threading.Thread(target=third, daemon=True).start()
+    assert not acquired.wait(0.3)
+    releases[0]()
+    assert acquired.wait(1)
+    releases[0]()  # releasing twice frees a single slot
+    assert redis_client.zcard("rate_slots:slots.test") == 2
+
+
+def test_requests_go_ahead_after_the_longest_wait(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_MAX_WAIT", 0.2)
+    rate_limit.register_limits("busy.test", inflight=1)
+    rate_limit.acquire("https://busy.test/")
+    start = time.monotonic()
+    release = rate_limit.acquire("https://busy.test/")
+    assert time.monotonic() - start < 1
+    release()
+    assert redis_client.zcard("rate_slots:busy.test") == 1
+
+
+def test_slots_of_crashed_requests_are_reclaimed(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "INFLIGHT_TTL", 1)
+    rate_limit.register_limits("crash.test", inflight=1)
+    rate_limit.acquire("https://crash.test/")
+    time.sleep(1.1)
+    start = time.monotonic()
+    rate_limit.acquire("https://crash.test/")
+    assert time.monotonic() - start < 0.5
+
+
+def test_limit_keys_are_separate_from_their_host(redis_client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {})
+    rate_limit.register_limits("example.org/slow", rate=1)
+    assert rate_limit.host_limits("example.org/slow") == (1, None)
+    assert rate_limit.host_limits("example.org") == (None, None)
+    with rate_limit.throttle("https://example.org/slow/1", key="example.org/slow"):
+        pass
+    assert redis_client.exists("rate_tokens:example.org/slow")
+    assert not redis_client.exists("rate_tokens:example.org")
+
+
+def test_requests_are_not_limited_while_redis_is_down(redis_client, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RedisConnectionError("down")
+
+    monkeypatch.setattr(rate_limit, "_bucket", unavailable)
+    rate_limit.register_limits("down.test", rate=0.01)
+    start = time.monotonic()
+    for _ in range(3):
+        with rate_limit.throttle("https://down.test/"):
+            pass
+    assert time.monotonic() - start < 0.5
+    assert not rate_limit._redis_available()
+
+
+def test_streamed_responses_hold_their_slot_until_read(redis_client, serve):
+    def respond(handler):
+        handler.send_response(200)
+        handler.send_header("Content-Length", "100000")
+        handler.end_headers()
+        handler.wfile.write(b"x" * 100000)
+
+    url = serve(respond)
+    rate_limit.register_limits("127.0.0.1", inflight=4)
+    slots = lambda: redis_client.zcard("rate_slots:127.0.0.1")
+
+    http_session.http_get(url)
+    assert slots() == 0
+    with http_session.http_get(url, stream=True):
+        assert slots() == 1
+    assert slots() == 0
+
+    response = http_session.http_get(url, stream=True)
+    assert slots() == 1
+    for _ in response.iter_content(8192):
+        pass
+    assert slots() == 0
+
+
+def test_async_throttle_shares_the_slots(redis_client):
+    rate_limit.register_limits("async.test", inflight=1)
+
+    async def main():
+        async with rate_limit.athrottle("https://async.test/"):
+            assert redis_client.zcard("rate_slots:async.test") == 1
+        assert redis_client.zcard("rate_slots:async.test") == 0
+
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import time
+from email.utils import formatdate
+import pytest
+from Utils import http_session, retry
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_session, "retry_delay", lambda attempt, headers=None: 0)
+    retry.max_retries.cache_clear()
+    yield
+    retry.max_retries.cache_clear()
+
+
+def test_backoff_is_jittered_below_the_exponential_bound():
+    for attempt in range(8):
+        bound = min(retry.RETRY_MAX_DELAY, retry.RETRY_BACKOFF * 2 ** attempt)
+        delays = [retry.retry_delay(attempt) for _ in range(50)]
+        assert all(0 <= delay <= bound for delay in delays)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    (lambda: {"Retry-After": "5"}, 5),
+    (lambda: {"Retry-After": formatdate(time.time() + 10, usegmt=True)}, 10),
+    (lambda: {"X-RateLimit-Retry-After": str(int(time.time()) + 7)}, 7),
+])
+def test_retry_after_is_honoured(headers, expected):
+    delay = retry.retry_delay(0, headers())
+    assert expected - 1.5 <= delay <= expected + 1
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_MAX_DELAY", 3)
+    assert retry.retry_delay(0, {"Retry-After": "3600"}) == 3
+
+
+def test_retryable_statuses():
+    assert retry.is_retryable(503)
+    assert retry.is_retryable(429)
+    assert not retry.is_retryable(404)
+    assert not retry.is_retryable(200)
+    # Cloudflare challenges need a browser, not another request
+    assert not retry.is_retryable(503, {"cf-mitigated": "challenge"})
+
+
+def test_retries_stop_at_the_limit_of_the_host(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_ATTEMPTS", 2)
+    url = "https://example.com/page"
+    assert [retry.should_retry(url, attempt) for attempt in range(4)] == [True, True, False, False]
+
+
+def test_job_budget_limits_the_retries_of_a_job(monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_BUDGET_PER_CHAPTER", 2)
+    url = "https://example.com/page"
+    with retry.job_budget(1):
+        assert [retry.should_retry(url, 0) for _ in range(3)] == [True, True, False]
+    assert retry.should_retry(url, 0)
+
+
+def test_transient_statuses_are_retried(serve):
+    statuses = [503, 502, 200]
+    requests = []
+
+    def respond(handler):
+        requests.append(handler.path)
+        handler.send_response(statuses[len(requests) - 1])
+        handler.end_headers()
+
+    response = http_session.http_get(serve(respond))
+    assert response.status_code == 200
+    assert len(requests) == 3
+
+
+def test_last_response_is_returned_once_retries_run_out(serve, monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_ATTEMPTS", 2)
+    requests = []
+
+    def respond(handler):
+        requests.append(handler.path)
+        handler.send_response(500)
+        handler.end_headers()
+
+    response = http_session.http_get(serve(respond))
+    assert response.status_code == 500
+    assert len(requests) == 3
+
+
+def test_client_errors_are_not_retried(serve):
+    requests = []
+
+    def respond(handler):
+        requests.append(handler.path)
+        handler.send_response(404)
+        handler.end_headers()
+
+    assert http_session.http_get(serve(respond)).status_code == 404
+    assert len(requests) == 1
@@ -0,0 +1,39 @@
+import asyncio
+import json
+import threading
+import time
+import main
+from Utils.deadline import DeadlineExceeded, cap
+
+
+def test_disconnect_cancels_the_pending_searches(monkeypatch):
+    started = threading.Event()
+    finished = threading.Event()
+
+    def search(title, source):
+        if source == "0":
+            started.wait(1)
+            return []
+        started.set()
+        try:
+            # Blocks like a scraper waiting for a slow page
+            while True:
+                time.sleep(cap(0.05))
+        except DeadlineExceeded:
+            finished.set()
+            raise
+
+    monkeypatch.setattr(main, "SOURCE_URLS", {"0": "", "1": ""})
+    monkeypatch.setattr(main, "SEARCH_SOURCE_TIMEOUT", 30)
+    monkeypatch.setattr(main.scraper, "is_async", lambda source: False)
+    monkeypatch.setattr(main.scraper, "search", search)
+
+    async def disconnect_after_first_result():
+        response = await main.search_stream(title="comic", format="ndjson")
+        messages = response.body_iterator
+        first = json.loads(await messages.__anext__())
+        await messages.aclose()
+        return first
+
+    assert asyncio.run(disconnect_after_first_result()) == {"source": "0", "status": "ok", "results": []}
+    assert finished.wait(1)
@@ -0,0 +1,83 @@
+import threading
+import fakeredis
+import pytest
+from Utils import artifact_cache, single_flight
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(single_flight, "redis_client", client)
+    monkeypatch.setattr(single_flight, "_CLAIM_SCRIPT", client.register_script(single_flight._CLAIM_SCRIPT.script))
+    monkeypatch.setattr(single_flight, "_RELEASE_SCRIPT", client.register_script(single_flight._RELEASE_SCRIPT.script))
+    monkeypatch.setattr(artifact_cache, "redis_client", client)
+    return client
+
+
+def test_identical_requests_attach_to_the_first_task(redis_client):
+    assert single_flight.claim("job", "first", 60) is None
+    assert single_flight.claim("job", "second", 60) == "first"
+    assert single_flight.claim("job", "third", 60) == "first"
+    assert single_flight.requesters("first") == 3
+    assert redis_client.ttl(single_flight._waiters_key("first")) > 0
+
+
+def test_released_requests_start_a_new_task(redis_client):
+    single_flight.claim("job", "first", 60)
+    single_flight.release("job", "first")
+    assert single_flight.claim("job", "second", 60) is None
+    assert single_flight.requesters("second") == 1
+
+
+def test_release_keeps_the_claim_of_another_task(redis_client):
+    single_flight.claim("job", "first", 60)
+    single_flight.takeover("job", "second", 60)
+    single_flight.release("job", "first")
+    assert single_flight.claim("job", "third", 60) == "second"
+
+
+def test_concurrent_claims_start_one_task(redis_client):
+    results = []
+    barrier = threading.Barrier(16)
+
+    def claim(task_id):
+        barrier.wait()
+        results.append((task_id, single_flight.claim("job", task_id, 60)))
+
+    threads = [threading.Thread(target=claim, args=(f"task{i}",)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    owners = [task_id for task_id, running in results if running is None]
+    assert len(owners) == 1
+    assert all(running == owners[0] for task_id, running in results if running is not None)
+    assert single_flight.requesters(owners[0]) == 16
+
+
+def test_detach_counts_the_remaining_requesters(redis_client):
+    single_flight.claim("job", "first", 60)
+    single_flight.claim("job", "second", 60)
+    assert single_flight.detach("first") == 1
+    assert single_flight.detach("first") == 0
+    assert single_flight.requesters("first") == 1
+
+
+def test_uncached_archive_is_kept_until_every_requester_downloaded_it(redis_client, tmp_path):
+    from Queue.tasks import cleanup_task
+
+    job_dir = tmp_path / "job"
+    job_dir.mkdir()
+    zip_path = job_dir / "Chapters.zip"
+    zip_path.write_bytes(b"zip")
+
+    single_flight.claim("job", "first", 60)
+    single_flight.claim("job", "second", 60)
+    artifact_cache.acquire(str(zip_path), single_flight.requesters("first"))
+
+    assert cleanup_task(str(zip_path))["status"] == "SUCCESS"
+    assert zip_path.exists()
+    cleanup_task(str(zip_path))
+    assert not zip_path.exists()
+    assert not job_dir.exists()